@@ -0,0 +1 @@
+"""Performance benchmarks of the translator and the simulator, run as `python -m benchmarks.<name>`."""
@@ -0,0 +1,111 @@
+"""Synthetic programs for translator benchmarks.
+
+    python -m benchmarks.generator --statements 10 --depth 3 --strings 20 --variables 4 > small.aul
+"""
+import argparse
+import random
+import string
+
+from csa_lab3.translator import compile_source
+
+
+def variable_name(index: int) -> str:
+    # identifiers of the language consist of letters and underscores only
+    name = ""
+    while True:
+        index, letter = divmod(index, len(string.ascii_lowercase))
+        name += string.ascii_lowercase[letter]
+        if index == 0:
+            return f"var_{name}"
+
+
+def generate_program(statements: int, depth: int = 2, string_length: int = 10, variables: int = 8,
+                     seed: int = 0) -> str:
+    """Program of about `statements` statements with if/while blocks nested up to `depth` levels.
+
+    The program is only meant to be translated, loops are not guaranteed to terminate. A program of more than
+    a few statements does not fit in the address space of the machine, see `generate_programs`.
+    """
+    rng = random.Random(seed)
+    names = [variable_name(i) for i in range(variables)]
+    lines = ["{"]
+
+    # every variable gets a type before it is used
+    for name in names:
+        lines.append(f"  {name} = {rng.randrange(1000)};")
+
+    def text() -> str:
+        return "".join(rng.choice(string.ascii_letters + " ") for _ in range(string_length))
+
+    def simple_statement(indent: str) -> str:
+        match rng.randrange(4):
+            case 0:
+                return f"{indent}{rng.choice(names)} = {rng.randrange(100000)};"
+            case 1:
+                op = rng.choice("+-*/")
+                return f"{indent}{rng.choice(names)} = {rng.choice(names)} {op} {rng.choice(names)};"
+            case 2:
+                return f'{indent}print "{text()}";'
+            case _:
+                return f"{indent}print {rng.choice(names)};"
+
+    emitted = 0
+    open_blocks = 0
+    while emitted < statements:
+        indent = "  " * (open_blocks + 1)
+        choice = rng.random()
+        if open_blocks < depth and choice < 0.1:
+            keyword = rng.choice(("if", "while"))
+            op = rng.choice(("==", "!=", ">="))
+            lines.append(f"{indent}{keyword} ({rng.choice(names)} {op} {rng.choice(names)}) {{")
+            open_blocks += 1
+        elif open_blocks > 0 and choice < 0.2:
+            open_blocks -= 1
+            lines.append("  " * (open_blocks + 1) + "}")
+        else:
+            lines.append(simple_statement(indent))
+        emitted += 1
+
+    while open_blocks > 0:
+        open_blocks -= 1
+        lines.append("  " * (open_blocks + 1) + "}")
+
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_programs(statements: int, depth: int = 2, string_length: int = 10, variables: int = 8,
+                      seed: int = 0) -> list[str]:
+    """Programs of `statements` statements in total, each of them is translated within the address space."""
+    programs: list[str] = []
+    # the same for every total, so a smaller total gives the first programs of a larger one
+    limit = 32
+    while statements > 0:
+        size = min(limit, statements)
+        program = generate_program(size, depth, string_length, variables, seed + len(programs))
+        try:
+            compile_source(program)
+        except ValueError:
+            if size == 1:
+                raise ValueError("A program of one statement does not fit in the address space") from None
+            limit = size // 2
+            continue
+        programs.append(program)
+        statements -= size
+    return programs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic program")
+    parser.add_argument("--statements", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=2, help="maximal nesting of if and while blocks")
+    parser.add_argument("--strings", type=int, default=10, help="length of string literals")
+    parser.add_argument("--variables", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(generate_program(args.statements, args.depth, args.strings, args.variables, args.seed), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Simulator throughput over the bundled programs and the golden sources.
+
+Every program runs several times with a fixed input on each engine, the best run is reported.
+Results are written as JSON and can be compared with a stored baseline:
+
+    python -m benchmarks.simulator --output bench.json --baseline baseline.json --threshold 0.1
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from csa_lab3.isa import ProgramImage
+from csa_lab3.machine import Engine, create_unit, execute, input_buffer_of, load_program
+from csa_lab3.translator import compile_source
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore[assignment]
+
+try:
+    from ruamel.yaml import YAML
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# inputs of the bundled programs, the others do not read
+PROGRAM_INPUTS = {
+    "cat": "The quick brown fox jumps over the lazy dog",
+    "hello_user_name": "Benchmark",
+}
+
+
+@dataclass(frozen=True)
+class Measurement:
+    name: str
+    engine: str
+    runs: int
+    instructions: int
+    ticks: int
+    seconds: float  # the best run
+
+    @property
+    def instructions_per_second(self) -> float:
+        return self.instructions / self.seconds
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.seconds
+
+    def as_dict(self) -> dict[str, object]:
+        return asdict(self) | {
+            "instructions_per_second": self.instructions_per_second,
+            "ticks_per_second": self.ticks_per_second,
+        }
+
+
+def load_programs() -> dict[str, tuple[str, str]]:
+    """Sources and inputs by benchmark name, golden sources need ruamel.yaml."""
+    programs = {}
+
+    for path in sorted(glob.glob(os.path.join(ROOT, "programs", "*.aul"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as file:
+            programs[f"programs/{name}"] = (file.read(), PROGRAM_INPUTS.get(name, ""))
+
+    if not HAS_YAML:
+        print("ruamel.yaml is not installed, golden sources are skipped", file=sys.stderr)
+        return programs
+
+    yaml = YAML(typ="safe")
+    for path in sorted(glob.glob(os.path.join(ROOT, "tests", "golden", "*.yml"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as file:
+            golden = yaml.load(file)
+        programs[f"golden/{name}"] = (golden["source_code"], golden["stdin"])
+
+    return programs
+
+
+def measure(name: str, image: ProgramImage, input_text: str, engine: Engine, runs: int) -> Measurement:
+    cmds, mem = load_program(image)
+
+    best = float("inf")
+    result = None
+    for _ in range(runs):
+        # the program is decoded outside of the timed part
+        unit = create_unit(cmds, mem, input_buffer_of(input_text), engine)
+        start = time.perf_counter()
+        result = execute(unit)
+        best = min(best, time.perf_counter() - start)
+
+    assert result is not None
+    return Measurement(name, engine.value, runs, result.instructions, result.ticks, best)
+
+
+def peak_rss_kib() -> int | None:
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run(engines: list[Engine], runs: int) -> list[Measurement]:
+    measurements = []
+    for name, (source, input_text) in load_programs().items():
+        image = compile_source(source)
+        for engine in engines:
+            measurements.append(measure(name, image, input_text, engine, runs))
+    return measurements
+
+
+def report(measurements: list[Measurement]) -> dict[str, object]:
+    return {
+        "python": sys.version.split()[0],
+        "measurements": [m.as_dict() for m in measurements],
+        "peak_rss_kib": peak_rss_kib(),
+    }
+
+
+def compare(results: dict[str, object], baseline: dict[str, object], threshold: float) -> list[str]:
+    """Lists benchmarks whose instructions per second dropped by more than the threshold."""
+    def rates(results: dict[str, object]) -> dict[tuple[str, str], float]:
+        measurements = results["measurements"]
+        assert isinstance(measurements, list)
+        return {(m["name"], m["engine"]): m["instructions_per_second"] for m in measurements}
+
+    regressions = []
+    current = rates(results)
+    for key, expected in rates(baseline).items():
+        actual = current.get(key)
+        if actual is not None and actual < expected * (1 - threshold):
+            regressions.append(f"{key[0]} ({key[1]}): {actual:,.0f} < {expected:,.0f} instructions/s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure simulator throughput")
+    parser.add_argument("--engine", choices=[e.value for e in Engine], action="append",
+                        help="engine to measure, all by default")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed relative drop of instructions per second")
+    args = parser.parse_args()
+
+    engines = [Engine(e) for e in args.engine] if args.engine else list(Engine)
+    measurements = run(engines, args.runs)
+    results = report(measurements)
+
+    for m in measurements:
+        print(f"{m.name:<28} {m.engine:<10} {m.instructions:>8} instr {m.seconds * 1000:>9.2f} ms "
+              f"{m.instructions_per_second:>12,.0f} instr/s {m.ticks_per_second:>14,.0f} ticks/s")
+    print(f"Peak RSS: {results['peak_rss_kib']} KiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
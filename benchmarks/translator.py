@@ -0,0 +1,132 @@
+"""Time of every translator stage on synthetic programs of growing size.
+
+    python -m benchmarks.translator --sizes 1000 2000 4000 8000 --depth 3 --output translator.json
+
+Stages are those of `translate` with the optimizations on, the compile stage includes the folding of literals
+and the passes over the IR. A size is a number of statements split into programs which fit in the address space
+of the machine, the time of a stage is summed over them. Time per statement should stay about the same as sizes
+grow, a stage whose time per statement grows more than --threshold times between the smallest and the largest
+size is reported as superlinear.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Tuple, TypeVar
+
+from benchmarks.generator import generate_programs
+from csa_lab3 import peephole
+from csa_lab3.isa import build_image, write_image
+from csa_lab3.translator import Compiler, LanguagePart, Lexer, Parser
+
+STAGES = ("lex", "parse", "compile", "optimize", "encode", "write")
+
+T = TypeVar("T")
+
+
+class TokenReplay(Lexer):
+    """Gives the parser tokens read in advance, so parsing is timed without lexing."""
+
+    def __init__(self, tokens: list[Tuple[LanguagePart, Any]]):
+        super().__init__("")
+        self.tokens = iter(tokens)
+
+    def parse_token(self) -> Tuple[LanguagePart, Any]:
+        return next(self.tokens)
+
+
+def tokenize(program: str) -> list[Tuple[LanguagePart, Any]]:
+    lexer = Lexer(program)
+    tokens = [lexer.parse_token()]
+    while tokens[-1][0] != LanguagePart.EOF:
+        tokens.append(lexer.parse_token())
+    return tokens
+
+
+def timed(function: Callable[[], T]) -> tuple[T, float]:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def measure_program(program: str, directory: str) -> dict[str, float]:
+    tokens, lex_time = timed(lambda: tokenize(program))
+    ast, parse_time = timed(Parser(TokenReplay(tokens)).parse)
+
+    compiler = Compiler(optimize=True)
+    _, compile_time = timed(lambda: compiler.compile_node(ast))
+    (compiler.commands, _), optimize_time = timed(lambda: peephole.optimize(compiler.commands))
+
+    image, encode_time = timed(lambda: build_image(compiler.commands, compiler.memory, listing=True))
+    _, write_time = timed(lambda: write_image(image, os.path.join(directory, "program.bin")))
+
+    return dict(zip(STAGES, (lex_time, parse_time, compile_time, optimize_time, encode_time, write_time)))
+
+
+def measure(programs: list[str], directory: str) -> dict[str, float]:
+    times = [measure_program(program, directory) for program in programs]
+    return {stage: sum(t[stage] for t in times) for stage in STAGES}
+
+
+def run(sizes: list[int], depth: int, string_length: int, variables: int, runs: int) -> list[dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            programs = generate_programs(size, depth, string_length, variables)
+            # the best time of each stage
+            runs_times = [measure(programs, directory) for _ in range(runs)]
+            times = {stage: min(t[stage] for t in runs_times) for stage in STAGES}
+            results.append({"statements": size, "programs": len(programs),
+                            "source_bytes": sum(len(program) for program in programs), "seconds": times})
+    return results
+
+
+def superlinear_stages(results: list[dict[str, Any]], threshold: float) -> list[str]:
+    """Stages whose time per statement grows more than `threshold` times from the smallest to the largest size."""
+    smallest = min(results, key=lambda r: r["statements"])
+    largest = max(results, key=lambda r: r["statements"])
+
+    stages = []
+    for stage in STAGES:
+        before = smallest["seconds"][stage] / smallest["statements"]
+        after = largest["seconds"][stage] / largest["statements"]
+        if before > 0 and after / before > threshold:
+            stages.append(f"{stage}: {before * 1e6:.2f} -> {after * 1e6:.2f} us per statement")
+    return stages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure translator stages on synthetic programs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000],
+                        help="numbers of statements")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--strings", type=int, default=10, help="length of string literals")
+    parser.add_argument("--variables", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=2.0,
+                        help="allowed growth of time per statement between the smallest and the largest size")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.depth, args.strings, args.variables, args.runs)
+
+    print(f"{'statements':>10} " + " ".join(f"{stage:>10}" for stage in STAGES))
+    for result in results:
+        print(f"{result['statements']:>10} "
+              + " ".join(f"{result['seconds'][stage] * 1000:>8.1f}ms" for stage in STAGES))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    stages = superlinear_stages(results, args.threshold)
+    for stage in stages:
+        print(f"Superlinear: {stage}")
+    if stages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Runs one program against many inputs in a pool of worker processes.
+
+Every worker decodes the program and binds its handlers once, then resets the unit before each input.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from csa_lab3.control_unit import ControlUnit
+from csa_lab3.functional_unit import FunctionalUnit
+from csa_lab3.isa import ProgramImage, load_image
+from csa_lab3.machine import Engine, SimulationResult, create_unit, execute, input_buffer_of, load_program
+
+
+class _Worker:
+    unit: ControlUnit | FunctionalUnit
+    memory: bytes
+    limit: int | None
+
+
+def _init_worker(image: ProgramImage, engine: Engine, limit: int | None) -> None:
+    cmds, _Worker.memory = load_program(image)
+    _Worker.unit = create_unit(cmds, _Worker.memory, [], engine)
+    _Worker.limit = limit
+
+
+def _run_input(data: bytes | str) -> SimulationResult:
+    _Worker.unit.reset(_Worker.memory, input_buffer_of(data))
+    return execute(_Worker.unit, limit=_Worker.limit)
+
+
+def run_batch(program: str | ProgramImage, inputs: Iterable[bytes | str], *,  # pylint: disable=too-many-arguments
+              engine: Engine = Engine.FUNCTIONAL, workers: int | None = None, limit: int | None = None,
+              chunksize: int = 16, progress: Callable[[int], None] | None = None) -> Iterator[SimulationResult]:
+    """Yields results in the order of the inputs, progress is called with the number of finished inputs."""
+    image = load_image(program) if isinstance(program, str) else program
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(image, engine, limit)) as executor:
+        for done, result in enumerate(executor.map(_run_input, inputs, chunksize=chunksize), 1):
+            if progress is not None:
+                progress(done)
+            yield result
+
+
+def _read_input(filename: str) -> bytes:
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a compiled program against many inputs")
+    parser.add_argument("code_file")
+    parser.add_argument("input_files", nargs="+", help="files with inputs, one simulation per file")
+    parser.add_argument("--engine", choices=[e.value for e in Engine], default=Engine.FUNCTIONAL.value)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--limit", type=int, help="stop a simulation after this number of instructions")
+    args = parser.parse_args()
+
+    total = len(args.input_files)
+
+    def report(done: int) -> None:
+        print(f"\r{done}/{total}", end="" if done < total else "\n", file=sys.stderr, flush=True)
+
+    results = run_batch(args.code_file, map(_read_input, args.input_files), engine=Engine(args.engine),
+                        workers=args.workers, limit=args.limit, progress=report)
+
+    for name, res in zip(args.input_files, results):
+        print(json.dumps({
+            "input": name,
+            "output": res.output_text,
+            "instructions": res.instructions,
+            "ticks": res.ticks,
+            "halt_reason": res.halt_reason.value,
+            "error": res.error,
+        }))
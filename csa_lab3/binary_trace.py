@@ -0,0 +1,267 @@
+"""Compact binary execution trace.
+
+The file starts with a header, then goes a record for every executed command and a footer with an index.
+A step record keeps the command pointer after the command, the opcode at it, the ticks of the command and
+only the registers, flags and memory bytes which were changed by the command. Every `interval` steps a keyframe
+with the full state and the total ticks is written, so the reader can restore the state at any step from
+the nearest keyframe.
+
+    header:    b"CSAT", version: u8, interval: u16
+    step:      0x01, pc: u16, opcode: u8, mask: u16, ticks: u16 x 4, changed registers: u8 each, [flags: u8],
+               writes: u16, (address: u8, value: u8) each
+    keyframe:  0x02, step: u32, pc: u16, opcode: u8, ticks: u32 x 4, registers: u8 each, flags: u8,
+               memory size: u16, memory
+    footer:    (step: u32, offset: u64) for every keyframe, keyframes: u32, footer offset: u64, b"CSAI"
+
+Bits 0-8 of the mask are registers in the order of REGISTER_NAMES, bit 9 is flags.
+Ticks go in the order of bus transfers, memory reads, memory writes and ALU operations.
+"""
+from __future__ import annotations
+
+import argparse
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator
+
+from csa_lab3.control_unit import CommandSequencer, REGISTER_NAMES
+from csa_lab3.data_path import TickCounter
+from csa_lab3.isa import Command, CommandName, read_commands
+from csa_lab3.trace import TraceSink
+
+MAGIC = b"CSAT"
+INDEX_MAGIC = b"CSAI"
+VERSION = 2
+
+STEP_RECORD = 0x01
+KEYFRAME_RECORD = 0x02
+
+FLAGS_BIT = len(REGISTER_NAMES)
+FLAG_NAMES = ("N", "Z", "V", "C")
+
+HEADER = struct.Struct("<4sBH")
+STEP = struct.Struct("<BHBH")
+STEP_TICKS = struct.Struct("<4H")
+WRITES = struct.Struct("<H")
+KEYFRAME = struct.Struct("<BIHB")
+KEYFRAME_TICKS = struct.Struct("<4I")
+MEMORY_SIZE = struct.Struct("<H")
+INDEX_ENTRY = struct.Struct("<IQ")
+FOOTER = struct.Struct("<IQ4s")
+
+
+def pack_flags(flags: dict[str, int]) -> int:
+    return sum(flags[name] << (3 - i) for i, name in enumerate(FLAG_NAMES))
+
+
+def unpack_flags(value: int) -> dict[str, int]:
+    return {name: (value >> (3 - i)) & 1 for i, name in enumerate(FLAG_NAMES)}
+
+
+@dataclass
+class TraceState:
+    step: int
+    pc: int
+    opcode: int
+    registers: list[int]
+    flags: dict[str, int]
+    memory: bytearray
+    ticks: TickCounter  # since the start
+    step_ticks: TickCounter  # of the last command
+
+    def format_state(self) -> str:
+        """Registers and flags in the format of the golden logs."""
+        registers = sorted(f'{name}: {hex(value)[2:].upper().zfill(2)}'
+                           for name, value in zip(REGISTER_NAMES, self.registers))
+        registers.append(", ".join([f'{i}: {j}' for i, j in self.flags.items()]))
+        return " | ".join(registers)
+
+
+class BinaryTraceSink(TraceSink):
+    def __init__(self, filename: str, interval: int = 1024):
+        self.file: BinaryIO = open(filename, 'wb')  # pylint: disable=consider-using-with
+        self.interval = interval
+        self.index: list[tuple[int, int]] = []
+
+        self.registers: list[int] = []
+        self.flags = 0
+        self.memory = b""
+        self.ticks = TickCounter()
+        self.opcodes: dict[int, int] = {}
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, interval))
+
+    def start(self, unit: CommandSequencer) -> None:
+        self.opcodes = {addr: cmd.name.value for addr, cmd in unit.commands_memory.items()}
+        self.registers = unit.register_values()
+        self.flags = pack_flags(unit.flags)
+        self.memory = unit.memory_snapshot()
+        self.ticks = unit.ticks.copy()
+        self._write_keyframe(0, unit.command_pointer)
+
+    def _write_keyframe(self, step: int, pc: int) -> None:
+        self.index.append((step, self.file.tell()))
+        self.file.write(KEYFRAME.pack(KEYFRAME_RECORD, step, pc, self.opcodes[pc]))
+        self.file.write(KEYFRAME_TICKS.pack(*self.ticks.as_tuple()))
+        self.file.write(bytes(self.registers) + bytes([self.flags]))
+        self.file.write(MEMORY_SIZE.pack(len(self.memory)) + self.memory)
+
+    def instruction(self, counter: int, unit: CommandSequencer) -> None:
+        pc = unit.command_pointer
+
+        registers = unit.register_values()
+        flags = pack_flags(unit.flags)
+
+        mask = 0
+        changed = bytearray()
+        for i, (old, new) in enumerate(zip(self.registers, registers)):
+            if old != new:
+                mask |= 1 << i
+                changed.append(new)
+        if flags != self.flags:
+            mask |= 1 << FLAGS_BIT
+            changed.append(flags)
+
+        memory = unit.memory_snapshot()
+        writes = bytearray()
+        if memory != self.memory:
+            for addr, (old, new) in enumerate(zip(self.memory, memory)):
+                if old != new:
+                    writes += bytes((addr, new))
+
+        ticks = unit.ticks.copy()
+
+        self.file.write(STEP.pack(STEP_RECORD, pc, self.opcodes[pc], mask))
+        self.file.write(STEP_TICKS.pack(*(ticks - self.ticks).as_tuple()))
+        self.file.write(changed + WRITES.pack(len(writes) // 2) + writes)
+
+        self.registers, self.flags, self.memory, self.ticks = registers, flags, memory, ticks
+
+        if counter % self.interval == 0:
+            self._write_keyframe(counter, pc)
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        footer_offset = self.file.tell()
+        for step, offset in self.index:
+            self.file.write(INDEX_ENTRY.pack(step, offset))
+        self.file.write(FOOTER.pack(len(self.index), footer_offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class BinaryTraceReader:
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as file:
+            self.data = file.read()
+
+        magic, version, self.interval = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a binary trace of version {VERSION}: {filename}")
+
+        self.end = len(self.data)
+        self.index: list[tuple[int, int]] = []
+
+        if self.data.endswith(INDEX_MAGIC):
+            count, self.end, _ = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            self.index = [INDEX_ENTRY.unpack_from(self.data, self.end + i * INDEX_ENTRY.size) for i in range(count)]
+        else:
+            # the trace was not closed, it is still readable from the start
+            self.index = [(0, HEADER.size)]
+
+    def _read_keyframe(self, offset: int) -> tuple[TraceState, int]:
+        _, step, pc, opcode = KEYFRAME.unpack_from(self.data, offset)
+        offset += KEYFRAME.size
+        ticks = TickCounter(*KEYFRAME_TICKS.unpack_from(self.data, offset))
+        offset += KEYFRAME_TICKS.size
+
+        registers = list(self.data[offset:offset + len(REGISTER_NAMES)])
+        offset += len(REGISTER_NAMES)
+        flags = unpack_flags(self.data[offset])
+        offset += 1
+
+        (size,) = MEMORY_SIZE.unpack_from(self.data, offset)
+        offset += MEMORY_SIZE.size
+        memory = bytearray(self.data[offset:offset + size])
+        offset += size
+
+        return TraceState(step, pc, opcode, registers, flags, memory, ticks, TickCounter()), offset
+
+    def _apply_step(self, state: TraceState, offset: int) -> int:
+        _, state.pc, state.opcode, mask = STEP.unpack_from(self.data, offset)
+        offset += STEP.size
+
+        state.step_ticks = TickCounter(*STEP_TICKS.unpack_from(self.data, offset))
+        offset += STEP_TICKS.size
+        state.ticks = state.ticks + state.step_ticks
+
+        for i in range(len(REGISTER_NAMES)):
+            if mask & (1 << i):
+                state.registers[i] = self.data[offset]
+                offset += 1
+        if mask & (1 << FLAGS_BIT):
+            state.flags = unpack_flags(self.data[offset])
+            offset += 1
+
+        (writes,) = WRITES.unpack_from(self.data, offset)
+        offset += WRITES.size
+        for i in range(writes):
+            state.memory[self.data[offset + 2 * i]] = self.data[offset + 2 * i + 1]
+        offset += 2 * writes
+
+        state.step += 1
+        return offset
+
+    def _replay(self, offset: int) -> Iterator[TraceState]:
+        state, offset = self._read_keyframe(offset)
+
+        while offset < self.end:
+            if self.data[offset] == KEYFRAME_RECORD:
+                _, offset = self._read_keyframe(offset)
+                continue
+            offset = self._apply_step(state, offset)
+            yield state
+
+    def __iter__(self) -> Iterator[TraceState]:
+        """Yields the state after every step, the same object is updated in place."""
+        return self._replay(self.index[0][1])
+
+    def seek(self, step: int) -> TraceState:
+        """Restores the state after the step from the nearest keyframe before it."""
+        keyframe_step, offset = max((entry for entry in self.index if entry[0] <= step), default=self.index[0])
+
+        if keyframe_step == step:
+            return self._read_keyframe(offset)[0]
+
+        for state in self._replay(offset):
+            if state.step == step:
+                return state
+
+        raise IndexError(f"Trace has no step {step}")
+
+    def expand(self, commands: list[Command] | None = None) -> Iterator[str]:
+        """Yields lines of the instruction trace in the format of the golden logs."""
+        commands_memory = {cmd.address: cmd for cmd in commands or []}
+
+        for state in self:
+            command = commands_memory.get(state.pc)
+            name = str(command) if command is not None else CommandName(state.opcode).name
+            yield f"{state.step}) {name} - {state.format_state()}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand a binary trace to text")
+    parser.add_argument("trace_file")
+    parser.add_argument("--program", help="code file to print commands with operands")
+    parser.add_argument("--step", type=int, help="print only the state after this step")
+    args = parser.parse_args()
+
+    reader = BinaryTraceReader(args.trace_file)
+    if args.step is not None:
+        found = reader.seek(args.step)
+        print(f"{found.step}) .{hex(found.pc)[2:].zfill(2)} - {found.format_state()}")
+        print(f"ticks: {found.ticks}")
+        print(" ".join(hex(b)[2:].zfill(2) for b in found.memory))
+    else:
+        for line in reader.expand(read_commands(args.program) if args.program else None):
+            print(line)
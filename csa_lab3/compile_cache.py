@@ -0,0 +1,83 @@
+"""On-disk cache of translated programs.
+
+An entry is a directory named by the hash of the source text, the translator version and the options,
+it keeps copies of the code file, the memory file and the listing. The least recently used entries
+are removed when the cache grows over its size limit.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+CODE_FILE = "program.bin"
+ARTIFACT_SUFFIXES = ("", ".mem", ".txt")
+
+
+class CompileCache:
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(source: str, version: int, listing: bool, optimize: bool = True) -> str:
+        digest = hashlib.sha256(f"{version}:{int(listing)}:{int(optimize)}:".encode())
+        digest.update(source.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def suffixes(listing: bool) -> tuple[str, ...]:
+        return ARTIFACT_SUFFIXES if listing else ARTIFACT_SUFFIXES[:-1]
+
+    def fetch(self, key: str, dest: str, listing: bool) -> bool:
+        """Copies the artifacts of the entry to dest, returns False if there is no such entry."""
+        entry = os.path.join(self.directory, key)
+        try:
+            for suffix in self.suffixes(listing):
+                shutil.copyfile(os.path.join(entry, CODE_FILE + suffix), dest + suffix)
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key: str, dest: str, listing: bool) -> None:
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        # the entry is filled aside and renamed, so readers never see it half written
+        staging = tempfile.mkdtemp(prefix=".", dir=self.directory)
+        for suffix in self.suffixes(listing):
+            shutil.copyfile(dest + suffix, os.path.join(staging, CODE_FILE + suffix))
+
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # stored by another process in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self) -> list[tuple[float, str, int]]:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry.path, name)) for name in os.listdir(entry.path))
+                entries.append((entry.stat().st_mtime, entry.path, size))
+        return entries
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits its size limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+
+        for _, path, size in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
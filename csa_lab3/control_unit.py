@@ -1,21 +1,152 @@
-from csa_lab3.data_path import DataPath, AluOperation, Register
-from csa_lab3.isa import CommandName, Command, MemoryWord, OperandAddress
+import functools
+from typing import Callable
 
+from csa_lab3.data_path import DataPath, AluOperation, Register, IoDevice, TickCounter
+from csa_lab3.isa import CommandName, Command, MemoryWord, OperandAddress, JUMP_COMMANDS, OPERAND_COUNTS
 
-class ControlUnit:
-    def __init__(self, data_path: DataPath, commands: list[Command], memory: list[MemoryWord]):
-        self.data_path = data_path
-        self.data_path.data_memory.fill_data(memory)
+# registers of the processor, the first four are register operands of the ISA
+REGISTER_NAMES = ('AC', 'BR', 'R0', 'IOR', 'INL', 'INR', 'OUT', 'DR', 'DP')
+
+# executes one predecoded command, returns the jump target if the jump is taken
+Handler = Callable[[], int | None]
+
+# errors of malformed commands, see CommandSequencer._predecode
+EXECUTION_ERRORS = (AssertionError, ValueError, KeyError, NotImplementedError)
+
+
+def link_commands(commands: list[Command]) -> tuple[dict[int, int], dict[int, int]]:
+    """Returns fall-through successors and validated jump targets of the commands by their addresses.
+
+    The numbers of operands and the jump targets are checked here, so a malformed program is rejected on load.
+    """
+    addresses = [cmd.address for cmd in commands]
+
+    # fall-through successor of every command, the last one has none
+    next_addresses = dict(zip(addresses, addresses[1:]))
+    jump_targets: dict[int, int] = {}
+    known_addresses = set(addresses)
+
+    for cmd in commands:
+        expected = OPERAND_COUNTS.get(cmd.name, len(cmd.operands))
+        if len(cmd.operands) != expected:
+            raise ValueError(f"{cmd.name.name} at {cmd.get_addr()} takes {expected} operands, got {len(cmd.operands)}")
+
+        if cmd.name in JUMP_COMMANDS:
+            target = cmd.operands[0].value
+            if target not in known_addresses:
+                raise ValueError(f"Invalid jump target .{hex(target)[2:].zfill(2)} at {cmd.get_addr()}: {cmd}")
+            jump_targets[cmd.address] = target
+
+    if commands and commands[-1].name not in (CommandName.HLT, CommandName.JMP):
+        raise ValueError(f"Execution falls off the end of the program after {commands[-1].get_addr()}")
 
-        self.commands_memory = {}
-        self.command_addresses = []
+    return next_addresses, jump_targets
+
+
+class CommandSequencer:
+    """Fetches predecoded commands by the command pointer and moves it to the next command.
+
+    Subclasses bind handlers of the commands which work with data, control flow is handled here.
+    """
+
+    def __init__(self, commands: list[Command], flags: dict[str, int], ticks: TickCounter):
+        self.flags = flags
+        self.ticks = ticks
+
+        self.commands_memory: dict[int, Command] = {}
+        self.command_addresses: list[int] = []
 
         for cmd in commands:
             self.commands_memory[cmd.address] = cmd
             self.command_addresses.append(cmd.address)
 
+        self.next_addresses, self.jump_targets = link_commands(commands)
+
+        self.handlers: dict[int, Handler] = {cmd.address: self._predecode(cmd) for cmd in commands}
+
         self.command_pointer = 0
 
+    def _predecode(self, command: Command) -> Handler:
+        # errors of a malformed command are raised when it is executed, as if it was decoded on the fly
+        try:
+            match command.name:
+                case CommandName.NOP:
+                    return self._nop
+
+                case CommandName.HLT:
+                    return self._hlt
+
+                case CommandName.JE:
+                    return functools.partial(self._jump_if, 'Z', 1, self.jump_targets[command.address])
+
+                case CommandName.JNE:
+                    return functools.partial(self._jump_if, 'Z', 0, self.jump_targets[command.address])
+
+                case CommandName.JAE:
+                    return functools.partial(self._jump_if, 'N', 0, self.jump_targets[command.address])
+
+                case CommandName.JMP:
+                    return functools.partial(self._jump, self.jump_targets[command.address])
+
+                case _:
+                    return self._bind_handler(command)
+
+        except EXECUTION_ERRORS as error:
+            return functools.partial(self._raise, error)
+
+    def _bind_handler(self, command: Command) -> Handler:
+        raise NotImplementedError(f'No info about execution {command.name}')
+
+    @staticmethod
+    def _raise(error: Exception) -> None:
+        raise error
+
+    @staticmethod
+    def _nop() -> None:
+        return None
+
+    @staticmethod
+    def _hlt() -> None:
+        raise StopIteration
+
+    def _jump_if(self, flag: str, value: int, target: int) -> int | None:
+        if self.flags[flag] == value:
+            return target
+        return None
+
+    @staticmethod
+    def _jump(target: int) -> int:
+        return target
+
+    def _next_command(self, value: int | None = None) -> None:
+        if value is not None:
+            self.command_pointer = value
+        else:
+            self.command_pointer = self.next_addresses[self.command_pointer]
+
+    def decode_command(self) -> None:
+        self._next_command(self.handlers[self.command_pointer]())
+
+    def register_values(self) -> list[int]:
+        """Returns values of the registers in the order of REGISTER_NAMES."""
+        raise NotImplementedError
+
+    def memory_snapshot(self) -> bytes:
+        raise NotImplementedError
+
+    def reset(self, memory: bytes, in_buffer: list[str]) -> None:
+        """Prepares the next run of the same program, predecoded handlers are kept."""
+        raise NotImplementedError
+
+
+class ControlUnit(CommandSequencer):
+    def __init__(self, data_path: DataPath, commands: list[Command], memory: bytes | list[MemoryWord]):
+        self.data_path = data_path
+        self.data_path.data_memory.fill_data(memory)
+        self.stdout = data_path.stdout
+
+        super().__init__(commands, self.data_path.alu.flags, self.data_path.ticks)
+
     def _move(self, from_register: Register, to_register: Register | list[Register]) -> None:
         if not isinstance(to_register, list):
             to_register = [to_register]
@@ -41,12 +172,6 @@ class ControlUnit:
         self._move(data_register, self.data_path.DR)
         self.data_path.data_memory.signal_write()
 
-    def _next_command(self, value: int | None = None) -> None:
-        if value:
-            self.command_pointer = value
-        else:
-            self.command_pointer = self.command_addresses[self.command_addresses.index(self.command_pointer) + 1]
-
     def register_num_to_register(self, s: int) -> Register:
         match s:
             case 0:
@@ -60,309 +185,339 @@ class ControlUnit:
             case _:
                 raise ValueError(f"Unknown register: {s}")
 
-    def decode_command(self) -> None:
-        command = self.commands_memory[self.command_pointer]
+    def _bind_handler(self, command: Command) -> Handler:
         command_name = command.name
 
         match command_name:
-            case CommandName.NOP:
-                pass
-
-            case CommandName.HLT:
-                raise StopIteration
-
             case CommandName.MOV:
-
                 source = command.operands[1]
+                dest = command.operands[0]
+
+                load: Callable[[], None] = self._nop
                 match source.address:
                     case OperandAddress.DIRECT_LOAD:
-                        self.data_path.AC.set_value(source.value)
+                        load = functools.partial(self.data_path.AC.set_value, source.value)
                     case OperandAddress.MEMORY_DIRECT:
-                        self.data_path.AC.set_value(source.value)
-                        self.read_from_mem(self.data_path.AC, self.data_path.AC)
+                        load = functools.partial(self._load_ac_from_mem, source.value)
 
-                dest = command.operands[0]
+                store: Callable[[], None] = self._nop
                 match dest.address:
-                    case OperandAddress.DIRECT_LOAD:
-                        self.data_path.BR.set_value(dest.value)
-                        self.write_to_mem(self.data_path.BR, self.data_path.AC)
-                    case OperandAddress.MEMORY_DIRECT:
-                        self.data_path.BR.set_value(dest.value)
-                        self.write_to_mem(self.data_path.BR, self.data_path.AC)
+                    case OperandAddress.DIRECT_LOAD | OperandAddress.MEMORY_DIRECT:
+                        store = functools.partial(self._store_ac_to_mem, dest.value)
                     case OperandAddress.REGISTER:
-                        self._move(self.data_path.AC, self.register_num_to_register(dest.value))
+                        store = functools.partial(
+                            self._move, self.data_path.AC, self.register_num_to_register(dest.value)
+                        )
 
-            case CommandName.MOV4:
+                return functools.partial(self._mov, load, store)
 
+            case CommandName.MOV4:
                 source = command.operands[1]
                 dest = command.operands[0]
 
                 assert dest.address == OperandAddress.MEMORY_DIRECT, "Insensible move"
 
-                if source.address == OperandAddress.DIRECT_LOAD:
-                    self.data_path.AC.set_value(source.value)
-                    self.data_path.BR.set_value(dest.value)
+                match source.address:
+                    case OperandAddress.DIRECT_LOAD:
+                        return functools.partial(self._mov4_direct, dest.value, source.value)
+                    case OperandAddress.MEMORY_DIRECT:
+                        return functools.partial(self._mov4_memory, dest.value, source.value)
+                    case _:
+                        return self._nop
 
-                    self.write_to_mem(self.data_path.BR, self.data_path.AC)
-                    self.data_path.AC.set_value(0)
+            case CommandName.ADD1:
+                source_r = command.operands[1]
+                dest = command.operands[0]
 
-                    for i in range(1, 4):
-                        self._move(self.data_path.BR, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.BR)
+                assert dest.address == OperandAddress.REGISTER, "Bad add1"
+                assert source_r.address == OperandAddress.DIRECT_LOAD, "Bad add1"
 
-                        self.write_to_mem(self.data_path.BR, self.data_path.AC)
+                return functools.partial(self._add1, self.register_num_to_register(dest.value), source_r.value)
 
-                elif source.address == OperandAddress.MEMORY_DIRECT:
-                    self.data_path.AC.set_value(source.value)
-                    self._move(self.data_path.AC, self.data_path.R0)
+            case CommandName.ADD:
+                source_l = command.operands[1]
+                source_r = command.operands[2]
+                dest = command.operands[0]
 
-                    self.data_path.BR.set_value(dest.value)
+                assert dest.address == OperandAddress.MEMORY_DIRECT, "Insensible add"
 
-                    for i in range(0, 4):
-                        self.read_from_mem(self.data_path.R0, self.data_path.AC)
-                        self.write_to_mem(self.data_path.BR, self.data_path.AC)
+                return functools.partial(
+                    self._add,
+                    dest.value,
+                    source_l.value, source_l.address == OperandAddress.DIRECT_LOAD,
+                    source_r.value, source_r.address == OperandAddress.DIRECT_LOAD
+                )
 
-                        self._move(self.data_path.R0, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.R0)
+            case CommandName.SUB:
+                source_l = command.operands[1]
+                source_r = command.operands[2]
+                dest = command.operands[0]
 
-                        self._move(self.data_path.BR, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.BR)
+                assert dest.address == OperandAddress.MEMORY_DIRECT, "Insensible sub"
+                assert source_l.address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
 
-            case CommandName.ADD1:
+                return functools.partial(self._sub, dest.value, source_l.value, source_r.value)
+
+            case CommandName.CMP:
+                source_l = command.operands[0]
                 source_r = command.operands[1]
-                dest = command.operands[0]
 
-                assert dest.address == OperandAddress.REGISTER, "Bad add1"
-                assert source_r.address == OperandAddress.DIRECT_LOAD, "Bad add1"
+                if (source_l.address == OperandAddress.MEMORY_DIRECT
+                        and source_r.address == OperandAddress.MEMORY_DIRECT):
+                    return functools.partial(self._cmp_memory, source_l.value, source_r.value)
 
-                self.data_path.alu.flags['C'] = 0
-                self._move(self.register_num_to_register(dest.value), self.data_path.INL)
-                self.register_num_to_register(dest.value).set_value(source_r.value)
-                self._move(self.register_num_to_register(dest.value), self.data_path.INR)
+                if (source_l.address == OperandAddress.REGISTER
+                        and source_r.address == OperandAddress.DIRECT_LOAD):
+                    return functools.partial(
+                        self._cmp_register, self.register_num_to_register(source_l.value), source_r.value
+                    )
 
-                self.data_path.alu.perform_operation(AluOperation.ADD)
-                self._move(self.data_path.OUT, self.register_num_to_register(dest.value))
+                raise ValueError("Currently, not supported")
 
-            case CommandName.ADD:
-                operation = AluOperation.ADD
+            case CommandName.SHL | CommandName.SHR:
+                alu_op = AluOperation.SHL if command_name == CommandName.SHL else AluOperation.SHR
+
+                source_l = command.operands[0]
+                source_r = command.operands[1]
+
+                assert source_l.address == OperandAddress.REGISTER, "Currently, not supported"
+                assert source_r.address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
+
+                return functools.partial(
+                    self._shift, alu_op, self.register_num_to_register(source_l.value), source_r.value
+                )
+
+            case CommandName.DEC | CommandName.INC:
+                alu_op = AluOperation.DECL if command_name == CommandName.DEC else AluOperation.INCL
 
-                source_l = command.operands[1]
-                source_r = command.operands[2]
                 dest = command.operands[0]
+                assert dest.address == OperandAddress.REGISTER, "Currently, not supported"
 
-                assert dest.address == OperandAddress.MEMORY_DIRECT, "Insensible add"
+                return functools.partial(self._step, alu_op, self.register_num_to_register(dest.value))
 
-                self.data_path.alu.flags['C'] = 0
+            case CommandName.LD:
+                to_ = command.operands[0]
+                from_ = command.operands[1]
 
-                expand_sl = False
-                expand_sr = False
+                assert to_.address == OperandAddress.REGISTER, "Currently, not supported"
+                assert from_.address == OperandAddress.REGISTER, "Currently, not supported"
 
-                self.data_path.AC.set_value(dest.value)
+                return functools.partial(
+                    self._ld, self.register_num_to_register(from_.value), self.register_num_to_register(to_.value)
+                )
 
-                self.data_path.BR.set_value(source_l.value)
-                if source_l.address == OperandAddress.DIRECT_LOAD:
-                    self.data_path.INL.set_value(source_l.value)
-                    expand_sl = True
-                else:
-                    self.read_from_mem(self.data_path.BR, self.data_path.INL)
+            case CommandName.ST:
+                to_ = command.operands[0]
+                from_ = command.operands[1]
 
-                self.data_path.R0.set_value(source_r.value)
-                if source_r.address == OperandAddress.DIRECT_LOAD:
-                    self.data_path.INR.set_value(source_r.value)
-                    expand_sr = True
-                else:
-                    self.read_from_mem(self.data_path.R0, self.data_path.INR)
+                assert to_.address == OperandAddress.REGISTER, "Currently, not supported"
+                assert from_.address == OperandAddress.REGISTER, "Currently, not supported"
 
-                for i in range(0, 4):
+                return functools.partial(
+                    self._st, self.register_num_to_register(to_.value), self.register_num_to_register(from_.value)
+                )
 
-                    self.data_path.alu.perform_operation(operation)
+            case CommandName.OUT:
+                return functools.partial(self._out, self.data_path.ports[command.operands[0].value])
 
-                    self.write_to_mem(self.data_path.AC, self.data_path.OUT)
+            case CommandName.IN:
+                return functools.partial(self._in, self.data_path.ports[command.operands[0].value])
 
-                    self._move(self.data_path.AC, self.data_path.INR)
-                    self.data_path.alu.perform_operation(AluOperation.INCR)
-                    self._move(self.data_path.OUT, self.data_path.AC)
+            case _:
+                raise NotImplementedError(f'No info about execution {command_name}')
 
-                    if not expand_sl:
-                        self._move(self.data_path.BR, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.BR)
+    def _load_ac_from_mem(self, address: int) -> None:
+        self.data_path.AC.set_value(address)
+        self.read_from_mem(self.data_path.AC, self.data_path.AC)
 
-                        self.read_from_mem(self.data_path.BR, self.data_path.INL)
-                    else:
-                        self.data_path.INL.set_value(0)
+    def _store_ac_to_mem(self, address: int) -> None:
+        self.data_path.BR.set_value(address)
+        self.write_to_mem(self.data_path.BR, self.data_path.AC)
 
-                    if not expand_sr:
-                        self._move(self.data_path.R0, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.R0)
-                        self.read_from_mem(self.data_path.R0, self.data_path.INR)
-                    else:
-                        self.data_path.INR.set_value(0)
+    @staticmethod
+    def _mov(load: Callable[[], None], store: Callable[[], None]) -> None:
+        load()
+        store()
 
-            case CommandName.SUB:
-                operation = AluOperation.SUB
+    def _mov4_direct(self, dest: int, value: int) -> None:
+        self.data_path.AC.set_value(value)
+        self.data_path.BR.set_value(dest)
 
-                source_l = command.operands[1]
-                source_r = command.operands[2]
-                dest = command.operands[0]
+        self.write_to_mem(self.data_path.BR, self.data_path.AC)
+        self.data_path.AC.set_value(0)
 
-                assert dest.address == OperandAddress.MEMORY_DIRECT, "Insensible sub"
-                assert source_l.address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
+        for _ in range(1, 4):
+            self._move(self.data_path.BR, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.BR)
 
-                self.data_path.AC.set_value(dest.value)
-                self.data_path.INL.set_value(source_l.value)
+            self.write_to_mem(self.data_path.BR, self.data_path.AC)
 
-                self.data_path.R0.set_value(source_r.value)
-                self.read_from_mem(self.data_path.R0, self.data_path.INR)
+    def _mov4_memory(self, dest: int, source: int) -> None:
+        self.data_path.AC.set_value(source)
+        self._move(self.data_path.AC, self.data_path.R0)
 
-                self.data_path.alu.perform_operation(operation)
-                self.write_to_mem(self.data_path.AC, self.data_path.OUT)
+        self.data_path.BR.set_value(dest)
 
-            case CommandName.CMP:
-                operation = AluOperation.SUB
+        for _ in range(0, 4):
+            self.read_from_mem(self.data_path.R0, self.data_path.AC)
+            self.write_to_mem(self.data_path.BR, self.data_path.AC)
 
-                source_l = command.operands[0]
-                source_r = command.operands[1]
+            self._move(self.data_path.R0, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.R0)
 
-                if (source_l.address == OperandAddress.MEMORY_DIRECT
-                        and source_r.address == OperandAddress.MEMORY_DIRECT):
+            self._move(self.data_path.BR, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.BR)
 
-                    self.data_path.AC.set_value(source_l.value)
-                    self.data_path.BR.set_value(source_r.value)
+    def _add1(self, register: Register, value: int) -> None:
+        self.data_path.alu.flags['C'] = 0
+        self._move(register, self.data_path.INL)
+        register.set_value(value)
+        self._move(register, self.data_path.INR)
 
-                    for i in range(3):
-                        self._move(self.data_path.AC, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.AC)
+        self.data_path.alu.perform_operation(AluOperation.ADD)
+        self._move(self.data_path.OUT, register)
 
-                        self._move(self.data_path.BR, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.INCR)
-                        self._move(self.data_path.OUT, self.data_path.BR)
+    def _add(self, dest: int, source_l: int, expand_sl: bool, source_r: int, expand_sr: bool) -> None:
+        operation = AluOperation.ADD
 
-                    for i in range(4):
-                        self.read_from_mem(self.data_path.AC, self.data_path.INL)
-                        self.read_from_mem(self.data_path.BR, self.data_path.INR)
+        self.data_path.alu.flags['C'] = 0
 
-                        self.data_path.alu.perform_operation(operation)
+        self.data_path.AC.set_value(dest)
 
-                        if self.data_path.alu.flags['Z'] == 0 or i == 3:
-                            break
+        self.data_path.BR.set_value(source_l)
+        if expand_sl:
+            self.data_path.INL.set_value(source_l)
+        else:
+            self.read_from_mem(self.data_path.BR, self.data_path.INL)
 
-                        self._move(self.data_path.AC, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.DECR)
-                        self._move(self.data_path.OUT, self.data_path.AC)
+        self.data_path.R0.set_value(source_r)
+        if expand_sr:
+            self.data_path.INR.set_value(source_r)
+        else:
+            self.read_from_mem(self.data_path.R0, self.data_path.INR)
 
-                        self._move(self.data_path.BR, self.data_path.INR)
-                        self.data_path.alu.perform_operation(AluOperation.DECR)
-                        self._move(self.data_path.OUT, self.data_path.BR)
+        for _ in range(0, 4):
 
-                elif (source_l.address == OperandAddress.REGISTER
-                      and source_r.address == OperandAddress.DIRECT_LOAD):
+            self.data_path.alu.perform_operation(operation)
 
-                    self._move(self.register_num_to_register(source_l.value), self.data_path.INL)
+            self.write_to_mem(self.data_path.AC, self.data_path.OUT)
 
-                    if self.register_num_to_register(source_l.value) != self.data_path.AC:
-                        self.data_path.AC.set_value(source_r.value)
-                        self._move(self.data_path.AC, self.data_path.INR)
-                    else:
-                        self.data_path.BR.set_value(source_r.value)
-                        self._move(self.data_path.BR, self.data_path.INR)
+            self._move(self.data_path.AC, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.AC)
 
-                    self.data_path.alu.perform_operation(AluOperation.SUB)
+            if not expand_sl:
+                self._move(self.data_path.BR, self.data_path.INR)
+                self.data_path.alu.perform_operation(AluOperation.INCR)
+                self._move(self.data_path.OUT, self.data_path.BR)
 
-                else:
-                    raise ValueError("Currently, not supported")
+                self.read_from_mem(self.data_path.BR, self.data_path.INL)
+            else:
+                self.data_path.INL.set_value(0)
 
-            case CommandName.SHL | CommandName.SHR:
-                alu_op = AluOperation.SHL if command_name == CommandName.SHL else AluOperation.SHR
+            if not expand_sr:
+                self._move(self.data_path.R0, self.data_path.INR)
+                self.data_path.alu.perform_operation(AluOperation.INCR)
+                self._move(self.data_path.OUT, self.data_path.R0)
+                self.read_from_mem(self.data_path.R0, self.data_path.INR)
+            else:
+                self.data_path.INR.set_value(0)
 
-                source_l = command.operands[0]
-                source_r = command.operands[1]
+    def _sub(self, dest: int, source_l: int, source_r: int) -> None:
+        self.data_path.AC.set_value(dest)
+        self.data_path.INL.set_value(source_l)
 
-                assert source_l.address == OperandAddress.REGISTER, "Currently, not supported"
-                assert source_r.address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
+        self.data_path.R0.set_value(source_r)
+        self.read_from_mem(self.data_path.R0, self.data_path.INR)
 
-                self._move(self.register_num_to_register(source_l.value), self.data_path.INL)
+        self.data_path.alu.perform_operation(AluOperation.SUB)
+        self.write_to_mem(self.data_path.AC, self.data_path.OUT)
 
-                self.data_path.AC.set_value(source_r.value)
-                self._move(self.data_path.AC, self.data_path.INR)
+    def _cmp_memory(self, source_l: int, source_r: int) -> None:
+        operation = AluOperation.SUB
 
-                self.data_path.alu.perform_operation(alu_op, "C")
-                self._move(self.data_path.OUT, self.register_num_to_register(source_l.value))
+        self.data_path.AC.set_value(source_l)
+        self.data_path.BR.set_value(source_r)
 
-            case CommandName.DEC:
-                dest = command.operands[0]
-                assert dest.address == OperandAddress.REGISTER, "Currently, not supported"
+        for _ in range(3):
+            self._move(self.data_path.AC, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.AC)
 
-                self._move(self.register_num_to_register(dest.value), self.data_path.INL)
-                self.data_path.alu.perform_operation(AluOperation.DECL)
-                self._move(self.data_path.OUT, self.register_num_to_register(dest.value))
+            self._move(self.data_path.BR, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.INCR)
+            self._move(self.data_path.OUT, self.data_path.BR)
 
-            case CommandName.INC:
-                dest = command.operands[0]
-                assert dest.address == OperandAddress.REGISTER, "Currently, not supported"
+        for i in range(4):
+            self.read_from_mem(self.data_path.AC, self.data_path.INL)
+            self.read_from_mem(self.data_path.BR, self.data_path.INR)
 
-                self._move(self.register_num_to_register(dest.value), self.data_path.INL)
-                self.data_path.alu.perform_operation(AluOperation.INCL)
-                self._move(self.data_path.OUT, self.register_num_to_register(dest.value))
+            self.data_path.alu.perform_operation(operation)
 
-            case CommandName.LD:
-                to_ = command.operands[0]
-                from_ = command.operands[1]
+            if self.data_path.alu.flags['Z'] == 0 or i == 3:
+                break
 
-                assert to_.address == OperandAddress.REGISTER, "Currently, not supported"
-                assert from_.address == OperandAddress.REGISTER, "Currently, not supported"
+            self._move(self.data_path.AC, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.DECR)
+            self._move(self.data_path.OUT, self.data_path.AC)
 
-                self.read_from_mem(self.register_num_to_register(from_.value), self.register_num_to_register(to_.value))
+            self._move(self.data_path.BR, self.data_path.INR)
+            self.data_path.alu.perform_operation(AluOperation.DECR)
+            self._move(self.data_path.OUT, self.data_path.BR)
 
-            case CommandName.ST:
-                to_ = command.operands[0]
-                from_ = command.operands[1]
+    def _cmp_register(self, register: Register, value: int) -> None:
+        self._move(register, self.data_path.INL)
 
-                assert to_.address == OperandAddress.REGISTER, "Currently, not supported"
-                assert from_.address == OperandAddress.REGISTER, "Currently, not supported"
+        if register != self.data_path.AC:
+            self.data_path.AC.set_value(value)
+            self._move(self.data_path.AC, self.data_path.INR)
+        else:
+            self.data_path.BR.set_value(value)
+            self._move(self.data_path.BR, self.data_path.INR)
 
-                self.write_to_mem(self.register_num_to_register(to_.value), self.register_num_to_register(from_.value))
+        self.data_path.alu.perform_operation(AluOperation.SUB)
 
-            case CommandName.OUT:
-                port = command.operands[0]
+    def _shift(self, operation: AluOperation, register: Register, value: int) -> None:
+        self._move(register, self.data_path.INL)
 
-                self.data_path.ports[port.value].register.set_value(self.data_path.IOR.get_value())
-                self.data_path.ports[port.value].after_perform_action()
+        self.data_path.AC.set_value(value)
+        self._move(self.data_path.AC, self.data_path.INR)
 
-            case CommandName.IN:
-                port = command.operands[0]
+        self.data_path.alu.perform_operation(operation, "C")
+        self._move(self.data_path.OUT, register)
 
-                self.data_path.IOR.set_value(self.data_path.ports[port.value].register.get_value())
-                self.data_path.ports[port.value].after_perform_action()
+    def _step(self, operation: AluOperation, register: Register) -> None:
+        self._move(register, self.data_path.INL)
+        self.data_path.alu.perform_operation(operation)
+        self._move(self.data_path.OUT, register)
 
-            case CommandName.JE:
-                if self.data_path.alu.flags['Z'] == 1:
-                    self._next_command(command.operands[0].value)
-                    return
+    def _ld(self, address_register: Register, to_register: Register) -> None:
+        self.read_from_mem(address_register, to_register)
 
-            case CommandName.JNE:
-                if self.data_path.alu.flags['Z'] == 0:
-                    self._next_command(command.operands[0].value)
-                    return
+    def _st(self, address_register: Register, data_register: Register) -> None:
+        self.write_to_mem(address_register, data_register)
 
-            case CommandName.JAE:
-                if self.data_path.alu.flags['N'] == 0:
-                    self._next_command(command.operands[0].value)
-                    return
+    def _out(self, device: IoDevice) -> None:
+        device.register.set_value(self.data_path.IOR.get_value())
+        device.after_perform_action()
 
-            case CommandName.JMP:
-                self._next_command(command.operands[0].value)
-                return
+    def _in(self, device: IoDevice) -> None:
+        self.data_path.IOR.set_value(device.register.get_value())
+        device.after_perform_action()
 
-            case _:
-                raise NotImplementedError(f'No info about execution {command_name}')
+    def register_values(self) -> list[int]:
+        return [getattr(self.data_path, name).get_value() for name in REGISTER_NAMES]
+
+    def memory_snapshot(self) -> bytes:
+        return self.data_path.data_memory.snapshot()
 
-        self._next_command()
+    def reset(self, memory: bytes, in_buffer: list[str]) -> None:
+        self.data_path.reset(in_buffer)
+        self.data_path.data_memory.fill_data(memory)
+        self.command_pointer = 0
 
     def __str__(self) -> str:
         registers = list(
@@ -1,8 +1,44 @@
+from __future__ import annotations
+
+import dataclasses
 import enum
+from dataclasses import dataclass
 
 from csa_lab3.isa import MemoryWord
 
 
+@dataclass
+class TickCounter:
+    """Clock ticks of the data path, one per bus transfer, memory signal and ALU operation."""
+    bus: int = 0
+    memory_read: int = 0
+    memory_write: int = 0
+    alu: int = 0
+
+    def total(self) -> int:
+        return self.bus + self.memory_read + self.memory_write + self.alu
+
+    def reset(self) -> None:
+        # the counter is shared with the components, so it is cleared in place
+        self.bus = self.memory_read = self.memory_write = self.alu = 0
+
+    def copy(self) -> TickCounter:
+        return dataclasses.replace(self)
+
+    def as_tuple(self) -> tuple[int, int, int, int]:
+        return self.bus, self.memory_read, self.memory_write, self.alu
+
+    def __add__(self, other: TickCounter) -> TickCounter:
+        return TickCounter(*(a + b for a, b in zip(self.as_tuple(), other.as_tuple())))
+
+    def __sub__(self, other: TickCounter) -> TickCounter:
+        return TickCounter(*(a - b for a, b in zip(self.as_tuple(), other.as_tuple())))
+
+    def __str__(self) -> str:
+        return (f"{self.total()} (bus {self.bus}, read {self.memory_read}, write {self.memory_write}, "
+                f"alu {self.alu})")
+
+
 class Register:
     def __init__(self, num_of_bits: int = 8, name: str = "Unknown"):
         self.num_of_bits = num_of_bits  # bits of data
@@ -44,36 +80,51 @@ class Register:
 
 
 class Memory:
-    def __init__(self, address_register: Register, data_register: Register):
+    def __init__(self, address_register: Register, data_register: Register, ticks: TickCounter | None = None):
         self.address_register = address_register
         self.data_register = data_register
+        self.ticks = TickCounter() if ticks is None else ticks
 
         self.max_size = 1 << self.address_register.num_of_bits
-        self.memory: dict[int, MemoryWord] = {}
+        self.memory = bytearray(self.max_size)
+
+    def fill_data(self, data: bytes | list[MemoryWord]) -> None:
+        if isinstance(data, list):
+            data = bytes(word.value for word in data[:self.max_size])
 
-    def fill_data(self, data: list[MemoryWord]) -> None:
-        for addr, value in enumerate(data, start=0):
-            self.memory[addr] = value
+        size = min(len(data), self.max_size)
+        self.memory[:size] = data[:size]
+
+    def clear(self) -> None:
+        self.memory[:] = bytes(self.max_size)
 
     def signal_write(self) -> None:
-        self.memory[self.address_register.get_value()] = MemoryWord(self.data_register.get_value())
+        self.ticks.memory_write += 1
+        self.memory[self.address_register.get_value()] = self.data_register.get_value()
 
     def signal_read(self) -> None:
-        if self.address_register.get_value() in self.memory:
-            self.data_register.set_value(self.memory[self.address_register.get_value()].value)
-        else:
-            self.data_register.set_value(0)
+        self.ticks.memory_read += 1
+        self.data_register.set_value(self.memory[self.address_register.get_value()])
+
+    def snapshot(self) -> bytes:
+        return bytes(self.memory)
+
+    def __getitem__(self, addr: int) -> MemoryWord:
+        """Word view of a cell for callers which work with MemoryWord."""
+        return MemoryWord(self.memory[addr])
 
 
 class Bus:
-    def __init__(self) -> None:
+    def __init__(self, ticks: TickCounter | None = None) -> None:
         self.value = 0
         self.registers: list[Register] = []
+        self.ticks = TickCounter() if ticks is None else ticks
 
     def add_register(self, register: Register) -> None:
         self.registers.append(register)
 
     def perform_transfer(self) -> None:
+        self.ticks.bus += 1
         for register in self.registers:
             if register.bit_enabled == 1:
                 self.value = register.get_value()
@@ -104,10 +155,12 @@ class AluOperation(enum.Enum):
 
 
 class Alu:
-    def __init__(self, in_register_left: Register, in_register_right: Register, out_register: Register):
+    def __init__(self, in_register_left: Register, in_register_right: Register, out_register: Register,
+                 ticks: TickCounter | None = None):
         self.in_register_left = in_register_left
         self.in_register_right = in_register_right
         self.out_register = out_register
+        self.ticks = TickCounter() if ticks is None else ticks
 
         self.bits = self.out_register.num_of_bits
 
@@ -122,6 +175,7 @@ class Alu:
         return ((num ^ ((1 << self.bits) - 1)) + 1) % (1 << self.bits)
 
     def perform_operation(self, operation: AluOperation, flags: str = "NZVC") -> None:
+        self.ticks.alu += 1
         match operation:
             case AluOperation.ADD:
                 left = self.in_register_left.get_value()
@@ -238,6 +292,11 @@ class StdIn(IoDevice):
         self.counter = 0
         self.after_perform_action()
 
+    def reset(self, buffer: list[str]) -> None:
+        self.buffer = buffer
+        self.counter = 0
+        self.after_perform_action()
+
     def after_perform_action(self) -> None:
         if self.counter >= len(self.buffer):
             self.register.set_value(0)
@@ -271,7 +330,9 @@ class DataPath:
 
         self.IOR = Register(name='IOR')  # I/O data
 
-        self.data_bus = Bus()
+        self.ticks = TickCounter()
+
+        self.data_bus = Bus(self.ticks)
         self.data_bus.add_register(self.OUT)
         self.data_bus.add_register(self.AC)
         self.data_bus.add_register(self.BR)
@@ -282,9 +343,9 @@ class DataPath:
         self.data_bus.add_register(self.INL)
         self.data_bus.add_register(self.INR)
 
-        self.data_memory = Memory(data_register=self.DR, address_register=self.DP)
+        self.data_memory = Memory(data_register=self.DR, address_register=self.DP, ticks=self.ticks)
 
-        self.alu = Alu(in_register_left=self.INL, in_register_right=self.INR, out_register=self.OUT)
+        self.alu = Alu(in_register_left=self.INL, in_register_right=self.INR, out_register=self.OUT, ticks=self.ticks)
 
         self.stdin = StdIn(Register(name="stdin"), in_buffer)
         self.stdout = StdOut(Register(name="stdout"))
@@ -293,3 +354,17 @@ class DataPath:
             0: self.stdin,
             1: self.stdout
         }
+
+    def reset(self, in_buffer: list[str]) -> None:
+        """Returns to the initial state with a new input, the components stay the same objects."""
+        for register in self.data_bus.registers:
+            register.set_value(0)
+        self.data_bus.value = 0
+
+        self.data_memory.clear()
+        for flag in self.alu.flags:
+            self.alu.flags[flag] = 0
+        self.ticks.reset()
+
+        self.stdin.reset(in_buffer)
+        self.stdout.buffer.clear()
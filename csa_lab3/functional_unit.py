@@ -0,0 +1,494 @@
+import functools
+from typing import Callable
+
+from csa_lab3.control_unit import CommandSequencer, Handler, REGISTER_NAMES
+from csa_lab3.data_path import IoDevice, Register, StdIn, StdOut, TickCounter
+from csa_lab3.isa import CommandName, Command, MemoryWord, OperandAddress
+
+# indexes in FunctionalUnit.registers, the order of REGISTER_NAMES
+AC, BR, R0, IOR, INL, INR, OUT, DR, DP = range(len(REGISTER_NAMES))
+
+# order of registers in the trace, the same as sorted register strings of ControlUnit
+TRACE_ORDER = (AC, BR, DP, DR, INL, INR, IOR, OUT, R0)
+
+MEMORY_SIZE = 1 << 8
+
+
+class FunctionalUnit(CommandSequencer):
+    """Instruction-level model of the processor.
+
+    Executes the same programs as ControlUnit with DataPath, but each command updates plain integer registers,
+    flags and a byte array of data memory directly instead of going through the bus, memory and ALU signals.
+    Registers, flags and tick counts hold the same values as in the reference model after every command.
+    """
+
+    def __init__(self, commands: list[Command], memory: bytes | list[MemoryWord], in_buffer: list[str]):
+        self.registers = [0] * len(REGISTER_NAMES)
+
+        image = bytes(word.value for word in memory[:MEMORY_SIZE]) if isinstance(memory, list) else memory[:MEMORY_SIZE]
+
+        self.memory = bytearray(MEMORY_SIZE)
+        self.memory[:len(image)] = image
+
+        self.stdin = StdIn(Register(name="stdin"), in_buffer)
+        self.stdout = StdOut(Register(name="stdout"))
+
+        self.ports: dict[int, IoDevice] = {
+            0: self.stdin,
+            1: self.stdout
+        }
+
+        super().__init__(commands, dict.fromkeys("NZVC", 0), TickCounter())
+
+    def _bind_handler(self, command: Command) -> Handler:
+        command_name = command.name
+        operands = [(o.address, o.value % MEMORY_SIZE) for o in command.operands]
+
+        match command_name:
+            case CommandName.MOV:
+                (dest_address, dest), (source_address, source) = operands[0], operands[1]
+
+                load: Callable[[], None] = self._nop
+                match source_address:
+                    case OperandAddress.DIRECT_LOAD:
+                        load = functools.partial(self._load_direct, source)
+                    case OperandAddress.MEMORY_DIRECT:
+                        load = functools.partial(self._load_memory, source)
+
+                store: Callable[[], None] = self._nop
+                match dest_address:
+                    case OperandAddress.DIRECT_LOAD | OperandAddress.MEMORY_DIRECT:
+                        store = functools.partial(self._store_memory, dest)
+                    case OperandAddress.REGISTER:
+                        store = functools.partial(self._store_register, self._register_index(dest))
+
+                return functools.partial(self._mov, load, store)
+
+            case CommandName.MOV4:
+                (dest_address, dest), (source_address, source) = operands[0], operands[1]
+
+                assert dest_address == OperandAddress.MEMORY_DIRECT, "Insensible move"
+
+                match source_address:
+                    case OperandAddress.DIRECT_LOAD:
+                        return functools.partial(self._mov4_direct, dest, source)
+                    case OperandAddress.MEMORY_DIRECT:
+                        return functools.partial(self._mov4_memory, dest, source)
+                    case _:
+                        return self._nop
+
+            case CommandName.ADD1:
+                (dest_address, dest), (source_address, source) = operands[0], operands[1]
+
+                assert dest_address == OperandAddress.REGISTER, "Bad add1"
+                assert source_address == OperandAddress.DIRECT_LOAD, "Bad add1"
+
+                return functools.partial(self._add1, self._register_index(dest), source)
+
+            case CommandName.ADD:
+                (dest_address, dest), (left_address, left), (right_address, right) = operands[0:3]
+
+                assert dest_address == OperandAddress.MEMORY_DIRECT, "Insensible add"
+
+                return functools.partial(
+                    self._add,
+                    dest,
+                    left, left_address == OperandAddress.DIRECT_LOAD,
+                    right, right_address == OperandAddress.DIRECT_LOAD
+                )
+
+            case CommandName.SUB:
+                (dest_address, dest), (left_address, left), (_, right) = operands[0:3]
+
+                assert dest_address == OperandAddress.MEMORY_DIRECT, "Insensible sub"
+                assert left_address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
+
+                return functools.partial(self._sub, dest, left, right)
+
+            case CommandName.CMP:
+                (left_address, left), (right_address, right) = operands[0], operands[1]
+
+                if left_address == OperandAddress.MEMORY_DIRECT and right_address == OperandAddress.MEMORY_DIRECT:
+                    return functools.partial(self._cmp_memory, left, right)
+
+                if left_address == OperandAddress.REGISTER and right_address == OperandAddress.DIRECT_LOAD:
+                    return functools.partial(self._cmp_register, self._register_index(left), right)
+
+                raise ValueError("Currently, not supported")
+
+            case CommandName.SHL | CommandName.SHR:
+                (left_address, left), (right_address, right) = operands[0], operands[1]
+
+                assert left_address == OperandAddress.REGISTER, "Currently, not supported"
+                assert right_address == OperandAddress.DIRECT_LOAD, "Currently, not supported"
+
+                shift = self._shl if command_name == CommandName.SHL else self._shr
+                return functools.partial(shift, self._register_index(left), right)
+
+            case CommandName.DEC | CommandName.INC:
+                dest_address, dest = operands[0]
+                assert dest_address == OperandAddress.REGISTER, "Currently, not supported"
+
+                step = self._dec if command_name == CommandName.DEC else self._inc
+                return functools.partial(step, self._register_index(dest))
+
+            case CommandName.LD | CommandName.ST:
+                (to_address, to_), (from_address, from_) = operands[0], operands[1]
+
+                assert to_address == OperandAddress.REGISTER, "Currently, not supported"
+                assert from_address == OperandAddress.REGISTER, "Currently, not supported"
+
+                if command_name == CommandName.LD:
+                    return functools.partial(self._ld, self._register_index(from_), self._register_index(to_))
+                return functools.partial(self._st, self._register_index(to_), self._register_index(from_))
+
+            case CommandName.OUT:
+                return functools.partial(self._out, self.ports[command.operands[0].value])
+
+            case CommandName.IN:
+                return functools.partial(self._in, self.ports[command.operands[0].value])
+
+            case _:
+                raise NotImplementedError(f'No info about execution {command_name}')
+
+    @staticmethod
+    def _register_index(s: int) -> int:
+        if s not in (AC, BR, R0, IOR):
+            raise ValueError(f"Unknown register: {s}")
+        return s
+
+    # ALU, the same arithmetic and flags as data_path.Alu over INL, INR and OUT
+
+    def _set_nzv(self, result: int, left: int, right: int) -> None:
+        flags = self.flags
+        flags['N'] = (result >> 7) & 1
+        flags['Z'] = int(result & 0xFF == 0)
+        l_bit = left & 0x80
+        flags['V'] = int(l_bit == right & 0x80 and l_bit != result & 0x80)
+
+    def _alu_add(self) -> None:
+        r = self.registers
+        left, right = r[INL], r[INR]
+        result = left + right + self.flags['C']
+        r[OUT] = result & 0xFF
+        self._set_nzv(result, left, right)
+        self.flags['C'] = int(result > MEMORY_SIZE)
+
+    def _alu_sub(self) -> None:
+        r = self.registers
+        left, right = r[INL], r[INR]
+        result = left + (((right ^ 0xFF) + 1) & 0xFF)
+        r[OUT] = result & 0xFF
+        self._set_nzv(result, left, right)
+        self.flags['C'] = int(result > MEMORY_SIZE)
+
+    def _alu_step(self, result: int) -> None:
+        r = self.registers
+        r[OUT] = result & 0xFF
+        self._set_nzv(result, r[INL], r[INR])
+
+    # commands
+
+    def _load_direct(self, value: int) -> None:
+        self.registers[AC] = value
+
+    def _load_memory(self, address: int) -> None:
+        self.ticks.bus += 2
+        self.ticks.memory_read += 1
+
+        r = self.registers
+        r[DP] = address
+        r[AC] = r[DR] = self.memory[address]
+
+    def _store_memory(self, address: int) -> None:
+        self.ticks.bus += 2
+        self.ticks.memory_write += 1
+
+        r = self.registers
+        r[BR] = r[DP] = address
+        self.memory[address] = r[DR] = r[AC]
+
+    def _store_register(self, register: int) -> None:
+        self.ticks.bus += 1
+        self.registers[register] = self.registers[AC]
+
+    @staticmethod
+    def _mov(load: Callable[[], None], store: Callable[[], None]) -> None:
+        load()
+        store()
+
+    def _mov4_direct(self, dest: int, value: int) -> None:
+        r, memory = self.registers, self.memory
+        ticks = self.ticks
+        ticks.bus += 14
+        ticks.memory_write += 4
+        ticks.alu += 3
+
+        r[BR] = r[DP] = dest
+        memory[dest] = r[DR] = value
+        r[AC] = 0
+
+        for _ in range(1, 4):
+            r[INR] = r[BR]
+            self._alu_step(r[INR] + 1)
+            r[BR] = r[DP] = r[OUT]
+            memory[r[DP]] = r[DR] = 0
+
+    def _mov4_memory(self, dest: int, source: int) -> None:
+        r, memory = self.registers, self.memory
+        ticks = self.ticks
+        ticks.bus += 33
+        ticks.memory_read += 4
+        ticks.memory_write += 4
+        ticks.alu += 8
+
+        r[AC] = r[R0] = source
+        r[BR] = dest
+
+        for _ in range(0, 4):
+            r[DP] = r[R0]
+            r[AC] = r[DR] = memory[r[DP]]
+            r[DP] = r[BR]
+            memory[r[DP]] = r[DR] = r[AC]
+
+            r[INR] = r[R0]
+            self._alu_step(r[INR] + 1)
+            r[R0] = r[OUT]
+
+            r[INR] = r[BR]
+            self._alu_step(r[INR] + 1)
+            r[BR] = r[OUT]
+
+    def _add1(self, register: int, value: int) -> None:
+        r = self.registers
+        self.ticks.bus += 3
+        self.ticks.alu += 1
+
+        self.flags['C'] = 0
+        r[INL] = r[register]
+        r[register] = r[INR] = value
+
+        self._alu_add()
+        r[register] = r[OUT]
+
+    def _add(self, dest: int, source_l: int, expand_sl: bool, source_r: int, expand_sr: bool) -> None:
+        r, memory = self.registers, self.memory
+        # operands in memory are read before the loop and after each of the 4 steps
+        in_memory = int(not expand_sl) + int(not expand_sr)
+        ticks = self.ticks
+        ticks.bus += 16 + 18 * in_memory
+        ticks.memory_read += 5 * in_memory
+        ticks.memory_write += 4
+        ticks.alu += 8 + 4 * in_memory
+
+        self.flags['C'] = 0
+
+        r[AC] = dest
+
+        r[BR] = source_l
+        if expand_sl:
+            r[INL] = source_l
+        else:
+            r[DP] = source_l
+            r[INL] = r[DR] = memory[source_l]
+
+        r[R0] = source_r
+        if expand_sr:
+            r[INR] = source_r
+        else:
+            r[DP] = source_r
+            r[INR] = r[DR] = memory[source_r]
+
+        for _ in range(0, 4):
+            self._alu_add()
+
+            r[DP] = r[AC]
+            memory[r[DP]] = r[DR] = r[OUT]
+
+            r[INR] = r[AC]
+            self._alu_step(r[INR] + 1)
+            r[AC] = r[OUT]
+
+            if not expand_sl:
+                r[INR] = r[BR]
+                self._alu_step(r[INR] + 1)
+                r[BR] = r[DP] = r[OUT]
+                r[INL] = r[DR] = memory[r[DP]]
+            else:
+                r[INL] = 0
+
+            if not expand_sr:
+                r[INR] = r[R0]
+                self._alu_step(r[INR] + 1)
+                r[R0] = r[DP] = r[OUT]
+                r[INR] = r[DR] = memory[r[DP]]
+            else:
+                r[INR] = 0
+
+    def _sub(self, dest: int, source_l: int, source_r: int) -> None:
+        r, memory = self.registers, self.memory
+        ticks = self.ticks
+        ticks.bus += 4
+        ticks.memory_read += 1
+        ticks.memory_write += 1
+        ticks.alu += 1
+
+        r[AC] = dest
+        r[INL] = source_l
+
+        r[R0] = r[DP] = source_r
+        r[INR] = r[DR] = memory[source_r]
+
+        self._alu_sub()
+        r[DP] = dest
+        memory[dest] = r[DR] = r[OUT]
+
+    def _cmp_memory(self, source_l: int, source_r: int) -> None:
+        r, memory = self.registers, self.memory
+        ticks = self.ticks
+        ticks.bus += 12
+        ticks.alu += 6
+
+        r[AC] = source_l
+        r[BR] = source_r
+
+        for _ in range(3):
+            r[INR] = r[AC]
+            self._alu_step(r[INR] + 1)
+            r[AC] = r[OUT]
+
+            r[INR] = r[BR]
+            self._alu_step(r[INR] + 1)
+            r[BR] = r[OUT]
+
+        for i in range(4):
+            ticks.bus += 4
+            ticks.memory_read += 2
+            ticks.alu += 1
+
+            r[INL] = memory[r[AC]]
+            r[DP] = r[BR]
+            r[INR] = r[DR] = memory[r[BR]]
+
+            self._alu_sub()
+
+            if self.flags['Z'] == 0 or i == 3:
+                break
+
+            ticks.bus += 4
+            ticks.alu += 2
+
+            r[INR] = r[AC]
+            self._alu_step(r[INR] + 0xFF)
+            r[AC] = r[OUT]
+
+            r[INR] = r[BR]
+            self._alu_step(r[INR] + 0xFF)
+            r[BR] = r[OUT]
+
+    def _cmp_register(self, register: int, value: int) -> None:
+        r = self.registers
+        self.ticks.bus += 2
+        self.ticks.alu += 1
+
+        r[INL] = r[register]
+
+        if register != AC:
+            r[AC] = r[INR] = value
+        else:
+            r[BR] = r[INR] = value
+
+        self._alu_sub()
+
+    def _shl(self, register: int, value: int) -> None:
+        r = self.registers
+        self.ticks.bus += 3
+        self.ticks.alu += 1
+
+        r[INL] = r[register]
+        r[AC] = r[INR] = value
+
+        result = r[INL] << value
+        r[register] = r[OUT] = result & 0xFF
+        self.flags['C'] = int(result > MEMORY_SIZE)
+
+    def _shr(self, register: int, value: int) -> None:
+        r = self.registers
+        self.ticks.bus += 3
+        self.ticks.alu += 1
+
+        r[INL] = r[register]
+        r[AC] = r[INR] = value
+
+        result = r[INL] >> value
+        r[register] = r[OUT] = result
+        self.flags['C'] = 0
+
+    def _dec(self, register: int) -> None:
+        r = self.registers
+        self.ticks.bus += 2
+        self.ticks.alu += 1
+
+        r[INL] = r[register]
+        self._alu_step(r[INL] + 0xFF)
+        r[register] = r[OUT]
+
+    def _inc(self, register: int) -> None:
+        r = self.registers
+        self.ticks.bus += 2
+        self.ticks.alu += 1
+
+        r[INL] = r[register]
+        self._alu_step(r[INL] + 1)
+        r[register] = r[OUT]
+
+    def _ld(self, address_register: int, to_register: int) -> None:
+        r = self.registers
+        self.ticks.bus += 2
+        self.ticks.memory_read += 1
+
+        r[DP] = r[address_register]
+        r[to_register] = r[DR] = self.memory[r[DP]]
+
+    def _st(self, address_register: int, data_register: int) -> None:
+        r = self.registers
+        self.ticks.bus += 2
+        self.ticks.memory_write += 1
+
+        r[DP] = r[address_register]
+        r[DR] = r[data_register]
+        self.memory[r[DP]] = r[DR]
+
+    def _out(self, device: IoDevice) -> None:
+        device.register.set_value(self.registers[IOR])
+        device.after_perform_action()
+
+    def _in(self, device: IoDevice) -> None:
+        self.registers[IOR] = device.register.get_value()
+        device.after_perform_action()
+
+    def register_values(self) -> list[int]:
+        return list(self.registers)
+
+    def memory_snapshot(self) -> bytes:
+        return bytes(self.memory)
+
+    def reset(self, memory: bytes, in_buffer: list[str]) -> None:
+        # handlers keep references to these objects, so they are cleared in place
+        self.registers[:] = [0] * len(REGISTER_NAMES)
+        for flag in self.flags:
+            self.flags[flag] = 0
+        self.ticks.reset()
+
+        image = memory[:MEMORY_SIZE]
+        self.memory[:] = bytes(MEMORY_SIZE)
+        self.memory[:len(image)] = image
+
+        self.stdin.reset(in_buffer)
+        self.stdout.buffer.clear()
+        self.command_pointer = 0
+
+    def __str__(self) -> str:
+        registers = [f'{REGISTER_NAMES[i]}: {hex(self.registers[i])[2:].upper().zfill(2)}' for i in TRACE_ORDER]
+        registers.append(", ".join([f'{i}: {j}' for i, j in self.flags.items()]))
+        return " | ".join(registers)
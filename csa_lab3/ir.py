@@ -0,0 +1,387 @@
+"""Intermediate representation between the AST and the commands.
+
+A program is a control-flow graph of basic blocks. A block holds instructions without jumps and ends with a
+terminator: an unconditional jump, a conditional branch or the halt. The order of the blocks in the graph is
+the layout of the code, lowering omits jumps to the next block.
+
+An instruction is a command of the machine over values: variables, temporaries, literals, string addresses and
+registers. The code generator places variables and literals in data memory as it meets them, lowering asks it
+for the operand of every value and turns instructions into MOV, MOV4, ADD, CMP and the other commands.
+
+Passes take the graph and return whether they changed it, PassManager runs them until none does.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable
+
+from csa_lab3.isa import Command, CommandName, Operand, OperandAddress, JUMP_COMMANDS, command_length
+
+
+@dataclass(frozen=True)
+class Var:
+    """Word of a variable in data memory."""
+    name: str
+
+    def __str__(self) -> str:
+        return self.name
+
+
+@dataclass(frozen=True)
+class Temp:
+    """Word of data memory which only the code uses, it is placed after the data of the program."""
+    index: int
+
+    def __str__(self) -> str:
+        return f"%{self.index}"
+
+
+@dataclass(frozen=True)
+class Literal:
+    """Int or char, at its own word of data memory if it has one, loaded directly otherwise."""
+    value: int
+    word: int | None = None
+
+    def __str__(self) -> str:
+        return str(self.value) if self.word is None else f"{self.value}@{self.word:02x}"
+
+
+@dataclass(frozen=True)
+class Str:
+    """Address of a string literal by its index, the characters are placed at the end of the program."""
+    index: int
+
+    def __str__(self) -> str:
+        return f"&str{self.index}"
+
+
+@dataclass(frozen=True)
+class AddressOf:
+    """Address of the word of a variable plus an offset, loaded directly."""
+    variable: Var
+    offset: int = 0
+
+    def __str__(self) -> str:
+        return f"&{self.variable}" + (f"+{self.offset}" if self.offset else "")
+
+
+@dataclass(frozen=True)
+class Reg:
+    index: int
+
+    def __str__(self) -> str:
+        return str(Operand(OperandAddress.REGISTER, self.index))
+
+
+Value = Var | Temp | Literal | Str | AddressOf | Reg
+
+# operand of a value in the lowered command
+Placement = Callable[[Value], Operand]
+
+
+def fixed_operand(value: Value) -> Operand:
+    """Operand of a literal or a register, the other values are placed by the code generator."""
+    match value:
+        case Literal(value=number, word=None):
+            return Operand(OperandAddress.DIRECT_LOAD, number)
+        case Literal(word=int() as word):
+            return Operand(OperandAddress.MEMORY_DIRECT, word)
+        case Reg(index=index):
+            return Operand(OperandAddress.REGISTER, index)
+    raise ValueError(f"No operand of {value}")
+
+
+@dataclass
+class Instr:
+    name: CommandName
+    operands: list[Value] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        assert self.name not in JUMP_COMMANDS and self.name != CommandName.HLT, "Control flow goes to terminators"
+
+    def __str__(self) -> str:
+        return " ".join([self.name.name, ", ".join(str(operand) for operand in self.operands)]).strip()
+
+
+@dataclass(eq=False)
+class Jump:
+    target: Block
+
+    def successors(self) -> list[Block]:
+        return [self.target]
+
+    def __str__(self) -> str:
+        return f"jump {self.target.name}"
+
+
+@dataclass(eq=False)
+class Branch:
+    """Goes to if_true when the jump command would be taken, to if_false otherwise."""
+    condition: CommandName
+    if_true: Block
+    if_false: Block
+
+    def __post_init__(self) -> None:
+        assert self.condition in JUMP_COMMANDS and self.condition != CommandName.JMP, "Not a conditional jump"
+
+    def successors(self) -> list[Block]:
+        return [self.if_true, self.if_false]
+
+    def __str__(self) -> str:
+        return f"branch {self.condition.name} {self.if_true.name}, {self.if_false.name}"
+
+
+@dataclass(eq=False)
+class Halt:
+    @staticmethod
+    def successors() -> list[Block]:
+        return []
+
+    def __str__(self) -> str:
+        return "halt"
+
+
+Terminator = Jump | Branch | Halt
+
+
+@dataclass(eq=False)
+class Block:
+    label: int
+    instrs: list[Instr] = field(default_factory=list)
+    terminator: Terminator | None = None
+
+    @property
+    def name(self) -> str:
+        return f"L{self.label}"
+
+    def successors(self) -> list[Block]:
+        return [] if self.terminator is None else self.terminator.successors()
+
+    def __str__(self) -> str:
+        lines = [f"{self.name}:"] + [f"    {instr}" for instr in self.instrs]
+        lines.append(f"    {self.terminator if self.terminator is not None else '--'}")
+        return "\n".join(lines)
+
+
+class Cfg:
+    def __init__(self) -> None:
+        # layout of the code, the first block is the entry
+        self.blocks: list[Block] = []
+        self.labels = 0
+        self.temps = 0
+
+    def new_block(self) -> Block:
+        """A block which is not placed in the layout yet."""
+        self.labels += 1
+        return Block(self.labels - 1)
+
+    def new_temp(self) -> Temp:
+        self.temps += 1
+        return Temp(self.temps - 1)
+
+    def place(self, block: Block) -> None:
+        self.blocks.append(block)
+
+    @property
+    def entry(self) -> Block:
+        return self.blocks[0]
+
+    def predecessors(self) -> dict[int, list[Block]]:
+        predecessors: dict[int, list[Block]] = {block.label: [] for block in self.blocks}
+        for block in self.blocks:
+            for successor in block.successors():
+                predecessors[successor.label].append(block)
+        return predecessors
+
+    def __str__(self) -> str:
+        return "\n".join(str(block) for block in self.blocks)
+
+
+Pass = Callable[[Cfg], bool]
+
+
+class PassManager:
+    def __init__(self, passes: list[Pass], max_rounds: int = 16):
+        self.passes = passes
+        self.max_rounds = max_rounds
+
+    def run(self, cfg: Cfg) -> list[str]:
+        """Runs the passes in order until none changes the graph, returns the names of the passes which did."""
+        applied = []
+        for _ in range(self.max_rounds):
+            changed = False
+            for optimization in self.passes:
+                if optimization(cfg):
+                    applied.append(optimization.__name__)
+                    changed = True
+            if not changed:
+                break
+        return applied
+
+
+def _forward(block: Block) -> Block:
+    """The block control reaches first through empty blocks which only jump."""
+    seen = set()
+    while not block.instrs and isinstance(block.terminator, Jump) and block.label not in seen:
+        seen.add(block.label)
+        block = block.terminator.target
+    return block
+
+
+def thread_jumps(cfg: Cfg) -> bool:
+    """Jumps and branches to empty blocks which only jump go to the final target directly."""
+    changed = False
+    for block in cfg.blocks:
+        match block.terminator:
+            case Jump(target=target) if _forward(target) is not target:
+                block.terminator = Jump(_forward(target))
+                changed = True
+            case Branch(condition=condition, if_true=if_true, if_false=if_false) \
+                    if _forward(if_true) is not if_true or _forward(if_false) is not if_false:
+                block.terminator = Branch(condition, _forward(if_true), _forward(if_false))
+                changed = True
+    return changed
+
+
+def rotate_loops(cfg: Cfg) -> bool:
+    """Moves a loop head which ends with a branch out of the loop after the last block which jumps back to it.
+
+    The jump back becomes a fall through into the condition and the branch goes to the body, so an iteration
+    runs the condition and one conditional jump without the unconditional jump. The code before the loop jumps
+    to the condition, which is tested once on entry as before.
+    """
+    positions = {block.label: i for i, block in enumerate(cfg.blocks)}
+    # the last block which jumps back to each head
+    latches: dict[int, int] = {}
+    for i, block in enumerate(cfg.blocks):
+        if isinstance(block.terminator, Jump) and positions[block.terminator.target.label] < i:
+            latches[block.terminator.target.label] = i
+
+    # heads by the position of their latch
+    moved: dict[int, Block] = {}
+    for label, latch in latches.items():
+        head = cfg.blocks[positions[label]]
+        # the exit has to follow the moved head, otherwise it takes a jump on every iteration
+        if (isinstance(head.terminator, Branch) and latch + 1 < len(cfg.blocks)
+                and head.terminator.if_false is cfg.blocks[latch + 1]):
+            moved[latch] = head
+    if not moved:
+        return False
+
+    heads = {head.label for head in moved.values()}
+    blocks = []
+    for i, block in enumerate(cfg.blocks):
+        if block.label not in heads:
+            blocks.append(block)
+        if i in moved:
+            blocks.append(moved[i])
+    cfg.blocks = blocks
+    return True
+
+
+def remove_unreachable_blocks(cfg: Cfg) -> bool:
+    reachable = {cfg.entry.label}
+    stack = [cfg.entry]
+    while stack:
+        for successor in stack.pop().successors():
+            if successor.label not in reachable:
+                reachable.add(successor.label)
+                stack.append(successor)
+
+    blocks = [block for block in cfg.blocks if block.label in reachable]
+    changed = len(blocks) != len(cfg.blocks)
+    cfg.blocks = blocks
+    return changed
+
+
+DEFAULT_PASSES: list[Pass] = [thread_jumps, rotate_loops, remove_unreachable_blocks]
+
+
+# the arithmetic of the machine on words of literals, to fold them without running the code
+
+WORD_BYTES = 4
+
+# flag and value on which a conditional jump is taken, as CommandSequencer binds them
+BRANCH_FLAGS = {CommandName.JE: ("Z", 1), CommandName.JNE: ("Z", 0), CommandName.JAE: ("N", 0)}
+
+
+def _byte(word: int, i: int) -> int:
+    return (word >> (8 * i)) & 0xFF
+
+
+def machine_add(left: int, right: int) -> int:
+    """Word which ADD writes for two words, a byte carries to the next one only when its sum is above 256."""
+    result, carry = 0, 0
+    for i in range(WORD_BYTES):
+        total = _byte(left, i) + _byte(right, i) + carry
+        result |= (total & 0xFF) << (8 * i)
+        carry = int(total > 256)
+    return result
+
+
+def machine_compare(left: int, right: int) -> dict[str, int]:
+    """N and Z flags after CMP of two words in memory.
+
+    Bytes are subtracted from the highest one until the difference is not zero. N is bit 7 of the sum of the left
+    byte with the two's complement of the right one, not the sign of the difference of the words.
+    """
+    flags = {}
+    for i in reversed(range(WORD_BYTES)):
+        total = _byte(left, i) + (((_byte(right, i) ^ 0xFF) + 1) & 0xFF)
+        flags = {"N": (total >> 7) & 1, "Z": int(total & 0xFF == 0)}
+        if not flags["Z"]:
+            break
+    return flags
+
+
+def branch_taken(condition: CommandName, flags: dict[str, int]) -> bool | None:
+    """Whether the conditional jump is taken with the flags, None for the jumps the machine does not implement."""
+    if condition not in BRANCH_FLAGS:
+        return None
+    flag, value = BRANCH_FLAGS[condition]
+    return flags[flag] == value
+
+
+def lower(cfg: Cfg, operand: Placement = fixed_operand) -> list[Command]:
+    """Commands of the blocks in the layout order with addresses and jump targets.
+
+    A branch jumps to its true block and then to its false block, a jump to the next block is omitted.
+    Values of the instructions become the operands which `operand` gives them.
+    """
+    commands: list[Command] = []
+    starts: dict[int, int] = {}
+    jumps: list[tuple[Command, Block]] = []
+
+    def jump(name: CommandName, target: Block) -> None:
+        command = Command(name, [Operand(OperandAddress.DIRECT_LOAD, 0)])
+        commands.append(command)
+        jumps.append((command, target))
+
+    for i, block in enumerate(cfg.blocks):
+        following = cfg.blocks[i + 1] if i + 1 < len(cfg.blocks) else None
+        starts[block.label] = len(commands)
+        commands.extend(Command(instr.name, [operand(value) for value in instr.operands]) for instr in block.instrs)
+
+        match block.terminator:
+            case Jump(target=target):
+                if target is not following:
+                    jump(CommandName.JMP, target)
+            case Branch(condition=condition, if_true=if_true, if_false=if_false):
+                jump(condition, if_true)
+                if if_false is not following:
+                    jump(CommandName.JMP, if_false)
+            case Halt():
+                commands.append(Command(CommandName.HLT))
+            case None:
+                raise ValueError(f"Block {block.name} has no terminator")
+
+    address = 0
+    for command in commands:
+        command.address = address
+        address += command_length(command)
+
+    for command, target in jumps:
+        start = starts[target.label]
+        command.operands[0].value = commands[start].address if start < len(commands) else address
+
+    return commands
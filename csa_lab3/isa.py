@@ -11,10 +11,7 @@ class OperandAddress(enum.Enum):
 
     @staticmethod
     def from_hex(value: int) -> OperandAddress:
-        for c in OperandAddress:
-            if c.value == value:
-                return c
-        raise ValueError
+        return OperandAddress(value)
 
 
 class CommandName(enum.Enum):
@@ -62,10 +59,44 @@ class CommandName(enum.Enum):
 
     @staticmethod
     def from_hex(value: int) -> CommandName:
-        for c in CommandName:
-            if c.value == value:
-                return c
-        raise ValueError
+        return CommandName(value)
+
+
+# command by its opcode byte
+COMMAND_NAMES_BY_CODE: dict[int, CommandName] = {c.value: c for c in CommandName}
+
+# operands of the commands the machine executes or links, the others are rejected when they are executed
+OPERAND_COUNTS: dict[CommandName, int] = {
+    CommandName.NOP: 0, CommandName.HLT: 0,
+    CommandName.INC: 1, CommandName.DEC: 1, CommandName.IN: 1, CommandName.OUT: 1,
+    CommandName.JMP: 1, CommandName.JE: 1, CommandName.JNE: 1, CommandName.JA: 1, CommandName.JAE: 1,
+    CommandName.JB: 1, CommandName.JBE: 1,
+    CommandName.LD: 2, CommandName.ST: 2, CommandName.SHL: 2, CommandName.SHR: 2, CommandName.ADD1: 2,
+    CommandName.CMP: 2, CommandName.MOV: 2, CommandName.MOV4: 2,
+    CommandName.ADD: 3, CommandName.SUB: 3,
+}
+
+
+def _operand_addresses(addresses: int) -> tuple[OperandAddress, ...]:
+    # four 2-bit groups from the high bits, operands end at the first NO_ADDRESS
+    result = []
+    for shift in (6, 4, 2, 0):
+        address = OperandAddress((addresses >> shift) & 0b11)
+        if address == OperandAddress.NO_ADDRESS:
+            break
+        result.append(address)
+    return tuple(result)
+
+
+# addressing of the operands by the addressing byte of a command
+OPERAND_ADDRESSES_BY_BYTE = tuple(_operand_addresses(byte) for byte in range(256))
+
+JUMP_COMMANDS = frozenset({
+    CommandName.JMP,
+    CommandName.JE, CommandName.JNE,
+    CommandName.JA, CommandName.JAE,
+    CommandName.JB, CommandName.JBE,
+})
 
 
 @dataclass
@@ -126,105 +157,143 @@ class MemoryWord:
         return hex(self.value)[2:].zfill(2)
 
 
-def write_commands(commands: list[Command], memory: list[MemoryWord], filename: str) -> None:
-    def splitter(s: str) -> list[str]:
-        return [s[0 + i * 8: 8 + i * 8] for i in range(len(s) // 8)]
+def command_size(cmd: Command) -> int:
+    # address and opcode, then addressing byte and one byte per operand
+    return 2 + (1 + len(cmd.operands) if cmd.operands else 0)
 
-    with open(filename, 'wb') as bin_file:
-        for cmd in commands:
-            for byte in splitter(repr(cmd)):
-                bin_file.write(int(byte, 2).to_bytes(1, 'big'))
 
-    with open(f'{filename}.mem', 'wb') as mem_file:
-        for mw in memory:
-            mem_file.write(int(mw.value).to_bytes(1, 'big'))
+def command_length(cmd: Command) -> int:
+    """Addresses the command takes in instruction memory, the address byte of the encoding is not counted."""
+    return command_size(cmd) - 1
 
-    with open(f'{filename}.txt', 'w', encoding="utf-8") as readable_file:
-        for cmd in commands:
-            readable_file.write(f"{cmd.get_addr()} | {repr(cmd).ljust(6 * 8)} | {str(cmd)}\n")
 
+def encode_commands(commands: list[Command]) -> bytearray:
+    """Encodes commands into machine code, fields are 8 bits wide and a wider address or operand is an error."""
+    code = bytearray(sum(command_size(cmd) for cmd in commands))
 
-def read_commands(filename: str) -> list[Command]:
-    with open(filename, 'rb') as file:
-        data = file.read()
+    counter = 0
+    for cmd in commands:
+        if not 0 <= cmd.address <= 0xFF:
+            raise ValueError(f"Address {cmd.address:#x} of {cmd} is outside of the instruction memory")
+        code[counter] = cmd.address
+        code[counter + 1] = cmd.name.value
+        counter += 2
+
+        if not cmd.operands:
+            continue
+
+        addresses = 0
+        for i, operand in enumerate(cmd.operands):
+            addresses |= operand.address.value << (6 - 2 * i)
+            if not 0 <= operand.value <= 0xFF:
+                raise ValueError(f"Operand {operand.value:#x} of {cmd.get_addr()} | {cmd} does not fit in a byte")
+            code[counter + 1 + i] = operand.value
+        code[counter] = addresses
+        counter += 1 + len(cmd.operands)
+
+    return code
 
-    commands = []
+
+def encode_memory(memory: list[MemoryWord]) -> bytes:
+    return bytes(mw.value for mw in memory)
+
+
+def format_listing(commands: list[Command], code: bytes | bytearray) -> str:
+    lines = []
 
     counter = 0
-    while counter < len(data):
-        command_addr = int.from_bytes(bytes([data[counter]]), byteorder='big')
+    for cmd in commands:
+        size = command_size(cmd)
+        bits = "".join(f"{byte:08b}" for byte in code[counter:counter + size])
+        lines.append(f"{cmd.get_addr()} | {bits.ljust(6 * 8)} | {str(cmd)}\n")
+        counter += size
 
-        counter += 1
-        if counter >= len(data):
-            break
+    return "".join(lines)
 
-        command_name = int.from_bytes(bytes([data[counter]]), byteorder='big')
-        cmd_name = CommandName.from_hex(command_name)
 
-        cmd = Command(cmd_name)
-        cmd.address = command_addr
-        commands.append(cmd)
+@dataclass(frozen=True)
+class ProgramImage:
+    """Translated program held in memory, the contents of the code, .mem and .txt files."""
+    code: bytes
+    memory: bytes
+    listing: str | None = None
 
-        counter += 1
-        if cmd_name in [CommandName.HLT, CommandName.NOP]:
-            continue
 
-        if counter >= len(data):
-            break
+def build_image(commands: list[Command], memory: list[MemoryWord], listing: bool = False) -> ProgramImage:
+    code = bytes(encode_commands(commands))
+    return ProgramImage(code, encode_memory(memory), format_listing(commands, code) if listing else None)
 
-        addresses = bin(int.from_bytes(bytes([data[counter]]), byteorder='big'))[2:].zfill(8)
 
-        op_addr_1 = OperandAddress.from_hex(int(addresses[0:2], 2))
-        op_addr_2 = OperandAddress.from_hex(int(addresses[2:4], 2))
-        op_addr_3 = OperandAddress.from_hex(int(addresses[4:6], 2))
-        op_addr_4 = OperandAddress.from_hex(int(addresses[6:8], 2))
+def write_image(image: ProgramImage, filename: str) -> None:
+    with open(filename, 'wb') as bin_file:
+        bin_file.write(image.code)
 
-        counter += 1
+    with open(f'{filename}.mem', 'wb') as mem_file:
+        mem_file.write(image.memory)
 
-        if op_addr_1 != OperandAddress.NO_ADDRESS:
-            value = int.from_bytes(bytes([data[counter]]), byteorder='big')
-            cmd.operands.append(Operand(op_addr_1, value))
-        else:
-            continue
+    if image.listing is not None:
+        with open(f'{filename}.txt', 'w', encoding="utf-8") as readable_file:
+            readable_file.write(image.listing)
 
-        counter += 1
 
-        if op_addr_2 != OperandAddress.NO_ADDRESS:
-            value = int.from_bytes(bytes([data[counter]]), byteorder='big')
-            cmd.operands.append(Operand(op_addr_2, value))
-        else:
-            continue
+def write_commands(commands: list[Command], memory: list[MemoryWord], filename: str, listing: bool = False) -> None:
+    write_image(build_image(commands, memory, listing), filename)
 
-        counter += 1
 
-        if op_addr_3 != OperandAddress.NO_ADDRESS:
-            value = int.from_bytes(bytes([data[counter]]), byteorder='big')
-            cmd.operands.append(Operand(op_addr_3, value))
-        else:
-            continue
+def decode_commands(data: bytes | memoryview) -> list[Command]:
+    view = memoryview(data)
+    size = len(view)
 
-        counter += 1
+    commands = []
 
-        if op_addr_4 != OperandAddress.NO_ADDRESS:
-            value = int.from_bytes(bytes([data[counter]]), byteorder='big')
-            cmd.operands.append(Operand(op_addr_4, value))
-        else:
+    counter = 0
+    while counter < size:
+        start = counter
+
+        if counter + 1 >= size:
+            raise ValueError(f"Truncated command at byte offset {start}")
+
+        cmd_name = COMMAND_NAMES_BY_CODE.get(view[counter + 1])
+        if cmd_name is None:
+            raise ValueError(f"Unknown command 0x{view[counter + 1]:02x} at byte offset {counter + 1}")
+
+        cmd = Command(cmd_name, [], view[counter])
+        commands.append(cmd)
+
+        counter += 2
+        if cmd_name in (CommandName.HLT, CommandName.NOP):
             continue
 
+        if counter >= size:
+            raise ValueError(f"Missing operand addressing of {cmd_name.name} at byte offset {counter}")
+
+        addresses = OPERAND_ADDRESSES_BY_BYTE[view[counter]]
         counter += 1
 
+        if counter + len(addresses) > size:
+            raise ValueError(f"Truncated operands of {cmd_name.name} at byte offset {start}")
+
+        cmd.operands = [Operand(address, view[counter + i]) for i, address in enumerate(addresses)]
+        counter += len(addresses)
+
     return commands
 
 
-def read_memory(filename: str) -> list[MemoryWord]:
+def read_commands(filename: str) -> list[Command]:
     with open(filename, 'rb') as file:
-        data = file.read()
+        return decode_commands(file.read())
 
-    memory = []
 
-    counter = 0
-    while counter < len(data):
-        memory.append(MemoryWord(int.from_bytes(bytes([data[counter]]), byteorder='big')))
-        counter += 1
+def load_memory(filename: str) -> bytes:
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+def load_image(filename: str) -> ProgramImage:
+    with open(filename, 'rb') as file:
+        code = file.read()
+    return ProgramImage(code, load_memory(f'{filename}.mem'))
+
 
-    return memory
+def read_memory(filename: str) -> list[MemoryWord]:
+    return [MemoryWord(value) for value in load_memory(filename)]
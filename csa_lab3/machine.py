@@ -1,44 +1,310 @@
+import argparse
+import enum
 import logging
+import os
 import sys
+from dataclasses import dataclass, field
+from typing import IO
 
-from csa_lab3.control_unit import ControlUnit
-from csa_lab3.data_path import DataPath
-from csa_lab3.isa import read_commands, read_memory
+from csa_lab3.control_unit import EXECUTION_ERRORS, CommandSequencer, ControlUnit, REGISTER_NAMES
+from csa_lab3.data_path import DataPath, TickCounter
+from csa_lab3.functional_unit import FunctionalUnit
+from csa_lab3.isa import Command, ProgramImage, decode_commands, load_image
+from csa_lab3.binary_trace import BinaryTraceSink
+from csa_lab3.profiler import ProfilingSink
+from csa_lab3.trace import LoggingSink, TraceSink, Tracer, TraceLevel
 
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
+class Engine(enum.Enum):
+    DATAPATH = "datapath"  # reference model, every command goes through the bus, memory and ALU signals
+    FUNCTIONAL = "functional"  # instruction-level model for bulk runs
 
-def simulation(binary_file_name: str, input_buffer: list[str]) -> None:
-    filename = binary_file_name
-    cmds = read_commands(filename)
-    mem = read_memory(f'{filename}.mem')
 
-    data_path = DataPath(in_buffer=input_buffer)
-    control_unit = ControlUnit(data_path=data_path, commands=cmds, memory=mem)
+def load_program(program: str | ProgramImage) -> tuple[list[Command], bytes]:
+    """Decodes a program image or the code file with this name."""
+    image = load_image(program) if isinstance(program, str) else program
+    return decode_commands(image.code), image.memory
+
+
+class HaltReason(enum.Enum):
+    HALT = "halt"  # HLT was executed
+    LIMIT = "limit"  # the instruction limit was reached
+    ERROR = "error"  # a command could not be executed
+
+
+@dataclass(frozen=True)
+class SimulationResult:
+    output: bytes
+    instructions: int
+    ticks: int
+    halt_reason: HaltReason
+    registers: dict[str, int]
+    flags: dict[str, int]
+    error: str | None = None
+    tick_counter: TickCounter = field(default_factory=TickCounter)  # ticks by kind
+
+    @property
+    def output_text(self) -> str:
+        return self.output.decode("latin-1")
+
+
+def input_buffer_of(data: bytes | str | IO[bytes] | IO[str]) -> list[str]:
+    """Characters for StdIn, one per byte of the input."""
+    if not isinstance(data, (bytes, str)):
+        data = data.read()
+    if isinstance(data, bytes):
+        return list(data.decode("latin-1"))
+    return list(data)
 
+
+def create_unit(cmds: list[Command], mem: bytes, input_buffer: list[str],
+                engine: Engine = Engine.DATAPATH) -> ControlUnit | FunctionalUnit:
+    if engine == Engine.FUNCTIONAL:
+        return FunctionalUnit(commands=cmds, memory=mem, in_buffer=input_buffer)
+    return ControlUnit(data_path=DataPath(in_buffer=input_buffer), commands=cmds, memory=mem)
+
+
+def execute(control_unit: ControlUnit | FunctionalUnit, tracer: Tracer | None = None,
+            limit: int | None = None) -> SimulationResult:
+    """Runs the program loaded into the unit until HLT, an error or the limit of instructions.
+
+    Nothing is printed or logged unless the tracer has sinks which do it.
+    """
+    if tracer is None:
+        tracer = Tracer(TraceLevel.OFF, [])
+
+    if tracer.level >= TraceLevel.MICRO_OP and isinstance(control_unit, ControlUnit):
+        tracer.attach(control_unit.data_path)
+
+    decode_command = control_unit.decode_command
     counter = 0
+    halt_reason = HaltReason.LIMIT
+    error = None
     try:
-        while True:
-            control_unit.decode_command()
-            counter += 1
-            logging.debug(
-                "%i) %s - %s",
-                counter,
-                str(control_unit.commands_memory[control_unit.command_pointer]),
-                str(control_unit)
-            )
+        if tracer.level >= TraceLevel.INSTRUCTION:
+            tracer.start(control_unit)
+            while counter != limit:
+                decode_command()
+                counter += 1
+                tracer.instruction(counter, control_unit)
+        else:
+            while counter != limit:
+                decode_command()
+                counter += 1
     except StopIteration:
-        pass
+        halt_reason = HaltReason.HALT
+    except EXECUTION_ERRORS as e:
+        halt_reason = HaltReason.ERROR
+        error = f"{type(e).__name__}: {e}"
+
+    output = ''.join(control_unit.stdout.buffer)
+    if tracer.level >= TraceLevel.SUMMARY:
+        tracer.summary(output, counter)
+    tracer.close()
 
-    logging.info("Out buffer: %s", ''.join(data_path.stdout.buffer))
+    return SimulationResult(
+        output=output.encode("latin-1"),
+        instructions=counter,
+        ticks=control_unit.ticks.total(),
+        halt_reason=halt_reason,
+        registers=dict(zip(REGISTER_NAMES, control_unit.register_values())),
+        flags=dict(control_unit.flags),
+        error=error,
+        tick_counter=control_unit.ticks.copy(),
+    )
 
-    print(''.join(data_path.stdout.buffer))
-    print(f"Instructions: {counter}")
+
+def simulate(program: str | ProgramImage, input_data: bytes | str | IO[bytes] | IO[str] = b"",
+             engine: Engine = Engine.DATAPATH, tracer: Tracer | None = None,
+             limit: int | None = None) -> SimulationResult:
+    cmds, mem = load_program(program)
+    return execute(create_unit(cmds, mem, input_buffer_of(input_data), engine), tracer, limit)
+
+
+def simulation(program: str | ProgramImage, input_buffer: list[str], engine: Engine = Engine.DATAPATH,
+               tracer: Tracer | None = None, limit: int | None = None) -> SimulationResult:
+    result = simulate(program, ''.join(input_buffer), engine, Tracer() if tracer is None else tracer, limit)
+
+    if result.halt_reason == HaltReason.ERROR:
+        raise RuntimeError(result.error)
+
+    print(result.output_text)
+    print(f"Instructions: {result.instructions}")
+    return result
+
+
+# registers visible to programs, they are compared in the cross-check mode
+CHECKED_REGISTERS = ("AC", "BR", "R0", "IOR")
+
+
+@dataclass
+class Divergence:
+    step: int
+    command: Command
+    differences: list[str]
+
+    def __str__(self) -> str:
+        lines = [f"Divergence at instruction {self.step}: {self.command.get_addr()} | {self.command}"]
+        lines += [f"  {d}" for d in self.differences]
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class CheckResult:
+    instructions: int
+    divergence: Divergence | None
+    halt_reason: HaltReason | None  # why the reference engine stopped, None at a divergence while it runs
+    error: str | None = None  # the error both engines stopped with
+
+
+def _perform_step(unit: CommandSequencer) -> tuple[HaltReason | None, str | None]:
+    """Executes one command, returns why the unit stopped, None if it did not, and the error."""
+    try:
+        unit.decode_command()
+    except StopIteration:
+        return HaltReason.HALT, None
+    except EXECUTION_ERRORS as e:
+        return HaltReason.ERROR, f"{type(e).__name__}: {e}"
+    return None, None
+
+
+def _stop_text(halt_reason: HaltReason | None, error: str | None) -> str:
+    if halt_reason is None:
+        return "running"
+    return halt_reason.value if error is None else f"{halt_reason.value} ({error})"
+
+
+def compare_units(control_unit: ControlUnit, functional_unit: FunctionalUnit) -> list[str]:
+    """Lists differences in the program-visible state, reference values go first."""
+    differences = []
+
+    if control_unit.command_pointer != functional_unit.command_pointer:
+        differences.append(f"PC: {control_unit.command_pointer:02x} != {functional_unit.command_pointer:02x}")
+
+    reference_registers = control_unit.register_values()
+    functional_registers = functional_unit.register_values()
+    for name in CHECKED_REGISTERS:
+        expected = reference_registers[REGISTER_NAMES.index(name)]
+        actual = functional_registers[REGISTER_NAMES.index(name)]
+        if expected != actual:
+            differences.append(f"{name}: {expected:02X} != {actual:02X}")
+
+    for flag, expected in control_unit.data_path.alu.flags.items():
+        if functional_unit.flags[flag] != expected:
+            differences.append(f"{flag}: {expected} != {functional_unit.flags[flag]}")
+
+    reference_memory = control_unit.memory_snapshot()
+    if reference_memory != functional_unit.memory:
+        for addr, (expected, actual) in enumerate(zip(reference_memory, functional_unit.memory)):
+            if expected != actual:
+                differences.append(f"${addr:02x}: {expected:02X} != {actual:02X}")
+
+    if control_unit.ticks != functional_unit.ticks:
+        differences.append(f"ticks: {control_unit.ticks} != {functional_unit.ticks}")
+
+    if control_unit.data_path.stdout.buffer != functional_unit.stdout.buffer:
+        expected_out = ''.join(control_unit.data_path.stdout.buffer)
+        actual_out = ''.join(functional_unit.stdout.buffer)
+        differences.append(f"stdout: {expected_out!r} != {actual_out!r}")
+
+    return differences
+
+
+def cross_check(program: str | ProgramImage, input_buffer: list[str], limit: int | None = None) -> CheckResult:
+    """Runs the reference and the functional engines in lockstep.
+
+    Stops at the first instruction after which their state differs, or after which only one of them stopped or
+    they stopped with different errors. When both fail on the same command with the same error the check ends
+    without a divergence, their state after a failed command is not compared.
+    """
+    cmds, mem = load_program(program)
+
+    data_path = DataPath(in_buffer=list(input_buffer))
+    control_unit = ControlUnit(data_path=data_path, commands=cmds, memory=mem)
+    functional_unit = FunctionalUnit(commands=cmds, memory=mem, in_buffer=list(input_buffer))
+
+    counter = 0
+    while counter != limit:
+        command = control_unit.commands_memory[control_unit.command_pointer]
+
+        reference = _perform_step(control_unit)
+        functional = _perform_step(functional_unit)
+
+        if reference == functional and reference[0] == HaltReason.ERROR:
+            return CheckResult(counter, None, HaltReason.ERROR, reference[1])
+
+        differences = []
+        if HaltReason.ERROR not in (reference[0], functional[0]):
+            differences = compare_units(control_unit, functional_unit)
+        if reference != functional:
+            differences.insert(0, f"stopped: {_stop_text(*reference)} != {_stop_text(*functional)}")
+
+        if differences:
+            return CheckResult(counter, Divergence(counter + 1, command, differences), reference[0])
+
+        if reference[0] == HaltReason.HALT:
+            return CheckResult(counter, None, HaltReason.HALT)
+
+        counter += 1
+
+    return CheckResult(counter, None, HaltReason.LIMIT)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
-        simulation("output/cat.bin", list("unused\0"))
+    parser = argparse.ArgumentParser(description="Simulate a compiled program")
+    parser.add_argument("code_file", nargs="?", default="output/cat.bin")
+    parser.add_argument("buffer_text", nargs="?", default="unused")
+    parser.add_argument("--engine", choices=[e.value for e in Engine], default=Engine.DATAPATH.value)
+    parser.add_argument("--check", action="store_true",
+                        help="run the reference and the functional engines in lockstep and compare their state")
+    parser.add_argument("--limit", type=int, help="stop after this number of instructions")
+    parser.add_argument("--trace", choices=[level.option_name() for level in TraceLevel],
+                        default=TraceLevel.INSTRUCTION.option_name())
+    parser.add_argument("--trace-file", help="also write a binary instruction trace to this file")
+    parser.add_argument("--ticks", action="store_true",
+                        help="log ticks of every command and print the total ticks by kind")
+    parser.add_argument("--profile", help="write the execution profile annotated against the listing to this file")
+    parser.add_argument("--flamegraph", help="write the profile as collapsed stacks to this file")
+    args = parser.parse_args()
+
+    trace_level = TraceLevel.from_name(args.trace)
+    sinks: list[TraceSink] = [LoggingSink(ticks=args.ticks, level=trace_level)]
+    if args.trace_file:
+        if trace_level < TraceLevel.INSTRUCTION:
+            parser.error("--trace-file needs the instruction or micro-op trace level")
+        sinks.append(BinaryTraceSink(args.trace_file))
+    profiling_sink = ProfilingSink()
+    if args.profile or args.flamegraph:
+        if args.check:
+            parser.error("--profile and --flamegraph can not be used with --check")
+        # the profiler needs instruction events, the logging sink still logs only the requested level
+        trace_level = max(trace_level, TraceLevel.INSTRUCTION)
+        sinks.append(profiling_sink)
+
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    if args.check:
+        check_result = cross_check(args.code_file, list(args.buffer_text) + ["\0"], args.limit)
+        if check_result.divergence is not None:
+            print(check_result.divergence)
+            sys.exit(1)
+        print(f"No divergence in {check_result.instructions} instructions")
+        if check_result.halt_reason != HaltReason.HALT:
+            print(f"Both engines stopped: {_stop_text(check_result.halt_reason, check_result.error)}")
+        if check_result.halt_reason == HaltReason.ERROR:
+            sys.exit(1)
     else:
-        assert len(sys.argv) == 3, "Wrong arguments: machine.py <code_file> <buffer_text>"
-        simulation(sys.argv[1], list(sys.argv[2]) + ["\0"])
+        simulation_result = simulation(args.code_file, list(args.buffer_text) + ["\0"], Engine(args.engine),
+                                       Tracer(trace_level, sinks), args.limit)
+        if args.ticks:
+            print(f"Ticks: {simulation_result.tick_counter}")
+        if args.profile:
+            listing = None
+            if os.path.exists(args.code_file + ".txt"):
+                with open(args.code_file + ".txt", encoding="utf-8") as listing_file:
+                    listing = listing_file.read()
+            with open(args.profile, "w", encoding="utf-8") as profile_file:
+                profile_file.write(profiling_sink.profile().report(listing))
+        if args.flamegraph:
+            with open(args.flamegraph, "w", encoding="utf-8") as flamegraph_file:
+                flamegraph_file.write(profiling_sink.profile().collapsed_stacks())
@@ -0,0 +1,193 @@
+"""Peephole optimization of the commands emitted by the compiler.
+
+Rewrites short sequences of adjacent commands and then relocates the program: addresses are recomputed from the
+command lengths and jump targets are moved to the new addresses. A command which is a jump target is never removed
+as the second command of a pair, the code before it does not have to run before it.
+
+Registers and flags between statements may differ from the code without the pass, the output and the data memory
+do not. Golden logs are compared with the code translated without it.
+"""
+from dataclasses import dataclass, field
+
+from csa_lab3.data_path import TickCounter
+from csa_lab3.functional_unit import FunctionalUnit, MEMORY_SIZE
+from csa_lab3.isa import (Command, CommandName, Operand, OperandAddress, JUMP_COMMANDS, command_length,
+                          command_size)
+
+# bytes which a copy between memory words moves
+COPY_SIZES = {CommandName.MOV: 1, CommandName.MOV4: 4}
+
+# conditional jumps with an implemented inverse, JB, JA and JBE are not implemented by the machine
+INVERTED_JUMPS = {
+    CommandName.JE: CommandName.JNE,
+    CommandName.JNE: CommandName.JE,
+}
+
+
+@dataclass
+class PeepholeReport:
+    instructions: int = 0
+    code_bytes: int = 0
+    # ticks of one execution of every removed command
+    ticks: TickCounter = field(default_factory=TickCounter)
+
+    def add(self, command: Command) -> None:
+        self.instructions += 1
+        self.code_bytes += command_size(command)
+        self.ticks += command_ticks(command)
+
+    def __str__(self) -> str:
+        return (f"Peephole: removed {self.instructions} instructions ({self.code_bytes} B), "
+                f"{self.ticks.total()} ticks per execution")
+
+
+def command_ticks(command: Command) -> TickCounter:
+    """Ticks of one execution of a command which does not depend on data, jumps take no ticks."""
+    if command.name in JUMP_COMMANDS:
+        return TickCounter()
+
+    commands = [Command(command.name, command.operands), Command(CommandName.HLT, address=command_length(command))]
+    unit = FunctionalUnit(commands, bytes(MEMORY_SIZE), [])
+    unit.decode_command()
+    return unit.ticks.copy()
+
+
+def _operands(command: Command) -> list[tuple[OperandAddress, int]]:
+    return [(operand.address, operand.value) for operand in command.operands]
+
+
+def _is_reload(previous: Command, command: Command) -> bool:
+    """The same MOV into a register again, the register already holds the value."""
+    return (command.name == previous.name == CommandName.MOV
+            and command.operands[0].address == OperandAddress.REGISTER
+            and _operands(command) == _operands(previous))
+
+
+def _copy(command: Command) -> tuple[int, int, int] | None:
+    """Destination, source and number of bytes of a MOV or MOV4 between memory words, None for other commands."""
+    if command.name not in COPY_SIZES:
+        return None
+    (dest_address, dest), (source_address, source) = _operands(command)
+    if dest_address != OperandAddress.MEMORY_DIRECT or source_address != OperandAddress.MEMORY_DIRECT:
+        return None
+    return dest, source, COPY_SIZES[command.name]
+
+
+def _is_copy_back(previous: Command, command: Command) -> bool:
+    """A copy between the words of the previous copy, back or again, of no more bytes: they are already equal.
+
+    MOV4 b, a or MOV b, a right after MOV4 a, b, the previous copy must not overlap itself.
+    """
+    copy, previous_copy = _copy(command), _copy(previous)
+    if copy is None or previous_copy is None:
+        return False
+    dest, source, size = copy
+    previous_dest, previous_source, previous_size = previous_copy
+    return (size <= previous_size <= abs(previous_dest - previous_source)
+            and {dest, source} == {previous_dest, previous_source})
+
+
+def _is_self_copy(command: Command) -> bool:
+    """MOV4 a, a or MOV a, a, the bytes are written with their own values."""
+    copy = _copy(command)
+    return copy is not None and copy[0] == copy[1]
+
+
+def _is_overwritten(command: Command, following: Command) -> bool:
+    """MOV4 a, x right before MOV4 a, y which does not read a, the first copy is never read."""
+    if not command.name == following.name == CommandName.MOV4:
+        return False
+    (dest, _), (following_dest, (source_address, source)) = _operands(command), _operands(following)
+    return dest == following_dest and (source_address != OperandAddress.MEMORY_DIRECT or abs(source - dest[1]) >= 4)
+
+
+def _target(command: Command) -> int:
+    return command.operands[0].value
+
+
+def _is_jump_over_jump(commands: list[Command], i: int, targets: set[int]) -> bool:
+    """JE or JNE to the command after the JMP which follows it, nothing else jumps to the JMP."""
+    if i + 2 >= len(commands) or commands[i].name not in INVERTED_JUMPS:
+        return False
+    following = commands[i + 1]
+    return (following.name == CommandName.JMP and following.address not in targets
+            and _target(commands[i]) == commands[i + 2].address)
+
+
+def _sweep(commands: list[Command], report: PeepholeReport) -> list[Command]:
+    """One pass of the rules over adjacent commands, addresses are left as they were."""
+    targets = {_target(cmd) for cmd in commands if cmd.name in JUMP_COMMANDS}
+    result: list[Command] = []
+    removed = False
+
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        following = commands[i + 1] if i + 1 < len(commands) else None
+        previous = None if removed or not result else result[-1]
+        removed = False
+
+        if command.name in JUMP_COMMANDS and following is not None and _target(command) == following.address:
+            # a jump to the next command
+            report.add(command)
+            removed = True
+
+        elif (following is not None and _is_overwritten(command, following)) or _is_self_copy(command):
+            # the copy is dead or changes nothing, also when something jumps to it
+            report.add(command)
+            removed = True
+
+        elif following is not None and _is_jump_over_jump(commands, i, targets):
+            # the jump is taken when the condition does not hold
+            result.append(Command(INVERTED_JUMPS[command.name], following.operands, command.address))
+            report.add(following)
+            i += 1
+
+        elif (previous is not None and command.address not in targets
+              and (_is_reload(previous, command) or _is_copy_back(previous, command))):
+            report.add(command)
+            removed = True
+
+        else:
+            result.append(command)
+
+        i += 1
+
+    return result
+
+
+def relocate(commands: list[Command], old_commands: list[Command]) -> None:
+    """Assigns addresses by the command lengths and moves jump targets from the addresses of old_commands.
+
+    A target which was removed moves to the next command which was kept.
+    """
+    new_addresses: dict[int, int] = {}
+
+    address = 0
+    for cmd in commands:
+        new_addresses[cmd.address] = address
+        address += command_length(cmd)
+
+    following = address
+    for cmd in reversed(old_commands):
+        if cmd.address in new_addresses:
+            following = new_addresses[cmd.address]
+        else:
+            new_addresses[cmd.address] = following
+
+    for cmd in commands:
+        cmd.address = new_addresses[cmd.address]
+        if cmd.name in JUMP_COMMANDS:
+            cmd.operands = [Operand(OperandAddress.DIRECT_LOAD, new_addresses[_target(cmd)])]
+
+
+def optimize(commands: list[Command]) -> tuple[list[Command], PeepholeReport]:
+    """Applies the rules until nothing changes, returns the relocated commands and what was removed."""
+    report = PeepholeReport()
+
+    while True:
+        result = _sweep(commands, report)
+        if len(result) == len(commands):
+            return commands, report
+        relocate(result, commands)
+        commands = result
@@ -0,0 +1,173 @@
+"""Execution profile of a program: executions and ticks per command address and per command name.
+
+Loops are found by backward jumps, a loop is the range from the jump target to the jump. The profile
+is exported as a text report, annotated against the listing when it is given, and as collapsed stacks
+for flamegraph tools (`flamegraph.pl`, speedscope).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from csa_lab3.control_unit import CommandSequencer
+from csa_lab3.data_path import TickCounter
+from csa_lab3.isa import Command, CommandName, JUMP_COMMANDS
+from csa_lab3.trace import TraceSink
+
+
+@dataclass
+class ProfileEntry:
+    count: int = 0
+    ticks: TickCounter | None = None
+
+    def add(self, count: int, ticks: TickCounter) -> None:
+        self.count += count
+        self.ticks = ticks.copy() if self.ticks is None else self.ticks + ticks
+
+    def total_ticks(self) -> int:
+        return 0 if self.ticks is None else self.ticks.total()
+
+
+@dataclass(frozen=True)
+class Loop:
+    start: int  # the jump target
+    end: int  # the backward jump
+
+    def __contains__(self, address: int) -> bool:
+        return self.start <= address <= self.end
+
+    def __str__(self) -> str:
+        return f"loop {self.start:02x}-{self.end:02x}"
+
+
+def find_loops(commands: list[Command]) -> list[Loop]:
+    """Loops by backward jumps, outer loops go first."""
+    loops = {
+        Loop(cmd.operands[0].value, cmd.address)
+        for cmd in commands
+        if cmd.name in JUMP_COMMANDS and cmd.operands and cmd.operands[0].value <= cmd.address
+    }
+    return sorted(loops, key=lambda loop: (loop.start, -loop.end))
+
+
+class ProfilingSink(TraceSink):
+    """Attributes the ticks between two instruction events to the command executed between them."""
+
+    def __init__(self) -> None:
+        self.commands: dict[int, Command] = {}
+        # executions and ticks by kind for every address
+        self.counts: dict[int, list[int]] = {}
+        self.pc = 0
+        self.last_ticks = (0, 0, 0, 0)
+
+    def start(self, unit: CommandSequencer) -> None:
+        self.commands = dict(unit.commands_memory)
+        self.pc = unit.command_pointer
+        self.last_ticks = unit.ticks.as_tuple()
+
+    def instruction(self, counter: int, unit: CommandSequencer) -> None:
+        ticks = unit.ticks.as_tuple()
+
+        entry = self.counts.get(self.pc)
+        if entry is None:
+            entry = self.counts[self.pc] = [0, 0, 0, 0, 0]
+        entry[0] += 1
+        for i in range(4):
+            entry[i + 1] += ticks[i] - self.last_ticks[i]
+
+        self.pc = unit.command_pointer
+        self.last_ticks = ticks
+
+    def profile(self) -> Profile:
+        by_address = {address: ProfileEntry(count, TickCounter(*ticks))
+                      for address, (count, *ticks) in self.counts.items()}
+        return Profile(self.commands, by_address)
+
+
+class Profile:
+    def __init__(self, commands: dict[int, Command], by_address: dict[int, ProfileEntry]):
+        self.commands = commands
+        self.by_address = by_address
+        self.loops = find_loops([commands[address] for address in sorted(commands)])
+
+    def total_ticks(self) -> int:
+        return sum(entry.total_ticks() for entry in self.by_address.values())
+
+    def by_name(self) -> dict[CommandName, ProfileEntry]:
+        entries: dict[CommandName, ProfileEntry] = {}
+        for address, entry in self.by_address.items():
+            assert entry.ticks is not None
+            entries.setdefault(self.commands[address].name, ProfileEntry()).add(entry.count, entry.ticks)
+        return entries
+
+    def by_loop(self) -> dict[Loop, ProfileEntry]:
+        """Ticks of the commands inside each loop, the count is the number of runs of the loop head."""
+        entries = {}
+        for loop in self.loops:
+            entry = ProfileEntry(self.by_address.get(loop.start, ProfileEntry()).count, TickCounter())
+            for address, inner in self.by_address.items():
+                if address in loop:
+                    assert inner.ticks is not None
+                    entry.add(0, inner.ticks)
+            entries[loop] = entry
+        return entries
+
+    def _share(self, ticks: int) -> str:
+        total = self.total_ticks()
+        return f"{100 * ticks / total:5.1f}%" if total else "  0.0%"
+
+    def report(self, listing: str | None = None, top: int = 20) -> str:
+        lines = [f"Total: {sum(e.count for e in self.by_address.values())} instructions, {self.total_ticks()} ticks"]
+
+        lines += ["", "Hot commands:", f"{'count':>8} {'ticks':>8} {'share':>6}  command"]
+        hot = sorted(self.by_address.items(), key=lambda item: (-item[1].total_ticks(), item[0]))
+        for address, entry in hot[:top]:
+            command = self.commands[address]
+            lines.append(f"{entry.count:>8} {entry.total_ticks():>8} {self._share(entry.total_ticks())}  "
+                         f"{command.get_addr()} | {command}")
+
+        lines += ["", "Commands:", f"{'count':>8} {'ticks':>8} {'share':>6}  command  (bus, read, write, alu)"]
+        by_name = sorted(self.by_name().items(), key=lambda item: -item[1].total_ticks())
+        for name, entry in by_name:
+            assert entry.ticks is not None
+            lines.append(f"{entry.count:>8} {entry.total_ticks():>8} {self._share(entry.total_ticks())}  "
+                         f"{name.name:<6} {entry.ticks.as_tuple()}")
+
+        loops = sorted(self.by_loop().items(), key=lambda item: -item[1].total_ticks())
+        if loops:
+            lines += ["", "Hot loops:", f"{'runs':>8} {'ticks':>8} {'share':>6}  loop"]
+            for loop, entry in loops:
+                lines.append(f"{entry.count:>8} {entry.total_ticks():>8} {self._share(entry.total_ticks())}  "
+                             f"{loop}: {self.commands[loop.start]} .. {self.commands[loop.end]}")
+
+        lines += ["", "Listing:", f"{'count':>8} {'ticks':>8}  listing"]
+        lines += self._annotate(listing)
+
+        return "\n".join(lines) + "\n"
+
+    def _annotate(self, listing: str | None) -> list[str]:
+        if listing is None:
+            listing_lines = [f"{cmd.get_addr()} | {cmd}" for _, cmd in sorted(self.commands.items())]
+        else:
+            listing_lines = listing.splitlines()
+
+        lines = []
+        for line in listing_lines:
+            address = int(line.split(" | ", 1)[0], 16)
+            entry = self.by_address.get(address)
+            loop_marks = "".join("<" if address == loop.start else "|" if address in loop else " "
+                                 for loop in self.loops)
+            if entry is None:
+                lines.append(f"{'':>8} {'':>8} {loop_marks} {line}")
+            else:
+                lines.append(f"{entry.count:>8} {entry.total_ticks():>8} {loop_marks} {line}")
+        return lines
+
+    def collapsed_stacks(self) -> str:
+        """Lines of `program;<loops from outer to inner>;<command> ticks`."""
+        lines = []
+        for address, entry in sorted(self.by_address.items()):
+            frames = ["program"] + [str(loop) for loop in self.loops if address in loop]
+            command = self.commands[address]
+            frames.append(f"{command.get_addr()} {command}")
+            lines.append(f"{';'.join(frames)} {entry.total_ticks()}")
+        return "\n".join(lines) + "\n"
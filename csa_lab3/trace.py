@@ -0,0 +1,139 @@
+import enum
+import logging
+
+from csa_lab3.control_unit import CommandSequencer
+from csa_lab3.data_path import AluOperation, DataPath, TickCounter
+
+
+class TraceLevel(enum.IntEnum):
+    OFF = 0
+    SUMMARY = 1  # output buffer after the run
+    INSTRUCTION = 2  # state after every command, the format of the golden logs
+    MICRO_OP = 3  # bus transfers, memory signals and ALU operations, DataPath engine only
+
+    @staticmethod
+    def from_name(name: str) -> 'TraceLevel':
+        return TraceLevel[name.upper().replace('-', '_')]
+
+    def option_name(self) -> str:
+        return self.name.lower().replace('_', '-')
+
+
+class TraceSink:
+    """Receives trace events, ignores all of them by default."""
+
+    def start(self, unit: CommandSequencer) -> None:
+        pass
+
+    def instruction(self, counter: int, unit: CommandSequencer) -> None:
+        pass
+
+    def micro_op(self, description: str) -> None:
+        pass
+
+    def summary(self, output: str, instructions: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class LoggingSink(TraceSink):
+    """Writes events to the logging module, instructions go in the format of the golden logs.
+
+    With ticks, every instruction line ends with the ticks of the command executed at this step. Events above
+    the level are not logged, so the tracer may run at a higher level for other sinks.
+    """
+
+    def __init__(self, ticks: bool = False, level: TraceLevel = TraceLevel.MICRO_OP):
+        self.ticks = ticks
+        self.level = level
+        self.last_ticks = TickCounter()
+
+    def start(self, unit: CommandSequencer) -> None:
+        self.last_ticks = unit.ticks.copy()
+
+    def instruction(self, counter: int, unit: CommandSequencer) -> None:
+        if self.level < TraceLevel.INSTRUCTION:
+            return
+        if self.ticks:
+            step_ticks = unit.ticks - self.last_ticks
+            self.last_ticks = unit.ticks.copy()
+            logging.debug("%i) %s - %s | ticks: %s", counter, unit.commands_memory[unit.command_pointer], unit,
+                          step_ticks)
+            return
+
+        # the command and the state are converted to strings only if the record is emitted
+        logging.debug("%i) %s - %s", counter, unit.commands_memory[unit.command_pointer], unit)
+
+    def micro_op(self, description: str) -> None:
+        if self.level >= TraceLevel.MICRO_OP:
+            logging.debug("  %s", description)
+
+    def summary(self, output: str, instructions: int) -> None:
+        if self.level >= TraceLevel.SUMMARY:
+            logging.info("Out buffer: %s", output)
+
+
+class Tracer:
+    """Dispatches trace events of the enabled level to the sinks.
+
+    The simulation loop checks the level once, so disabled levels are not called at all.
+    """
+
+    def __init__(self, level: TraceLevel = TraceLevel.INSTRUCTION, sinks: list[TraceSink] | None = None):
+        self.level = level
+        self.sinks = [LoggingSink()] if sinks is None else sinks
+
+    def start(self, unit: CommandSequencer) -> None:
+        for sink in self.sinks:
+            sink.start(unit)
+
+    def instruction(self, counter: int, unit: CommandSequencer) -> None:
+        for sink in self.sinks:
+            sink.instruction(counter, unit)
+
+    def micro_op(self, description: str) -> None:
+        for sink in self.sinks:
+            sink.micro_op(description)
+
+    def summary(self, output: str, instructions: int) -> None:
+        for sink in self.sinks:
+            sink.summary(output, instructions)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+    def attach(self, data_path: DataPath) -> None:
+        """Reports micro-operations of the data path, its signals are wrapped only when it is called."""
+        bus, memory, alu = data_path.data_bus, data_path.data_memory, data_path.alu
+
+        perform_transfer = bus.perform_transfer
+        signal_read = memory.signal_read
+        signal_write = memory.signal_write
+        perform_operation = alu.perform_operation
+
+        def traced_transfer() -> None:
+            perform_transfer()
+            source = next((r.name for r in bus.registers if r.bit_enabled == 1), None)
+            if source is not None:
+                targets = ", ".join(r.name for r in bus.registers if r.bit_set == 1)
+                self.micro_op(f"bus {source} -> {targets}: {bus.value:02X}")
+
+        def traced_read() -> None:
+            signal_read()
+            self.micro_op(f"read ${memory.address_register.get_value():02x}: {memory.data_register.get_value():02X}")
+
+        def traced_write() -> None:
+            signal_write()
+            self.micro_op(f"write ${memory.address_register.get_value():02x}: {memory.data_register.get_value():02X}")
+
+        def traced_operation(operation: AluOperation, flags: str = "NZVC") -> None:
+            perform_operation(operation, flags)
+            self.micro_op(f"alu {operation.name}: {alu.out_register.get_value():02X} | {alu.flags_str()}")
+
+        setattr(bus, "perform_transfer", traced_transfer)
+        setattr(memory, "signal_read", traced_read)
+        setattr(memory, "signal_write", traced_write)
+        setattr(alu, "perform_operation", traced_operation)
@@ -1,11 +1,24 @@
+# pylint: disable=too-many-lines
 from __future__ import annotations
 
+import argparse
 import enum
-import io
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from typing import Any, Tuple
 
-from csa_lab3.isa import Command, MemoryWord, CommandName, Operand, OperandAddress, write_commands
+from csa_lab3 import ir, peephole
+from csa_lab3.compile_cache import CompileCache
+from csa_lab3.isa import (Command, MemoryWord, CommandName, Operand, OperandAddress, ProgramImage, build_image,
+                          write_image)
+
+
+# part of the compile cache key, increase it whenever the generated code changes
+TRANSLATOR_VERSION = 9
 
 
 class LanguagePart(enum.Enum):
@@ -78,71 +91,66 @@ class Lexer:
         'read': LanguagePart.READ_CALL
     }
 
-    def __init__(self, program: str):
-        self.buffer = io.StringIO(program)
-        self.current_char: str = ' '
-
-    def read_char(self) -> None:
-        self.current_char = self.buffer.read(1)
-
-    def parse_token(self) -> Tuple[LanguagePart, Any]:
-        value: Any = None
-        while True:
-            if len(self.current_char) == 0:
-                return LanguagePart.EOF, None
-
-            if self.current_char.isspace():
-                self.read_char()
-                continue
-
-            if self.current_char.isdigit():
-                value = 0
-                while self.current_char.isdigit():
-                    value = value * 10 + int(self.current_char)
-                    self.read_char()
-                return LanguagePart.NUMBER, value
-
-            if self.current_char == '"':
-                value = ''
-                self.read_char()
-                while self.current_char != '"':
-                    value = value + self.current_char
-                    self.read_char()
-                self.read_char()
-                return LanguagePart.STRING, value
-
-            if self.current_char == "'":
-                value = ''
-                self.read_char()
-                while self.current_char != "'":
-                    value = value + self.current_char
-                    self.read_char()
-                self.read_char()
-                return LanguagePart.CHAR, value
+    TOKEN = re.compile(r"""
+          (?P<space>\s+)
+        | (?P<number>\d+)
+        | "(?P<string>[^"]*)"
+        | '(?P<char>[^']*)'
+        | (?P<word>[^\W\d_][^\W\d]*)
+        | (?P<symbol>==|!=|<=|>=|[{}();=+\-*/%<>])
+    """, re.VERBOSE)
 
-            if self.current_char.isalpha():
-                value = ''
-                while self.current_char.isalpha() or self.current_char == '_':
-                    value = value + self.current_char
-                    self.read_char()
+    def __init__(self, program: str):
+        self.program = program
+        self.position = 0
 
-                if value in Lexer.WORDS:
-                    return Lexer.WORDS[value], None
+        self.current_line = 1
+        self.line_start = 0
 
-                return LanguagePart.VARIABLE, value
+        # position of the last token, lines and columns start from 1
+        self.line = 1
+        self.column = 1
 
-            value = self.current_char
-            self.read_char()
-            next_value = self.current_char
+    def _advance(self, end: int) -> None:
+        newlines = self.program.count('\n', self.position, end)
+        if newlines:
+            self.current_line += newlines
+            self.line_start = self.program.rfind('\n', self.position, end) + 1
+        self.position = end
 
-            if value + next_value in Lexer.SYMBOLS:
-                self.read_char()
-                return Lexer.SYMBOLS[value + next_value], None
+    def parse_token(self) -> Tuple[LanguagePart, Any]:
+        while True:
+            self.line = self.current_line
+            self.column = self.position - self.line_start + 1
 
-            if value in Lexer.SYMBOLS:
-                return Lexer.SYMBOLS[value], None
+            if self.position >= len(self.program):
+                return LanguagePart.EOF, None
 
-            raise SyntaxError(f"Unexpected token: {value}")
+            found = Lexer.TOKEN.match(self.program, self.position)
+            if found is None:
+                char = self.program[self.position]
+                if char in '"\'':
+                    raise SyntaxError(f"Unterminated literal at {self.line}:{self.column}")
+                raise SyntaxError(f"Unexpected token: {char} at {self.line}:{self.column}")
+
+            self._advance(found.end())
+
+            match found.lastgroup:
+                case 'space':
+                    continue
+                case 'number':
+                    return LanguagePart.NUMBER, int(found.group('number'))
+                case 'string':
+                    return LanguagePart.STRING, found.group('string')
+                case 'char':
+                    return LanguagePart.CHAR, found.group('char')
+                case 'word':
+                    value = found.group('word')
+                    if value in Lexer.WORDS:
+                        return Lexer.WORDS[value], None
+                    return LanguagePart.VARIABLE, value
+                case _:
+                    return Lexer.SYMBOLS[found.group('symbol')], None
 
 
 class NodeType(enum.Enum):
@@ -184,12 +192,15 @@ class AstNode:
                  node_type: NodeType,
                  value: Any = None,
                  op1: AstNode | None = None,
-                 op2: AstNode | None = None
+                 op2: AstNode | None = None,
+                 children: list[AstNode] | None = None
                  ) -> None:
         self.node_type: NodeType = node_type
         self.value: Any = value
         self.op1 = op1
         self.op2 = op2
+        # statements of a SEQUENCE, kept flat so long blocks are not nested
+        self.children: list[AstNode] = [] if children is None else children
 
     def __str__(self) -> str:
         if self.value is not None:
@@ -199,11 +210,13 @@ class AstNode:
 
 
 def pretty_print_ast_node(node: AstNode, shift: str = '') -> None:
-    print(f"{shift}{node}")
-    if node.op1:
-        pretty_print_ast_node(node.op1, shift=shift + "  ")
-    if node.op2:
-        pretty_print_ast_node(node.op2, shift=shift + "  ")
+    stack = [(node, shift)]
+    while stack:
+        node, shift = stack.pop()
+        print(f"{shift}{node}")
+
+        nested = [child for child in (node.op1, node.op2) if child] + node.children
+        stack.extend((child, shift + "  ") for child in reversed(nested))
 
 
 class Parser:
@@ -229,10 +242,8 @@ class Parser:
         self.token: LanguagePart | None = None
         self.value: Any = None
 
-    @staticmethod
-    def print_error(msg: str) -> None:
-        print(f'Parser error: {msg}')
-        raise SystemExit
+    def syntax_error(self, msg: str) -> None:
+        raise SyntaxError(f'Parser error: {msg} at {self.lexer.line}:{self.lexer.column}')
 
     def next_token(self) -> None:
         self.token, self.value = self.lexer.parse_token()
@@ -242,7 +253,7 @@ class Parser:
         node = AstNode(NodeType.PROGRAM, op1=self.statement())
 
         if self.token != LanguagePart.EOF:
-            self.print_error("Invalid statement syntax")
+            self.syntax_error("Invalid statement syntax")
 
         return node
 
@@ -271,29 +282,29 @@ class Parser:
                 return node
 
             case LanguagePart.L_BRA:
-                node = AstNode(NodeType.EMPTY)
+                node = AstNode(NodeType.SEQUENCE)
                 self.next_token()
                 while self.token != LanguagePart.R_BRA:  # type: ignore[comparison-overlap]
-                    node = AstNode(NodeType.SEQUENCE, op1=node, op2=self.statement())
+                    node.children.append(self.statement())
                 self.next_token()
                 return node
 
             case _:
                 node = AstNode(NodeType.EXPRESSION, op1=self.expression())
                 if self.token != LanguagePart.SEMICOLON:  # type: ignore[comparison-overlap]
-                    self.print_error('";" expected')
+                    self.syntax_error('";" expected')
                 self.next_token()
                 return node
 
     def paren_expression(self) -> AstNode:
         if self.token != LanguagePart.L_PAR:
-            self.print_error('"(" expected')
+            self.syntax_error('"(" expected')
         self.next_token()
 
         node = self.cmp()
 
         if self.token != LanguagePart.R_PAR:
-            self.print_error('")" expected')
+            self.syntax_error('")" expected')
         self.next_token()
 
         return node
@@ -314,7 +325,7 @@ class Parser:
         self.next_token()
 
         if self.token != LanguagePart.ASSIGN:  # type: ignore[comparison-overlap]
-            self.print_error('"=" expected')
+            self.syntax_error('"=" expected')
         self.next_token()
 
         node.op2 = self.math()
@@ -381,27 +392,78 @@ class Compiler:
         NodeType.GREATER_OR_EQUALS: CommandName.JAE,
     }
 
-    def __init__(self) -> None:
+    def __init__(self, optimize: bool = False) -> None:
+        self.optimize = optimize
+
         self.commands: list[Command] = []
         self.memory: list[MemoryWord] = []
 
-        self.command_counter = 0
         self.memory_counter = 0
 
         self.variables_address: dict[str, int] = {}
         self.variables_type: dict[str, str] = {}
 
         self.strings: dict[str, int] = {}
-        self.string_dependent: list[tuple[Operand, str]] = []
-
-    def add_command(self, command: Command) -> None:
-        command.address = self.command_counter
-        self.commands.append(command)
-        self.command_counter += 1
-
-        if len(command.operands) != 0:
-            self.command_counter += 1
-            self.command_counter += len(command.operands)
+        # texts of the string literals by index and their addresses once they are placed
+        self.string_texts: list[str] = []
+        self.string_addresses: list[int] = []
+        self.temps_address: dict[int, int] = {}
+
+        # variable which IOR holds at this point of the code, print of this char does not load it again
+        self.ior_variable: str | None = None
+        # loads of char variables into IOR counted by ior_after
+        self.ior_loads = 0
+        # loop_ior by the loop and the variable in IOR on entry, with the loads and the types after the body
+        self.loop_heads: dict[tuple[int, str | None], tuple[int, str | None, dict[str, str]]] = {}
+
+        # the code is built as a graph of blocks and lowered to commands at the end of the program
+        self.cfg = ir.Cfg()
+        self.block = self.cfg.new_block()
+        self.cfg.place(self.block)
+        self.pass_manager = ir.PassManager(ir.DEFAULT_PASSES if optimize else [])
+
+    def emit(self, name: CommandName, operands: list[ir.Value] | None = None) -> None:
+        self.block.instrs.append(ir.Instr(name, [] if operands is None else operands))
+
+    def operand(self, value: ir.Value) -> Operand:
+        """Operand of the value when the program is lowered, temporaries get their words after the strings."""
+        match value:
+            case ir.Var(name=name):
+                return Operand(OperandAddress.MEMORY_DIRECT, self.variables_address[name])
+            case ir.AddressOf(variable=variable, offset=offset):
+                return Operand(OperandAddress.DIRECT_LOAD, self.variables_address[variable.name] + offset)
+            case ir.Str(index=index):
+                return Operand(OperandAddress.DIRECT_LOAD, self.string_addresses[index])
+            case ir.Temp(index=index):
+                if index not in self.temps_address:
+                    self.temps_address[index] = self.add_memory_word([MemoryWord(i) for i in self.split_int(0)])
+                return Operand(OperandAddress.MEMORY_DIRECT, self.temps_address[index])
+        return ir.fixed_operand(value)
+
+    def terminate(self, terminator: ir.Terminator) -> None:
+        self.block.terminator = terminator
+
+    def start_block(self, block: ir.Block) -> None:
+        """Places the block after the current one, which goes on to it unless it is already terminated."""
+        if self.block.terminator is None:
+            self.block.terminator = ir.Jump(block)
+        self.cfg.place(block)
+        self.block = block
+
+    def branch(self, condition: AstNode, if_true: ir.Block, if_false: ir.Block) -> None:
+        """Compares and branches, a comparison of literals goes to its block directly when optimizing.
+
+        The literals keep their words in memory and the other block is still compiled for the variables it
+        declares, it is removed as unreachable. The data memory is laid out as without the optimization.
+        """
+        operands = list(self.precompile_nodes(condition))
+        taken = machine_condition(condition) if self.optimize else None
+        if taken is not None:
+            self.terminate(ir.Jump(if_true if taken else if_false))
+            return
+
+        self.emit(CommandName.CMP, operands)
+        self.terminate(ir.Branch(Compiler.cmp_node_type_to_command_map[condition.node_type], if_true, if_false))
 
     def add_memory_word(self, word: list[MemoryWord]) -> int:
         cash = self.memory_counter
@@ -415,26 +477,23 @@ class Compiler:
         c = bin(i)[2:].zfill(32)
         return list(reversed((int(c[0:8], 2), int(c[8:16], 2), int(c[16:24], 2), int(c[24:32], 2))))
 
-    def precompile_node(self, node: AstNode | None) -> Operand:
+    def precompile_node(self, node: AstNode | None) -> ir.Value:
         if node is None:
             raise ValueError
 
         if node.node_type == NodeType.VARIABLE:
             var = node.value
-            if var in self.variables_address:
-                addr = self.variables_address[var]
-            else:
-                addr = self.add_memory_word([MemoryWord(i) for i in self.split_int(0)])
-                self.variables_address[var] = addr
+            if var not in self.variables_address:
+                self.variables_address[var] = self.add_memory_word([MemoryWord(i) for i in self.split_int(0)])
 
-            return Operand(OperandAddress.MEMORY_DIRECT, addr)
+            return ir.Var(var)
 
         if node.node_type == NodeType.INT_CONST:
             if node.value < 256:
-                return Operand(OperandAddress.DIRECT_LOAD, node.value)
+                return ir.Literal(node.value)
 
             addr = self.add_memory_word([MemoryWord(i) for i in self.split_int(node.value)])
-            return Operand(OperandAddress.MEMORY_DIRECT, addr)
+            return ir.Literal(node.value, addr)
 
         if node.node_type == NodeType.CHAR_CONST:
 
@@ -444,16 +503,15 @@ class Compiler:
                 raise ValueError(f'Cannot convert char of len {len(node.value)}: {node.value}')
 
             addr = self.add_memory_word([MemoryWord(i) for i in self.split_int(ord(node.value))])
-            return Operand(OperandAddress.MEMORY_DIRECT, addr)
+            return ir.Literal(ord(node.value), addr)
 
         if node.node_type == NodeType.STRING_CONST:
-            operand = Operand(OperandAddress.DIRECT_LOAD, 0)
-            self.string_dependent.append((operand, node.value))
-            return operand
+            self.string_texts.append(node.value)
+            return ir.Str(len(self.string_texts) - 1)
 
         raise ValueError
 
-    def precompile_nodes(self, node: AstNode | None) -> Tuple[Operand, Operand]:
+    def precompile_nodes(self, node: AstNode | None) -> Tuple[ir.Value, ir.Value]:
         if node is None:
             raise ValueError
 
@@ -465,6 +523,109 @@ class Compiler:
 
         raise ValueError
 
+    @staticmethod
+    def assigned_type(node: AstNode, types: dict[str, str]) -> str | None:
+        """Type of the variable after the assignment as compile_node records it."""
+        assert node.op1 is not None and node.op2 is not None
+        match node.op2.node_type:
+            case NodeType.INT_CONST:
+                return "int"
+            case NodeType.CHAR_CONST:
+                return "char"
+            case NodeType.VARIABLE if node.op1.value not in types:
+                return types.get(node.op2.value)
+        return types.get(node.op1.value)
+
+    def ior_after(self, node: AstNode | None, ior: str | None, types: dict[str, str]) -> str | None:
+        """Variable held in IOR after the statement if IOR held ior before it, types are updated as compiled.
+
+        IOR is written by read and print only. The variable stays in IOR until it is assigned or another print
+        uses IOR, its memory word is always written as well.
+        """
+        if node is None:
+            return ior
+
+        match node.node_type:
+            case NodeType.PROGRAM | NodeType.EXPRESSION:
+                return self.ior_after(node.op1, ior, types)
+
+            case NodeType.SEQUENCE:
+                for statement in node.children:
+                    ior = self.ior_after(statement, ior, types)
+                return ior
+
+            case NodeType.SET:
+                assert node.op1 is not None
+                variable_type = self.assigned_type(node, types)
+                if variable_type is not None:
+                    types[node.op1.value] = variable_type
+                return None if node.op1.value == ior else ior
+
+            case NodeType.READ:
+                assert node.op1 is not None
+                return str(node.op1.value)
+
+            case NodeType.PRINT:
+                assert node.op1 is not None
+                if node.op1.node_type == NodeType.VARIABLE and types.get(node.op1.value) == "char":
+                    self.ior_loads += node.op1.value != ior
+                    return str(node.op1.value)
+                return ior if node.op1.node_type not in (NodeType.VARIABLE, NodeType.STRING_CONST) else None
+
+            case NodeType.IF:
+                return ior if self.ior_after(node.op2, ior, types) == ior else None
+
+            case NodeType.WHILE:
+                return self.loop_ior(node, ior, types)
+
+        return ior
+
+    @staticmethod
+    def printed_variables(node: AstNode | None) -> dict[str, int]:
+        """How many times the statements print every variable, nested blocks included."""
+        counts: dict[str, int] = {}
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current is None:
+                continue
+            if current.node_type == NodeType.PRINT and current.op1 is not None \
+                    and current.op1.node_type == NodeType.VARIABLE:
+                counts[current.op1.value] = counts.get(current.op1.value, 0) + 1
+            stack.extend([current.op1, current.op2, *current.children])
+        return counts
+
+    def loop_ior(self, node: AstNode, entry: str | None, types: dict[str, str]) -> str | None:
+        """Variable held in IOR at the head of the loop, None if there is none.
+
+        The candidates are the variable in IOR on entry, None and the char variable which the body prints the
+        most times. A variable is a candidate only if the body ends with it in IOR, so the head does not change
+        between iterations. The one with the fewest loads in one pass over the body is taken. The printed
+        variable is loaded once before the loop, which runs even if the body does not, so it wins only with
+        fewer loads than the others.
+        """
+        key = (id(node), entry)
+        if key not in self.loop_heads:
+            counts = self.printed_variables(node.op2)
+            printed = max((name for name in counts if types.get(name) == "char"), key=counts.__getitem__,
+                          default=None)
+
+            loads_before = self.ior_loads
+            heads: list[tuple[int, str | None, dict[str, str]]] = []
+            for head in dict.fromkeys([entry, None, printed]):
+                self.ior_loads = 0
+                body_types = dict(types)
+                if self.ior_after(node.op2, head, body_types) == head or head is None:
+                    heads.append((self.ior_loads, head, body_types))
+            self.ior_loads = loads_before
+            # the first of the candidates with the fewest loads
+            self.loop_heads[key] = min(heads, key=lambda candidate: candidate[0])
+
+        loads, head, body_types = self.loop_heads[key]
+        self.ior_loads += loads + (head not in (None, entry))
+        types.update(body_types)
+        return head
+
     def compile_node(self, node: AstNode | None) -> None:
         if node is None:
             raise ValueError
@@ -472,16 +633,19 @@ class Compiler:
         match node.node_type:
             case NodeType.PROGRAM:
                 self.compile_node(node.op1)
-                self.add_command(Command(CommandName.HLT))
+                self.terminate(ir.Halt())
 
-                for op, s in self.string_dependent:
+                for s in self.string_texts:
                     s = s.replace(r"\n", '\n')
-                    addr = self.add_memory_word([MemoryWord(ord(i)) for i in s] + [MemoryWord(0)])
-                    op.value = addr
+                    self.string_addresses.append(
+                        self.add_memory_word([MemoryWord(ord(i)) for i in s] + [MemoryWord(0)]))
+
+                self.pass_manager.run(self.cfg)
+                self.commands = ir.lower(self.cfg, self.operand)
 
             case NodeType.SEQUENCE:
-                self.compile_node(node.op1)
-                self.compile_node(node.op2)
+                for statement in node.children:
+                    self.compile_node(statement)
 
             case NodeType.EMPTY:
                 pass
@@ -493,6 +657,9 @@ class Compiler:
                 if node.op1 is None:
                     raise ValueError
 
+                if node.op1.value == self.ior_variable:
+                    self.ior_variable = None
+
                 op1 = self.precompile_node(node.op1)
                 value = node.op2
 
@@ -506,7 +673,7 @@ class Compiler:
 
                         op2 = self.precompile_node(value)
 
-                        self.add_command(Command(CommandName.MOV4, [op1, op2]))
+                        self.emit(CommandName.MOV4, [op1, op2])
 
                     case NodeType.CHAR_CONST:
 
@@ -514,7 +681,7 @@ class Compiler:
 
                         op2 = self.precompile_node(value)
 
-                        self.add_command(Command(CommandName.MOV, [op1, op2]))
+                        self.emit(CommandName.MOV, [op1, op2])
 
                     case NodeType.VARIABLE:
 
@@ -526,61 +693,59 @@ class Compiler:
 
                         op2 = self.precompile_node(value)
 
-                        self.add_command(Command(CommandName.MOV4, [op1, op2]))
+                        self.emit(CommandName.MOV4, [op1, op2])
 
                     case _ if value.node_type in Compiler.math_node_type_to_command_map:
                         op2, op3 = self.precompile_nodes(value)
+                        folded = machine_sum(value) if self.optimize else None
 
-                        self.add_command(
-                            Command(Compiler.math_node_type_to_command_map[value.node_type], [op1, op2, op3])
-                        )
+                        if folded is not None and folded < 256:
+                            # the type of the variable is not recorded, as for the arithmetic
+                            self.emit(CommandName.MOV4, [op1, ir.Literal(folded)])
 
-            case NodeType.WHILE:
-                loop_start = self.command_counter
+                        else:
+                            self.emit(Compiler.math_node_type_to_command_map[value.node_type], [op1, op2, op3])
 
+            case NodeType.WHILE:
                 cond = node.op1
                 if cond is None:
                     raise ValueError
 
-                self.add_command(Command(CommandName.CMP, list(self.precompile_nodes(cond))))
-
-                cond_cmd = Command(
-                    Compiler.cmp_node_type_to_command_map[cond.node_type], [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                )
+                loop_ior = None
+                if self.optimize:
+                    loop_ior = self.loop_ior(node, self.ior_variable, dict(self.variables_type))
+                    if loop_ior not in (None, self.ior_variable):
+                        # loaded once instead of on every iteration
+                        self.emit(CommandName.MOV, [ir.Reg(3), ir.Var(loop_ior)])
+                self.ior_variable = loop_ior
 
-                self.add_command(cond_cmd)
+                head, body, end = self.cfg.new_block(), self.cfg.new_block(), self.cfg.new_block()
 
-                false_cmd = Command(CommandName.JMP, [Operand(OperandAddress.DIRECT_LOAD, 0)])
-                self.add_command(false_cmd)
-
-                cond_cmd.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
+                self.start_block(head)
+                self.branch(cond, body, end)
 
+                self.start_block(body)
                 self.compile_node(node.op2)
+                self.terminate(ir.Jump(head))
 
-                self.add_command(Command(CommandName.JMP, [Operand(OperandAddress.DIRECT_LOAD, loop_start)]))
-
-                false_cmd.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
+                self.start_block(end)
+                self.ior_variable = loop_ior
 
             case NodeType.IF:
 
                 if node.op1 is None:
                     raise ValueError
 
-                self.add_command(Command(CommandName.CMP, list(self.precompile_nodes(node.op1))))
-
-                cond_cmd = Command(
-                    Compiler.cmp_node_type_to_command_map[node.op1.node_type], [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                )
-
-                self.add_command(cond_cmd)
-
-                false_cmd = Command(CommandName.JMP, [Operand(OperandAddress.DIRECT_LOAD, 0)])
-                self.add_command(false_cmd)
+                body, end = self.cfg.new_block(), self.cfg.new_block()
+                self.branch(node.op1, body, end)
 
-                cond_cmd.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
+                ior_variable = self.ior_variable
+                self.start_block(body)
                 self.compile_node(node.op2)
+                self.start_block(end)
 
-                false_cmd.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
+                if self.ior_variable != ior_variable:
+                    self.ior_variable = None
 
             case NodeType.READ:
                 value = node.op1
@@ -589,28 +754,16 @@ class Compiler:
 
                 assert value.node_type == NodeType.VARIABLE, f"Cannot read into {value.node_type}"
 
-                operand = self.precompile_node(value)
-
-                self.add_command(
-                    Command(
-                        CommandName.IN,
-                        [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                    )
-                )
-
-                self.add_command(
-                    Command(
-                        CommandName.MOV,
-                        [Operand(OperandAddress.REGISTER, 2), Operand(OperandAddress.DIRECT_LOAD, operand.value)]
-                    )
-                )
-
-                self.add_command(
-                    Command(
-                        CommandName.ST,
-                        [Operand(OperandAddress.REGISTER, 2), Operand(OperandAddress.REGISTER, 3)]
-                    )
-                )
+                variable = ir.Var(value.value)
+                self.precompile_node(value)
+
+                self.emit(CommandName.IN, [ir.Literal(0)])
+
+                self.emit(CommandName.MOV, [ir.Reg(2), ir.AddressOf(variable)])
+
+                self.emit(CommandName.ST, [ir.Reg(2), ir.Reg(3)])
+
+                self.ior_variable = value.value
 
             case NodeType.PRINT:
                 if node.op1 is None:
@@ -619,62 +772,29 @@ class Compiler:
                 value = node.op1
 
                 if value.node_type == NodeType.STRING_CONST:
+                    self.ior_variable = None
                     operand = self.precompile_node(value)
 
-                    self.add_command(  # address
-                        Command(
-                            CommandName.MOV,
-                            [Operand(OperandAddress.REGISTER, 2),
-                             operand]
-                        )
-                    )
-
-                    loop_start = self.command_counter
-
-                    self.add_command(
-                        Command(
-                            CommandName.LD,
-                            [Operand(OperandAddress.REGISTER, 3),
-                             Operand(OperandAddress.REGISTER, 2)]
-                        )
-                    )
-
-                    self.add_command(
-                        Command(
-                            CommandName.CMP,
-                            [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0x0)]
-                        )
-                    )
-
-                    jmp = Command(
-                        CommandName.JE,
-                        [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                    )
-
-                    self.add_command(jmp)
-
-                    self.add_command(Command(CommandName.OUT, [Operand(OperandAddress.DIRECT_LOAD, 1)]))
-
-                    self.add_command(
-                        Command(
-                            CommandName.INC,
-                            [Operand(OperandAddress.REGISTER, 2)]
-                        )
-                    )
-
-                    self.add_command(
-                        Command(
-                            CommandName.JMP,
-                            [Operand(OperandAddress.DIRECT_LOAD, loop_start)]
-                        )
-                    )
-
-                    jmp.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
+                    self.emit(CommandName.MOV, [ir.Reg(2), operand])  # address
+
+                    loop, body, end = self.cfg.new_block(), self.cfg.new_block(), self.cfg.new_block()
+
+                    self.start_block(loop)
+                    self.emit(CommandName.LD, [ir.Reg(3), ir.Reg(2)])
+                    self.emit(CommandName.CMP, [ir.Reg(3), ir.Literal(0x0)])
+                    self.terminate(ir.Branch(CommandName.JE, end, body))
+
+                    self.start_block(body)
+                    self.emit(CommandName.OUT, [ir.Literal(1)])
+                    self.emit(CommandName.INC, [ir.Reg(2)])
+                    self.terminate(ir.Jump(loop))
+
+                    self.start_block(end)
 
                 elif value.node_type == NodeType.VARIABLE:
 
-                    operand = self.precompile_node(value)
-                    addr = operand.value
+                    variable = ir.Var(value.value)
+                    self.precompile_node(value)
 
                     v_name = value.value
                     if v_name not in self.variables_type:
@@ -682,191 +802,281 @@ class Compiler:
 
                     match self.variables_type[v_name]:
                         case "int":
+                            self.ior_variable = None
 
-                            self.add_command(  # address
-                                Command(
-                                    CommandName.MOV,
-                                    [Operand(OperandAddress.REGISTER, 2),
-                                     Operand(OperandAddress.DIRECT_LOAD, addr + 4)]
-                                )
-                            )
+                            self.emit(CommandName.MOV, [ir.Reg(2), ir.AddressOf(variable, 4)])  # address
 
-                            loop_start = self.command_counter
+                            loop = self.cfg.new_block()
+                            self.start_block(loop)
 
-                            self.add_command(
-                                Command(
-                                    CommandName.DEC,
-                                    [Operand(OperandAddress.REGISTER, 2)]
-                                )
-                            )
+                            self.emit(CommandName.DEC, [ir.Reg(2)])
 
                             # out H half
-                            self.add_command(
-                                Command(
-                                    CommandName.LD,
-                                    [Operand(OperandAddress.REGISTER, 3),
-                                     Operand(OperandAddress.REGISTER, 2)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.SHR,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 4)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.CMP,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0xA)]
-                                )
-                            )
-
-                            ge_jmp = Command(
-                                CommandName.JAE,
-                                [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                            )
-
-                            self.add_command(ge_jmp)
-
-                            self.add_command(
-                                Command(
-                                    CommandName.ADD1,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0x30)]
-                                )
-                            )
-
-                            jmp = Command(
-                                CommandName.JMP,
-                                [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                            )
-
-                            self.add_command(jmp)
-
-                            ge_jmp.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
-
-                            self.add_command(
-                                Command(
-                                    CommandName.ADD1,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0x57)]
-                                )
-                            )
-
-                            jmp.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
-
-                            self.add_command(Command(CommandName.OUT, [Operand(OperandAddress.DIRECT_LOAD, 1)]))
+                            self.emit(CommandName.LD, [ir.Reg(3), ir.Reg(2)])
+                            self.emit(CommandName.SHR, [ir.Reg(3), ir.Literal(4)])
+                            self.print_hex_digit()
 
                             # out L half
-                            self.add_command(
-                                Command(
-                                    CommandName.LD,
-                                    [Operand(OperandAddress.REGISTER, 3),
-                                     Operand(OperandAddress.REGISTER, 2)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.SHL,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 4)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.SHR,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 4)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.CMP,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0xA)]
-                                )
-                            )
-
-                            ge_jmp = Command(
-                                CommandName.JAE,
-                                [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                            )
-
-                            self.add_command(ge_jmp)
-
-                            self.add_command(
-                                Command(
-                                    CommandName.ADD1,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0x30)]
-                                )
-                            )
-
-                            jmp = Command(
-                                CommandName.JMP,
-                                [Operand(OperandAddress.DIRECT_LOAD, 0)]
-                            )
-
-                            self.add_command(jmp)
-
-                            ge_jmp.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
-
-                            self.add_command(
-                                Command(
-                                    CommandName.ADD1,
-                                    [Operand(OperandAddress.REGISTER, 3), Operand(OperandAddress.DIRECT_LOAD, 0x57)]
-                                )
-                            )
-
-                            jmp.operands[0] = Operand(OperandAddress.DIRECT_LOAD, self.command_counter)
-
-                            self.add_command(Command(CommandName.OUT, [Operand(OperandAddress.DIRECT_LOAD, 1)]))
-
-                            self.add_command(
-                                Command(
-                                    CommandName.DEC,
-                                    [Operand(OperandAddress.REGISTER, 1)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.CMP,
-                                    [Operand(OperandAddress.REGISTER, 2), Operand(OperandAddress.DIRECT_LOAD, addr)]
-                                )
-                            )
-
-                            self.add_command(
-                                Command(
-                                    CommandName.JNE,
-                                    [Operand(OperandAddress.DIRECT_LOAD, loop_start)]
-                                )
-                            )
+                            self.emit(CommandName.LD, [ir.Reg(3), ir.Reg(2)])
+                            self.emit(CommandName.SHL, [ir.Reg(3), ir.Literal(4)])
+                            self.emit(CommandName.SHR, [ir.Reg(3), ir.Literal(4)])
+                            self.print_hex_digit()
+
+                            self.emit(CommandName.DEC, [ir.Reg(1)])
+                            self.emit(CommandName.CMP, [ir.Reg(2), ir.AddressOf(variable)])
+
+                            end = self.cfg.new_block()
+                            self.terminate(ir.Branch(CommandName.JNE, loop, end))
+                            self.start_block(end)
 
                         case "char":
-                            self.add_command(
-                                Command(
-                                    CommandName.MOV,
-                                    [Operand(OperandAddress.REGISTER, 3),
-                                     Operand(OperandAddress.MEMORY_DIRECT, addr)]
-                                )
-                            )
+                            if not self.optimize or self.ior_variable != v_name:
+                                self.emit(CommandName.MOV, [ir.Reg(3), variable])
+                            self.ior_variable = v_name
 
-                            self.add_command(Command(CommandName.OUT, [Operand(OperandAddress.DIRECT_LOAD, 1)]))
+                            self.emit(CommandName.OUT, [ir.Literal(1)])
 
                 else:
                     pass
 
+    def print_hex_digit(self) -> None:
+        """Prints the half byte in IOR as a hex digit."""
+        self.emit(CommandName.CMP, [ir.Reg(3), ir.Literal(0xA)])
+
+        digit, letter, end = self.cfg.new_block(), self.cfg.new_block(), self.cfg.new_block()
+        self.terminate(ir.Branch(CommandName.JAE, letter, digit))
+
+        self.start_block(digit)
+        self.emit(CommandName.ADD1, [ir.Reg(3), ir.Literal(0x30)])
+        self.terminate(ir.Jump(end))
+
+        self.start_block(letter)
+        self.emit(CommandName.ADD1, [ir.Reg(3), ir.Literal(0x57)])
+
+        self.start_block(end)
+        self.emit(CommandName.OUT, [ir.Literal(1)])
+
+
+def memory_word(node: AstNode) -> int | None:
+    """Word of a literal which lies in memory, None for ints below 256 which are loaded directly and for others."""
+    match node.node_type:
+        case NodeType.INT_CONST if 256 <= node.value < 1 << 32:
+            return int(node.value)
+        case NodeType.CHAR_CONST:
+            char = str(node.value).replace(r"\0", "\0")
+            return ord(char) if len(char) == 1 else None
+    return None
+
 
-def compile_code(source: str, dest: str) -> None:
+def machine_condition(node: AstNode | None) -> bool | None:
+    """Whether the machine takes the branch of a comparison of two literals, None if it depends on variables.
+
+    None as well when the machine fails on it: CMP compares words in memory only, literals below 256 are loaded
+    directly, and JB, JA and JBE are not implemented.
+    """
+    if node is None or node.node_type not in Compiler.cmp_node_type_to_command_map:
+        return None
+    if node.op1 is None or node.op2 is None:
+        return None
+
+    left, right = memory_word(node.op1), memory_word(node.op2)
+    if left is None or right is None:
+        return None
+    return ir.branch_taken(Compiler.cmp_node_type_to_command_map[node.node_type], ir.machine_compare(left, right))
+
+
+def machine_sum(node: AstNode) -> int | None:
+    """Value the machine writes for an ADD of two int literals, None for anything else.
+
+    SUB is not folded: it writes the low byte only and reads its right operand from memory, MUL and DIV are not
+    implemented.
+    """
+    if node.node_type != NodeType.ADD or node.op1 is None or node.op2 is None:
+        return None
+    if node.op1.node_type != NodeType.INT_CONST or node.op2.node_type != NodeType.INT_CONST:
+        return None
+    if not (node.op1.value < 1 << 32 and node.op2.value < 1 << 32):
+        return None
+    return ir.machine_add(node.op1.value, node.op2.value)
+
+
+def translate(text: str, optimize: bool = True) -> tuple[Compiler, peephole.PeepholeReport]:
+    """Compiles the program.
+
+    With optimize literals are folded, the passes of the IR run and the commands go through the peephole pass.
+    """
+    ast = Parser(Lexer(program=text)).parse()
+
+    compiler = Compiler(optimize)
+    compiler.compile_node(ast)
+
+    report = peephole.PeepholeReport()
+    if optimize:
+        compiler.commands, report = peephole.optimize(compiler.commands)
+
+    return compiler, report
+
+
+def compile_source(text: str, listing: bool = False, optimize: bool = True) -> ProgramImage:
+    compiler, _ = translate(text, optimize)
+
+    return build_image(compiler.commands, compiler.memory, listing)
+
+
+def compile_code(source: str, dest: str, listing: bool = True, cache: CompileCache | None = None,
+                 optimize: bool = True) -> peephole.PeepholeReport | None:
+    """Writes the artifacts of the program, returns what the optimization removed or None on a cache hit."""
     with open(source, encoding='utf-8') as file:
         data = file.read()
 
-    compiler = Compiler()
-    compiler.compile_node(Parser(Lexer(program=data)).parse())
+    key = CompileCache.key(data, TRANSLATOR_VERSION, listing, optimize)
+    if cache is not None and cache.fetch(key, dest, listing):
+        return None
+
+    compiler, report = translate(data, optimize)
+    write_image(build_image(compiler.commands, compiler.memory, listing), dest)
+
+    if cache is not None:
+        cache.store(key, dest, listing)
 
-    write_commands(compiler.commands, compiler.memory, dest)
+    return report
+
+
+# errors of a program which can not be translated
+TRANSLATION_ERRORS = (SyntaxError, ValueError, AssertionError, KeyError, OSError)
+
+
+@dataclass(frozen=True)
+class CompileReport:
+    source: str
+    dest: str
+    seconds: float
+    code_size: int
+    memory_size: int
+    skipped: bool = False
+    error: str | None = None
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            return f"{self.source}: {self.error}"
+        timing = "skipped" if self.skipped else f"{self.seconds * 1000:.1f} ms"
+        return f"{self.source} -> {self.dest}: {timing}, code {self.code_size} B, memory {self.memory_size} B"
+
+
+def list_sources(path: str) -> list[str]:
+    """Programs of a directory or of a manifest file with a path on each line, relative to the manifest."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".aul"))
+
+    with open(path, encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+    return [os.path.join(os.path.dirname(path), line) for line in lines if line and not line.startswith("#")]
+
+
+def stamp_key(source: str, listing: bool, optimize: bool) -> str:
+    """The compile cache key of the program, kept in <dest>.stamp next to the artifacts translated from it."""
+    with open(source, encoding="utf-8") as file:
+        return CompileCache.key(file.read(), TRANSLATOR_VERSION, listing, optimize)
+
+
+def is_up_to_date(source: str, dest: str, listing: bool, optimize: bool = True) -> bool:
+    """Whether the artifacts exist and were translated from the same text, translator version and options."""
+    try:
+        with open(f"{dest}.stamp", encoding="utf-8") as file:
+            stamp = file.read()
+        key = stamp_key(source, listing, optimize)
+    except OSError:
+        return False
+    return stamp == key and all(os.path.exists(dest + suffix) for suffix in CompileCache.suffixes(listing))
+
+
+def _report(source: str, dest: str, seconds: float, skipped: bool = False) -> CompileReport:
+    return CompileReport(source, dest, seconds, os.path.getsize(dest), os.path.getsize(f"{dest}.mem"), skipped)
+
+
+def _compile_job(source: str, dest: str, listing: bool, cache_dir: str | None,
+                 optimize: bool) -> CompileReport:
+    start = time.perf_counter()
+    stamp = f"{dest}.stamp"
+    try:
+        # artifacts being rewritten are not trusted until the new stamp is written
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        key = stamp_key(source, listing, optimize)
+        compile_code(source, dest, listing, None if cache_dir is None else CompileCache(cache_dir), optimize)
+        with open(stamp, "w", encoding="utf-8") as file:
+            file.write(key)
+    except TRANSLATION_ERRORS as error:
+        return CompileReport(source, dest, time.perf_counter() - start, 0, 0, error=f"{type(error).__name__}: {error}")
+    return _report(source, dest, time.perf_counter() - start)
+
+
+def compile_batch(sources: list[str], out_dir: str, *,  # pylint: disable=too-many-arguments
+                  listing: bool = True, cache_dir: str | None = None, workers: int | None = None,
+                  force: bool = False, optimize: bool = True) -> list[CompileReport]:
+    """Translates programs in worker processes to <out_dir>/<name>.bin, skips ones whose stamp matches.
+
+    A program which can not be translated gets a report with the error, the others are translated anyway.
+    """
+    destinations = [os.path.join(out_dir, os.path.splitext(os.path.basename(source))[0] + ".bin")
+                    for source in sources]
+    if len(set(destinations)) != len(destinations):
+        raise ValueError("Programs with the same name would overwrite each other's artifacts")
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    reports: dict[str, CompileReport] = {}
+    jobs = []
+    for source, dest in zip(sources, destinations):
+        if not force and is_up_to_date(source, dest, listing, optimize):
+            reports[dest] = _report(source, dest, 0.0, skipped=True)
+        else:
+            jobs.append((source, dest))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_compile_job, source, dest, listing, cache_dir, optimize)
+                       for source, dest in jobs]
+            for future in futures:
+                report = future.result()
+                reports[report.dest] = report
+
+    return [reports[dest] for dest in destinations]
 
 
 if __name__ == "__main__":
-    assert len(sys.argv) == 3, "Wrong arguments: translator.py <code_file> <out_file>"
-    compile_code(*sys.argv[1:])
+    parser = argparse.ArgumentParser(description="Translate a program to machine code")
+    parser.add_argument("code_file", help="program, or a directory or manifest of programs with --batch")
+    parser.add_argument("out_file", help="code file, or a directory for the code files with --batch")
+    parser.add_argument("--no-listing", action="store_true", help="do not write the <out_file>.txt listing")
+    parser.add_argument("--cache-dir", help="reuse the translations kept in this directory, off by default")
+    parser.add_argument("--batch", action="store_true", help="translate many programs in worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="translate programs which did not change too")
+    parser.add_argument("--no-optimize", action="store_true",
+                        help="emit the code as is, without the peephole pass (the code of the golden tests)")
+    args = parser.parse_args()
+
+    if args.batch:
+        start_time = time.perf_counter()
+        results = compile_batch(list_sources(args.code_file), args.out_file, listing=not args.no_listing,
+                                cache_dir=args.cache_dir, workers=args.workers,
+                                force=args.force, optimize=not args.no_optimize)
+        for result in results:
+            print(result)
+
+        failed = sum(result.error is not None for result in results)
+        unchanged = sum(result.skipped for result in results)
+        print(f"Translated {len(results) - failed - unchanged}, skipped {unchanged}, failed {failed} "
+              f"in {time.perf_counter() - start_time:.2f} s")
+        if failed:
+            sys.exit(1)
+    else:
+        try:
+            optimization = compile_code(args.code_file, args.out_file, listing=not args.no_listing,
+                                        cache=None if args.cache_dir is None else CompileCache(args.cache_dir),
+                                        optimize=not args.no_optimize)
+        except TRANSLATION_ERRORS as translation_error:
+            sys.exit(f"{args.code_file}: {translation_error}")
+        if optimization is not None and not args.no_optimize:
+            print(optimization)
@@ -0,0 +1,31 @@
+import os
+
+from csa_lab3 import machine, translator
+from csa_lab3.batch import run_batch
+
+CAT_SOURCE = os.path.join(os.path.dirname(__file__), "..", "programs", "cat.aul")
+
+
+def test_run_batch():
+    with open(CAT_SOURCE, encoding="utf-8") as file:
+        image = translator.compile_source(file.read())
+    inputs = [b"", b"a", "hello", b"batch\0tail"] * 3
+    progress = []
+
+    results = list(run_batch(image, inputs, workers=2, chunksize=2, progress=progress.append))
+
+    assert results == [machine.simulate(image, data) for data in inputs]
+    assert [res.output for res in results[:4]] == [b"", b"a", b"hello", b"batch"]
+    assert progress == list(range(1, len(inputs) + 1))
+
+
+def test_reset():
+    image = translator.compile_source("{ a = 'x'; read a; print a; b = 300; c = b + 1; }")
+    cmds, mem = machine.load_program(image)
+
+    for engine in machine.Engine:
+        unit = machine.create_unit(cmds, mem, list("q"), engine)
+        first = machine.execute(unit)
+        unit.reset(mem, list("q"))
+
+        assert machine.execute(unit) == first
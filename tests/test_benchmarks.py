@@ -0,0 +1,56 @@
+import pytest
+
+from benchmarks import generator, simulator, translator
+from csa_lab3.machine import Engine
+from csa_lab3.translator import compile_source
+
+
+def test_measure():
+    image = compile_source('{ print "Hi"; }')
+
+    measurement = simulator.measure("hi", image, "", Engine.FUNCTIONAL, runs=2)
+
+    assert measurement.instructions == 16
+    assert measurement.instructions_per_second > 0
+    assert simulator.compare(simulator.report([measurement]), simulator.report([measurement]), 0.1) == []
+
+
+def test_compare():
+    def results(rate):
+        return {"measurements": [{"name": "cat", "engine": "datapath", "instructions_per_second": rate}]}
+
+    assert simulator.compare(results(95.0), results(100.0), 0.1) == []
+    assert simulator.compare(results(85.0), results(100.0), 0.1) == ["cat (datapath): 85 < 100 instructions/s"]
+
+
+def test_generated_program_compiles():
+    program = generator.generate_program(300, depth=3, string_length=5, variables=30)
+
+    assert program == generator.generate_program(300, depth=3, string_length=5, variables=30)
+    with pytest.raises(ValueError, match="outside of the instruction memory|does not fit in a byte"):
+        compile_source(program)
+
+
+def test_generated_programs_fit():
+    programs = generator.generate_programs(100, depth=3, string_length=5, variables=4)
+
+    assert len(programs) > 1
+    assert all(compile_source(program).code for program in programs)
+
+
+def test_translator_stages():
+    results = translator.run([50, 100], depth=1, string_length=3, variables=2, runs=1)
+
+    assert [r["statements"] for r in results] == [50, 100]
+    assert set(results[0]["seconds"]) == set(translator.STAGES)
+
+
+def test_superlinear_stages():
+    def result(statements, compile_seconds):
+        seconds = dict.fromkeys(translator.STAGES, statements / 1000) | {"compile": compile_seconds}
+        return {"statements": statements, "seconds": seconds}
+
+    results = [result(100, 0.1), result(400, 2.0)]
+
+    assert [stage.split(":")[0] for stage in translator.superlinear_stages(results, 2.0)] == ["compile"]
+    assert not translator.superlinear_stages(results, 10.0)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from csa_lab3 import translator
+from csa_lab3.compile_cache import CompileCache
+
+PROGRAM = 'print "hi";'
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@pytest.fixture(name="source")
+def fixture_source(tmp_path):
+    path = tmp_path / "hello.aul"
+    path.write_text(PROGRAM, encoding="utf-8")
+    return str(path)
+
+
+class TestCompileCache:
+
+    def test_hit_copies_artifacts(self, tmp_path, source, monkeypatch):
+        cache = CompileCache(str(tmp_path / "cache"))
+        first, second = str(tmp_path / "first.bin"), str(tmp_path / "second.bin")
+
+        translator.compile_code(source, first, cache=cache)
+
+        def fail(*_):
+            raise AssertionError("compiled on a cache hit")
+
+        monkeypatch.setattr(translator.Compiler, "compile_node", fail)
+        translator.compile_code(source, second, cache=cache)
+
+        for suffix in ("", ".mem", ".txt"):
+            assert read(second + suffix) == read(first + suffix)
+
+    def test_key(self):
+        key = CompileCache.key(PROGRAM, 1, True)
+
+        assert key == CompileCache.key(PROGRAM, 1, True)
+        assert key != CompileCache.key(PROGRAM + " ", 1, True)
+        assert key != CompileCache.key(PROGRAM, 2, True)
+        assert key != CompileCache.key(PROGRAM, 1, False)
+
+    def test_eviction(self, tmp_path, source):
+        cache = CompileCache(str(tmp_path / "cache"))
+        dest = str(tmp_path / "out.bin")
+
+        translator.compile_code(source, dest, cache=cache)
+        entry_size = cache.size()
+        cache.max_size = 2 * entry_size
+
+        old = CompileCache.key(PROGRAM, translator.TRANSLATOR_VERSION, True)
+        os.utime(os.path.join(cache.directory, old), (0, 0))
+
+        for text in ('print "a";', 'print "b";'):
+            with open(source, "w", encoding="utf-8") as file:
+                file.write(text)
+            translator.compile_code(source, dest, cache=cache)
+
+        assert cache.size() <= cache.max_size
+        assert not os.path.exists(os.path.join(cache.directory, old))
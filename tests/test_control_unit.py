@@ -0,0 +1,70 @@
+import pytest
+
+from csa_lab3.control_unit import ControlUnit
+from csa_lab3.data_path import DataPath
+from csa_lab3.isa import Command, CommandName, Operand, OperandAddress
+
+
+def make_commands(*commands: Command) -> list[Command]:
+    address = 0
+    for cmd in commands:
+        cmd.address = address
+        address += 1 if len(cmd.operands) == 0 else 2 + len(cmd.operands)
+    return list(commands)
+
+
+class TestControlUnit:
+
+    def test_next_addresses(self):
+        cmds = make_commands(
+            Command(CommandName.INC, [Operand(OperandAddress.REGISTER, 2)]),
+            Command(CommandName.NOP),
+            Command(CommandName.HLT),
+        )
+        control_unit = ControlUnit(DataPath([]), cmds, [])
+
+        assert control_unit.next_addresses == {0: 3, 3: 4}
+
+        control_unit.decode_command()
+        assert control_unit.command_pointer == 3
+        control_unit.decode_command()
+        assert control_unit.command_pointer == 4
+
+        with pytest.raises(StopIteration):
+            control_unit.decode_command()
+
+    def test_jump_to_zero(self):
+        cmds = make_commands(
+            Command(CommandName.NOP),
+            Command(CommandName.JMP, [Operand(OperandAddress.DIRECT_LOAD, 0)]),
+            Command(CommandName.HLT),
+        )
+        control_unit = ControlUnit(DataPath([]), cmds, [])
+
+        control_unit.decode_command()
+        control_unit.decode_command()
+        assert control_unit.command_pointer == 0
+
+    def test_invalid_jump_target(self):
+        cmds = make_commands(
+            Command(CommandName.JE, [Operand(OperandAddress.DIRECT_LOAD, 2)]),
+            Command(CommandName.HLT),
+        )
+
+        with pytest.raises(ValueError, match="Invalid jump target"):
+            ControlUnit(DataPath([]), cmds, [])
+
+    @pytest.mark.parametrize("command, message", [
+        (Command(CommandName.JMP), "JMP at 00 takes 1 operands, got 0"),
+        (Command(CommandName.MOV, [Operand(OperandAddress.REGISTER, 2)]), "MOV at 00 takes 2 operands, got 1"),
+        (Command(CommandName.HLT, [Operand(OperandAddress.REGISTER, 2)]), "HLT at 00 takes 0 operands, got 1"),
+    ])
+    def test_operand_count(self, command, message):
+        with pytest.raises(ValueError, match=message):
+            ControlUnit(DataPath([]), make_commands(command, Command(CommandName.HLT)), [])
+
+    def test_falls_off_the_end(self):
+        cmds = make_commands(Command(CommandName.NOP))
+
+        with pytest.raises(ValueError, match="falls off the end"):
+            ControlUnit(DataPath([]), cmds, [])
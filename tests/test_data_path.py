@@ -1,5 +1,6 @@
 import pytest
-from csa_lab3.data_path import Alu, Register, AluOperation
+from csa_lab3.data_path import Alu, Register, AluOperation, Memory
+from csa_lab3.isa import MemoryWord
 
 
 @pytest.fixture()
@@ -57,3 +58,30 @@ class TestAlu:
         alu.perform_operation(AluOperation.SUB)
 
         assert alu.flags_str() == "N: 1, Z: 0, V: 1, C: 0"
+
+
+class TestMemory:
+
+    def test_fill_data(self):
+        memory = Memory(Register(), Register())
+
+        memory.fill_data([MemoryWord(1), MemoryWord(2)])
+        assert memory.snapshot()[:3] == bytes([1, 2, 0])
+
+        memory.fill_data(bytes([3]))
+        assert memory.snapshot()[:3] == bytes([3, 2, 0])
+        assert len(memory.snapshot()) == memory.max_size
+        assert memory[1] == MemoryWord(2)
+
+    def test_signals(self):
+        address, data = Register(), Register()
+        memory = Memory(address, data)
+
+        address.set_value(0xFF)
+        data.set_value(0x2A)
+        memory.signal_write()
+
+        data.set_value(0)
+        memory.signal_read()
+        assert data.get_value() == 0x2A
+        assert memory.snapshot()[0xFF] == 0x2A
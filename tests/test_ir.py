@@ -0,0 +1,193 @@
+import random
+
+import pytest
+
+from csa_lab3 import ir, machine, translator
+from csa_lab3.functional_unit import FunctionalUnit
+from csa_lab3.isa import CommandName, Operand, OperandAddress
+
+
+def listing(commands):
+    return [f"{cmd.get_addr()} {cmd}" for cmd in commands]
+
+
+def out():
+    return ir.Instr(CommandName.OUT, [ir.Literal(1)])
+
+
+def graph(count):
+    cfg = ir.Cfg()
+    blocks = [cfg.new_block() for _ in range(count)]
+    for block in blocks:
+        cfg.place(block)
+    return cfg, blocks
+
+
+class TestLower:
+
+    def test_fall_through(self):
+        cfg, (entry, body, end) = graph(3)
+        entry.terminator = ir.Branch(CommandName.JE, end, body)
+        body.instrs.append(out())
+        body.terminator = ir.Jump(end)
+        end.terminator = ir.Halt()
+
+        assert listing(ir.lower(cfg)) == ["00 JE .06", "03 OUT .01", "06 HLT"]
+
+    def test_branch_to_next_block(self):
+        cfg, (entry, body, end) = graph(3)
+        entry.terminator = ir.Branch(CommandName.JNE, body, end)
+        body.instrs.append(out())
+        body.terminator = ir.Jump(entry)
+        end.terminator = ir.Halt()
+
+        assert listing(ir.lower(cfg)) == ["00 JNE .06", "03 JMP .0c", "06 OUT .01", "09 JMP .00", "0c HLT"]
+
+    def test_empty_block(self):
+        cfg, (entry, empty, end) = graph(3)
+        entry.terminator = ir.Branch(CommandName.JE, empty, end)
+        empty.terminator = ir.Jump(end)
+        end.terminator = ir.Halt()
+
+        assert listing(ir.lower(cfg)) == ["00 JE .06", "03 JMP .06", "06 HLT"]
+
+    def test_values(self):
+        compiler = translator.Compiler()
+        compiler.compile_node(translator.Parser(translator.Lexer("{ a = 'x'; print \"hi\"; }")).parse())
+        temp = compiler.cfg.new_temp()
+        block = compiler.cfg.blocks[-1]
+        block.instrs += [ir.Instr(CommandName.MOV4, [temp, ir.Var("a")]),
+                         ir.Instr(CommandName.ADD, [temp, temp, ir.Literal(ord("x"), 4)]),
+                         ir.Instr(CommandName.MOV, [ir.Reg(2), ir.AddressOf(ir.Var("a"), 4)])]
+
+        assert [str(instr) for instr in block.instrs] == ["MOV4 %0, a", "ADD %0, %0, 120@04",
+                                                          "MOV R02, &a+4"]
+        # the temporary gets a word after the string
+        assert listing(ir.lower(compiler.cfg, compiler.operand))[-4:-1] == [
+            "1c MOV4 $0b, $00", "20 ADD $0b <- $0b, $04", "25 MOV R02, .04"]
+        assert len(compiler.memory) == 15
+
+    def test_value_without_operand(self):
+        with pytest.raises(ValueError, match="No operand of a"):
+            ir.fixed_operand(ir.Var("a"))
+
+
+class TestPasses:
+
+    def test_thread_jumps(self):
+        cfg, (entry, empty, unused, end) = graph(4)
+        entry.terminator = ir.Branch(CommandName.JE, empty, end)
+        empty.terminator = ir.Jump(end)
+        unused.instrs.append(out())
+        unused.terminator = ir.Jump(end)
+        end.terminator = ir.Halt()
+
+        applied = ir.PassManager(ir.DEFAULT_PASSES).run(cfg)
+
+        assert applied == ["thread_jumps", "remove_unreachable_blocks"]
+        assert cfg.blocks == [entry, end]
+        assert str(cfg) == "L0:\n    branch JE L3, L3\nL3:\n    halt"
+
+    def test_rotate_loops(self):
+        cfg, (entry, head, body, end) = graph(4)
+        entry.terminator = ir.Jump(head)
+        head.instrs.append(ir.Instr(CommandName.CMP, [ir.Literal(ord("a"), 4)] * 2))
+        head.terminator = ir.Branch(CommandName.JNE, body, end)
+        body.instrs.append(out())
+        body.terminator = ir.Jump(head)
+        end.terminator = ir.Halt()
+
+        assert ir.rotate_loops(cfg)
+        assert not ir.rotate_loops(cfg)
+        assert cfg.blocks == [entry, body, head, end]
+        assert listing(ir.lower(cfg)) == ["00 JMP .06", "03 OUT .01", "06 CMP $04, $04", "0a JNE .03", "0d HLT"]
+
+    def test_rotate_nested_loops(self):
+        cfg, (entry, outer, inner, inner_body, outer_body, end) = graph(6)
+        entry.terminator = ir.Jump(outer)
+        outer.terminator = ir.Branch(CommandName.JNE, inner, end)
+        inner.terminator = ir.Branch(CommandName.JNE, inner_body, outer_body)
+        inner_body.instrs.append(out())
+        inner_body.terminator = ir.Jump(inner)
+        outer_body.instrs.append(out())
+        outer_body.terminator = ir.Jump(outer)
+        end.terminator = ir.Halt()
+
+        assert ir.rotate_loops(cfg)
+        assert cfg.blocks == [entry, inner_body, inner, outer_body, outer, end]
+        assert not ir.rotate_loops(cfg)
+
+    def test_rotate_loop_exit_by_jump(self):
+        cfg, (head, body, end) = graph(3)
+        head.terminator = ir.Branch(CommandName.JE, end, body)
+        body.instrs.append(out())
+        body.terminator = ir.Jump(head)
+        end.terminator = ir.Halt()
+
+        assert not ir.rotate_loops(cfg)
+
+    def test_nested_loops(self):
+        program = """{
+            a = 'a'; b = 'b'; d = '\\0';
+            read a;
+            while (a != d) {
+                read b;
+                while (b != d) { print b; read b; }
+                read a;
+                if (a == b) { print a; }
+            }
+        }"""
+        plain, _ = translator.translate(program, optimize=False)
+        optimized, _ = translator.translate(program)
+
+        assert len(optimized.cfg.blocks) < len(plain.cfg.blocks)
+        for data in ("", "x", "xyz", "ab\0cd"):
+            expected = machine.simulate(translator.compile_source(program, optimize=False), data)
+            result = machine.simulate(translator.compile_source(program), data)
+            assert result.output == expected.output
+            assert result.instructions < expected.instructions or not data
+
+
+WORDS = [(0xFF, 1), (128, 128), (0x1FF, 0x1FF), (0xFFFFFFFF, 1), (300, 511), (511, 300), (0x1000000, 0xFFFFFF),
+         (200, 10), (10, 200), (0x12345678, 0x12345678)]
+WORDS += [(random.Random(i).getrandbits(32), random.Random(-i).getrandbits(32)) for i in range(10)]
+
+
+def run_command(name, left, right, engine):
+    """Runs the command over the words at 0 and 4, returns the result and the data memory."""
+    cfg, (block,) = graph(1)
+    words = {ir.Var("left"): 0, ir.Var("right"): 4, ir.Var("sum"): 8}
+    operands = [ir.Var("left"), ir.Var("right")]
+    if name == CommandName.ADD:
+        operands.insert(0, ir.Var("sum"))
+    block.instrs.append(ir.Instr(name, operands))
+    block.terminator = ir.Halt()
+
+    memory = left.to_bytes(4, "little") + right.to_bytes(4, "little") + bytes(4)
+    commands = ir.lower(cfg, lambda value: Operand(OperandAddress.MEMORY_DIRECT, words[value]))
+    unit = machine.create_unit(commands, memory, [], engine)
+    result = machine.execute(unit)
+    return result, unit.memory if isinstance(unit, FunctionalUnit) else unit.data_path.data_memory.memory
+
+
+class TestMachineArithmetic:
+
+    @pytest.mark.parametrize("engine", list(machine.Engine))
+    @pytest.mark.parametrize("left, right", WORDS)
+    def test_add(self, left, right, engine):
+        _, memory = run_command(CommandName.ADD, left, right, engine)
+
+        assert ir.machine_add(left, right) == int.from_bytes(memory[8:12], "little")
+
+    @pytest.mark.parametrize("engine", list(machine.Engine))
+    @pytest.mark.parametrize("left, right", WORDS)
+    def test_compare(self, left, right, engine):
+        result, _ = run_command(CommandName.CMP, left, right, engine)
+
+        flags = ir.machine_compare(left, right)
+        assert flags == {"N": result.flags["N"], "Z": result.flags["Z"]}
+        for condition, (flag, value) in ir.BRANCH_FLAGS.items():
+            assert ir.branch_taken(condition, flags) == (result.flags[flag] == value)
+
+    def test_not_implemented_branch(self):
+        assert ir.branch_taken(CommandName.JB, ir.machine_compare(1, 2)) is None
@@ -0,0 +1,80 @@
+import pytest
+
+from csa_lab3.isa import (Command, CommandName, MemoryWord, Operand, OperandAddress, OPERAND_ADDRESSES_BY_BYTE,
+                          decode_commands, encode_commands, write_commands)
+
+PROGRAM = [
+    Command(CommandName.MOV4,
+            [Operand(OperandAddress.MEMORY_DIRECT, 0x10), Operand(OperandAddress.DIRECT_LOAD, 0x01)], 0x00),
+    Command(CommandName.JE, [Operand(OperandAddress.DIRECT_LOAD, 0x00)], 0x05),
+    Command(CommandName.HLT, [], 0x09),
+]
+
+
+class TestDecodeCommands:
+
+    def test_decode(self):
+        data = bytes([
+            0x00, 0x21, 0b01100000, 0x10, 0x01,  # MOV4 $10, .01
+            0x05, 0x12, 0b10000000, 0x00,  # JE .00
+            0x09, 0x01,  # HLT
+        ])
+
+        assert decode_commands(data) == PROGRAM
+
+    def test_operand_addresses(self):
+        assert OPERAND_ADDRESSES_BY_BYTE[0b11100100] == (
+            OperandAddress.REGISTER, OperandAddress.DIRECT_LOAD, OperandAddress.MEMORY_DIRECT
+        )
+        # operands end at the first group without addressing
+        assert OPERAND_ADDRESSES_BY_BYTE[0b01001100] == (OperandAddress.MEMORY_DIRECT,)
+
+    @pytest.mark.parametrize("data, message", [
+        (bytes([0x00, 0x01, 0x02, 0x30]), "Unknown command 0x30 at byte offset 3"),
+        (bytes([0x00, 0x01, 0x02]), "Truncated command at byte offset 2"),
+        (bytes([0x00, 0x11]), "Missing operand addressing of JMP at byte offset 2"),
+        (bytes([0x00, 0x01, 0x02, 0x20, 0b11100000, 0x02]), "Truncated operands of MOV at byte offset 2"),
+    ])
+    def test_malformed(self, data, message):
+        with pytest.raises(ValueError, match=message):
+            decode_commands(data)
+
+
+class TestEncodeCommands:
+
+    def test_round_trip(self):
+        assert decode_commands(encode_commands(PROGRAM)) == PROGRAM
+
+    def test_matches_binary_strings(self):
+        bits = "".join(repr(cmd) for cmd in PROGRAM)
+        expected = bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+
+        assert encode_commands(PROGRAM) == expected
+
+    @pytest.mark.parametrize("command, message", [
+        (Command(CommandName.HLT, [], 0x100), r"Address 0x100 of HLT is outside of the instruction memory"),
+        (Command(CommandName.JMP, [Operand(OperandAddress.DIRECT_LOAD, 0x104)], 0xfe),
+         r"Operand 0x104 of fe \| JMP .* does not fit in a byte"),
+        (Command(CommandName.MOV4, [Operand(OperandAddress.MEMORY_DIRECT, 0x100),
+                                    Operand(OperandAddress.DIRECT_LOAD, 0x01)], 0x00),
+         r"Operand 0x100 of 00 \| MOV4 .* does not fit in a byte"),
+    ])
+    def test_value_too_wide(self, command, message):
+        with pytest.raises(ValueError, match=message):
+            encode_commands(PROGRAM + [command])
+
+    def test_write_commands(self, tmp_path):
+        target = str(tmp_path / "out.bin")
+
+        write_commands(PROGRAM, [MemoryWord(0x41), MemoryWord(0x00)], target)
+
+        with open(target, "rb") as file:
+            assert decode_commands(file.read()) == PROGRAM
+        with open(f"{target}.mem", "rb") as file:
+            assert file.read() == b"A\x00"
+        assert not (tmp_path / "out.bin.txt").exists()
+
+        write_commands(PROGRAM, [], target, listing=True)
+
+        with open(f"{target}.txt", encoding="utf-8") as file:
+            assert file.readline().startswith(f"{PROGRAM[0].get_addr()} | {repr(PROGRAM[0]).ljust(48)} | MOV4")
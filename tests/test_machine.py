@@ -2,33 +2,134 @@ import contextlib
 import io
 import logging
 import os
-import tempfile
 
 import pytest
 
 from csa_lab3 import translator, machine
 
 
+def run_golden(golden, engine: machine.Engine) -> tuple[str, str]:
+    image = translator.compile_source(golden["source_code"], listing=True, optimize=False)
+    input_buffer = list(golden["stdin"]) + ["\0"]
+
+    with contextlib.redirect_stdout(io.StringIO()) as stdout:
+        print("="*25)
+        machine.simulation(image, input_buffer, engine)
+
+    return image.listing, stdout.getvalue()
+
+
 @pytest.mark.golden_test("golden/*.yml")
 def test_bar(golden, caplog):
     caplog.set_level(logging.DEBUG)
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        source_file = os.path.join(tmpdir, "source.aul")
-        target_file = os.path.join(tmpdir, "source.bin")
-        input_buffer = list(golden["stdin"]) + ["\0"]
+    human_readable, stdout = run_golden(golden, machine.Engine.DATAPATH)
+
+    assert human_readable.rstrip("\n") == golden.out["out_code_readable"]
+    assert stdout.rstrip("\n") == golden.out["stdout"]
+    assert caplog.text.rstrip("\n") == golden.out["out_log"]
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_functional_engine(golden, caplog):
+    caplog.set_level(logging.DEBUG)
+
+    _, stdout = run_golden(golden, machine.Engine.FUNCTIONAL)
+
+    assert stdout.rstrip("\n") == golden.out["stdout"]
+    assert caplog.text.rstrip("\n") == golden.out["out_log"]
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_cross_check(golden):
+    image = translator.compile_source(golden["source_code"], optimize=False)
+    result = machine.cross_check(image, list(golden["stdin"]) + ["\0"])
+
+    assert result.divergence is None
+    assert result.halt_reason == machine.HaltReason.HALT
+
+
+def test_cross_check_divergence(monkeypatch):
+    def broken_inc(self, register):
+        self.registers[register] = (self.registers[register] + 2) % 256
+
+    monkeypatch.setattr(machine.FunctionalUnit, "_inc", broken_inc)
+
+    result = machine.cross_check(translator.compile_source('{ print "Hi"; }'), ["\0"])
+    divergence = result.divergence
+
+    assert result.instructions == 5
+    assert divergence is not None and divergence.step == 6
+    assert str(divergence.command) == "INC R02"
+    assert "R0: 01 != 02" in divergence.differences
+
+
+def test_cross_check_same_error():
+    # a < b is a JB, which is not implemented by the machine
+    program = translator.compile_source("{ a = 1; b = 2; if (a < b) { print a; } }", optimize=False)
+
+    result = machine.cross_check(program, ["\0"])
+
+    assert result.divergence is None
+    assert result.halt_reason == machine.HaltReason.ERROR
+    assert result.error is not None and result.error.startswith("NotImplementedError")
+
+
+def test_cross_check_one_engine_fails(monkeypatch):
+    def failing_inc(self, register):
+        raise ValueError("broken")
+
+    monkeypatch.setattr(machine.FunctionalUnit, "_inc", failing_inc)
+
+    result = machine.cross_check(translator.compile_source('{ print "Hi"; }'), ["\0"])
+
+    assert result.divergence is not None and result.divergence.step == 6
+    assert result.divergence.differences == ["stopped: running != error (ValueError: broken)"]
+
+
+def test_cross_check_limit():
+    program = translator.compile_source("{ a = 'a'; b = 'b'; while (a != b) { print a; } }")
+
+    result = machine.cross_check(program, ["\0"], limit=100)
+
+    assert result == machine.CheckResult(100, None, machine.HaltReason.LIMIT)
+
+
+def test_simulation_from_file(tmp_path):
+    source_file = tmp_path / "source.aul"
+    source_file.write_text('{ print "Hi"; }', encoding="utf-8")
+    target_file = os.path.join(tmp_path, "source.bin")
+
+    translator.compile_code(str(source_file), target_file)
+
+    assert machine.load_program(target_file) == machine.load_program(translator.compile_source('{ print "Hi"; }'))
+
+
+class TestSimulate:
+
+    def test_result(self, caplog):
+        caplog.set_level(logging.DEBUG)
+        image = translator.compile_source("{ c = 'a'; read c; print c; print \"i\"; }")
+
+        result = machine.simulate(image, b"h")
+        functional = machine.simulate(image, io.StringIO("h"), machine.Engine.FUNCTIONAL)
+
+        assert result.output == b"hi"
+        assert result.halt_reason == machine.HaltReason.HALT
+        assert result.registers["IOR"] == 0 and result.flags["Z"] == 1
+        assert result.ticks > result.instructions
+        assert functional == result
+        assert caplog.text == ""
 
-        with open(source_file, "w", encoding="utf-8") as file:
-            file.write(golden["source_code"])
+    def test_limit(self):
+        result = machine.simulate(translator.compile_source('{ print "Hi"; }'), limit=5)
 
-        with contextlib.redirect_stdout(io.StringIO()) as stdout:
-            translator.compile_code(source_file, target_file)
-            print("="*25)
-            machine.simulation(target_file, input_buffer)
+        assert result.halt_reason == machine.HaltReason.LIMIT
+        assert result.instructions == 5
+        assert result.output == b"H"
 
-        with open(f"{target_file}.txt", encoding="utf-8") as file:
-            human_readable = file.read()
+    def test_error(self):
+        result = machine.simulate(translator.compile_source("{ a = 1; b = 2; if (a < b) { print a; } }"))
 
-        assert human_readable.rstrip("\n") == golden.out["out_code_readable"]
-        assert stdout.getvalue().rstrip("\n") == golden.out["stdout"]
-        assert caplog.text.rstrip("\n") == golden.out["out_log"]
+        assert result.halt_reason == machine.HaltReason.ERROR
+        assert result.error == "NotImplementedError: No info about execution CommandName.JB"
@@ -0,0 +1,154 @@
+import pytest
+
+from csa_lab3 import machine, translator
+from csa_lab3.isa import Command, CommandName, Operand, OperandAddress, command_length
+from csa_lab3.peephole import command_ticks, optimize
+
+
+def direct(value):
+    return Operand(OperandAddress.DIRECT_LOAD, value)
+
+
+def memory(value):
+    return Operand(OperandAddress.MEMORY_DIRECT, value)
+
+
+def register(value):
+    return Operand(OperandAddress.REGISTER, value)
+
+
+def program(*commands):
+    address = 0
+    for cmd in commands:
+        cmd.address = address
+        address += command_length(cmd)
+    return list(commands)
+
+
+def listing(commands):
+    return [f"{cmd.get_addr()} {cmd}" for cmd in commands]
+
+
+class TestRules:
+
+    def test_jump_to_next(self):
+        commands, report = optimize(program(
+            Command(CommandName.JMP, [direct(3)]),
+            Command(CommandName.NOP),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 NOP", "01 HLT"]
+        assert report.instructions == 1 and report.ticks.total() == 0
+
+    def test_inverted_jump(self):
+        commands, _ = optimize(program(
+            Command(CommandName.CMP, [register(3), direct(0)]),
+            Command(CommandName.JE, [direct(0x0a)]),
+            Command(CommandName.JMP, [direct(0x0d)]),
+            Command(CommandName.OUT, [direct(1)]),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 CMP R03, .00", "04 JNE .0a", "07 OUT .01", "0a HLT"]
+
+    def test_jump_over_jump_target_is_kept(self):
+        commands, report = optimize(program(
+            Command(CommandName.JMP, [direct(0x06)]),
+            Command(CommandName.JE, [direct(0x09)]),
+            Command(CommandName.JMP, [direct(0x00)]),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 JMP .06", "03 JE .09", "06 JMP .00", "09 HLT"]
+        assert report.instructions == 0
+
+    def test_reload(self):
+        commands, report = optimize(program(
+            Command(CommandName.MOV, [register(2), direct(16)]),
+            Command(CommandName.MOV, [register(2), direct(16)]),
+            Command(CommandName.MOV, [register(3), memory(4)]),
+            Command(CommandName.MOV, [register(3), memory(4)]),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 MOV R02, .10", "04 MOV R03, $04", "08 HLT"]
+        assert report.instructions == 2
+        assert report.ticks == command_ticks(commands[0]) + command_ticks(commands[1])
+
+    def test_copy_back(self):
+        commands, report = optimize(program(
+            Command(CommandName.MOV4, [memory(0), memory(4)]),
+            Command(CommandName.MOV4, [memory(4), memory(0)]),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 MOV4 $00, $04", "04 HLT"]
+        assert report.ticks.total() == 49
+
+    def test_copy_of_equal_words(self):
+        commands, report = optimize(program(
+            Command(CommandName.MOV4, [memory(0), memory(4)]),
+            Command(CommandName.MOV, [memory(4), memory(0)]),
+            Command(CommandName.MOV, [memory(8), memory(12)]),
+            Command(CommandName.MOV4, [memory(12), memory(8)]),
+            Command(CommandName.MOV4, [memory(16), memory(18)]),
+            Command(CommandName.MOV4, [memory(18), memory(16)]),
+            Command(CommandName.HLT),
+        ))
+
+        # a MOV copies one byte, and the copy from 18 to 16 overlaps itself
+        assert listing(commands) == ["00 MOV4 $00, $04", "04 MOV $08, $0c", "08 MOV4 $0c, $08",
+                                     "0c MOV4 $10, $12", "10 MOV4 $12, $10", "14 HLT"]
+        assert report.instructions == 1
+
+    def test_self_copy(self):
+        commands, report = optimize(program(
+            Command(CommandName.JMP, [direct(7)]),
+            Command(CommandName.MOV4, [memory(0), direct(1)]),
+            Command(CommandName.MOV4, [memory(4), memory(4)]),
+            Command(CommandName.MOV, [memory(4), memory(4)]),
+            Command(CommandName.JMP, [direct(3)]),
+        ))
+
+        assert listing(commands) == ["00 JMP .07", "03 MOV4 $00, .01", "07 JMP .03"]
+        assert report.instructions == 2
+
+    def test_overwritten_copy(self):
+        commands, report = optimize(program(
+            Command(CommandName.MOV4, [memory(0), memory(4)]),
+            Command(CommandName.MOV4, [memory(0), direct(7)]),
+            Command(CommandName.MOV4, [memory(8), memory(4)]),
+            Command(CommandName.MOV4, [memory(8), memory(10)]),
+            Command(CommandName.HLT),
+        ))
+
+        assert listing(commands) == ["00 MOV4 $00, .07", "04 MOV4 $08, $04", "08 MOV4 $08, $0a", "0c HLT"]
+        assert report.instructions == 1
+
+
+@pytest.mark.parametrize("source", [
+    "{ a = 5; b = 7; a = b; b = a; a = a; print a; print b; }",
+    "{ c = 'x'; d = c; c = d; c = c; print c; print d; }",
+])
+def test_copies_same_output(source):
+    plain = translator.compile_source(source, optimize=False)
+    optimized = translator.compile_source(source)
+
+    assert machine.simulate(optimized).output == machine.simulate(plain).output
+    assert len(optimized.code) < len(plain.code)
+
+
+@pytest.mark.golden_test("golden/*.yml")
+def test_same_output(golden):
+    plain = translator.compile_source(golden["source_code"], optimize=False)
+    optimized = translator.compile_source(golden["source_code"])
+
+    expected = machine.simulate(plain, golden["stdin"])
+    result = machine.simulate(optimized, golden["stdin"])
+
+    assert result.output == expected.output
+    assert result.halt_reason == machine.HaltReason.HALT
+    assert result.instructions <= expected.instructions
+    assert len(optimized.code) <= len(plain.code)
+    assert machine.cross_check(optimized, list(golden["stdin"]) + ["\0"]).divergence is None
@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+import pytest
+
+from csa_lab3 import translator, machine
+from csa_lab3.isa import CommandName
+from csa_lab3.profiler import Loop, ProfilingSink, find_loops
+from csa_lab3.trace import Tracer, TraceLevel
+
+PROGRAM = """{
+    i = 0;
+    n = 3;
+    while (n != i) {
+        print "ab";
+        i = i + 1;
+    }
+}"""
+
+
+@pytest.fixture(name="profile")
+def fixture_profile():
+    sink = ProfilingSink()
+    result = machine.simulate(translator.compile_source(PROGRAM), engine=machine.Engine.DATAPATH,
+                              tracer=Tracer(TraceLevel.INSTRUCTION, [sink]))
+    assert result.output == b"ababab"
+    return sink.profile(), result
+
+
+def test_totals(profile):
+    profile, result = profile
+    assert sum(entry.count for entry in profile.by_address.values()) == result.instructions
+    assert sum(entry.count for entry in profile.by_name().values()) == result.instructions
+    # HLT is not an instruction, its ticks are not attributed
+    assert profile.total_ticks() <= result.ticks
+    assert CommandName.HLT not in profile.by_name()
+
+
+def test_engines_agree(profile):
+    profile, _ = profile
+    sink = ProfilingSink()
+    machine.simulate(translator.compile_source(PROGRAM), engine=machine.Engine.FUNCTIONAL,
+                     tracer=Tracer(TraceLevel.INSTRUCTION, [sink]))
+    functional = sink.profile()
+
+    assert {address: (entry.count, entry.total_ticks()) for address, entry in profile.by_address.items()} == \
+        {address: (entry.count, entry.total_ticks()) for address, entry in functional.by_address.items()}
+
+
+def test_loops(profile):
+    profile, _ = profile
+    loops = profile.by_loop()
+
+    assert len(loops) == 2  # the while and the print loop inside it
+    outer, inner = profile.loops
+    assert inner.start in outer and inner.end in outer
+    assert loops[outer].count == 3  # the loop starts at the body, the condition is at its end
+    assert loops[outer].total_ticks() > loops[inner].total_ticks()
+
+
+def test_find_loops():
+    cmds, _ = machine.load_program(translator.compile_source(PROGRAM))
+    loops = find_loops(cmds)
+
+    assert len(loops) == 2
+    assert loops[0].start <= loops[1].start and loops[1].end <= loops[0].end
+    assert str(Loop(0x1c, 0x47)) == "loop 1c-47"
+
+
+def test_collapsed_stacks(profile):
+    profile, _ = profile
+    lines = profile.collapsed_stacks().splitlines()
+
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profile.total_ticks()
+    assert all(line.startswith("program;") for line in lines)
+    assert any(line.count(";loop ") == 2 for line in lines)
+
+
+def test_report_with_listing(profile):
+    profile, _ = profile
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_file = os.path.join(tmpdir, "loop.aul")
+        target_file = os.path.join(tmpdir, "loop.bin")
+        with open(source_file, "w", encoding="utf-8") as file:
+            file.write(PROGRAM)
+        translator.compile_code(source_file, target_file)
+        with open(target_file + ".txt", encoding="utf-8") as file:
+            listing = file.read()
+
+    report = profile.report(listing)
+    assert "Hot loops:" in report
+    annotated = report.split("Listing:\n", 1)[1].splitlines()[1:]
+    assert len(annotated) == len(listing.splitlines())
+    assert all(line.endswith(listing_line) for line, listing_line in zip(annotated, listing.splitlines()))
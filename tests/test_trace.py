@@ -0,0 +1,152 @@
+import contextlib
+import io
+import logging
+import os
+import tempfile
+
+import pytest
+
+from csa_lab3 import translator, machine
+from csa_lab3.binary_trace import BinaryTraceReader, BinaryTraceSink
+from csa_lab3.data_path import TickCounter
+from csa_lab3.isa import read_commands
+from csa_lab3.trace import LoggingSink, Tracer, TraceLevel, TraceSink
+
+
+class RecordingSink(TraceSink):
+    def __init__(self):
+        self.instructions = []
+        self.micro_ops = []
+        self.summaries = []
+
+    def instruction(self, counter, unit):
+        self.instructions.append((counter, str(unit.commands_memory[unit.command_pointer])))
+
+    def micro_op(self, description):
+        self.micro_ops.append(description)
+
+    def summary(self, output, instructions):
+        self.summaries.append((output, instructions))
+
+
+@pytest.fixture()
+def hello_bin():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_file = os.path.join(tmpdir, "hello.aul")
+        target_file = os.path.join(tmpdir, "hello.bin")
+
+        with open(source_file, "w", encoding="utf-8") as file:
+            file.write('{ print "Hi"; }')
+
+        translator.compile_code(source_file, target_file)
+        yield target_file
+
+
+def simulate(binary_file, level, engine=machine.Engine.DATAPATH):
+    sink = RecordingSink()
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.simulation(binary_file, ["\0"], engine, Tracer(level, [sink]))
+    return sink
+
+
+class TestTracer:
+
+    def test_off(self, hello_bin, caplog):
+        caplog.set_level(logging.DEBUG)
+        sink = simulate(hello_bin, TraceLevel.OFF)
+
+        assert not sink.instructions and not sink.micro_ops and not sink.summaries
+        assert caplog.text == ""
+
+    def test_summary(self, hello_bin):
+        sink = simulate(hello_bin, TraceLevel.SUMMARY)
+
+        assert not sink.instructions
+        assert sink.summaries == [("Hi", 16)]
+
+    def test_instruction(self, hello_bin):
+        sink = simulate(hello_bin, TraceLevel.INSTRUCTION, machine.Engine.FUNCTIONAL)
+
+        assert len(sink.instructions) == 16
+        assert sink.instructions[0] == (1, "LD R03, R02")
+        assert not sink.micro_ops
+
+    def test_micro_op(self, hello_bin):
+        sink = simulate(hello_bin, TraceLevel.MICRO_OP)
+
+        assert len(sink.instructions) == 16
+        assert sink.micro_ops[:3] == ["bus AC -> R0: 00", "bus R0 -> DP: 00", "read $00: 48"]
+
+    def test_level_names(self):
+        for level in TraceLevel:
+            assert TraceLevel.from_name(level.option_name()) == level
+
+
+class TestBinaryTrace:
+
+    def test_expand(self, hello_bin, caplog):
+        caplog.set_level(logging.DEBUG)
+        trace_file = f"{hello_bin}.trace"
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracer = Tracer(TraceLevel.INSTRUCTION, [LoggingSink(), BinaryTraceSink(trace_file, interval=4)])
+            machine.simulation(hello_bin, ["\0"], machine.Engine.DATAPATH, tracer)
+
+        lines = list(BinaryTraceReader(trace_file).expand(read_commands(hello_bin)))
+        assert lines == [line[len("DEBUG:"):] for line in caplog.text.splitlines() if line.startswith("DEBUG:")]
+
+    def test_seek(self, hello_bin):
+        trace_file = f"{hello_bin}.trace"
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracer = Tracer(TraceLevel.INSTRUCTION, [BinaryTraceSink(trace_file, interval=4)])
+            machine.simulation(hello_bin, ["\0"], machine.Engine.FUNCTIONAL, tracer)
+
+        reader = BinaryTraceReader(trace_file)
+        assert [step for step, _ in reader.index] == [0, 4, 8, 12, 16]
+
+        states = [(s.step, s.pc, s.format_state(), bytes(s.memory)) for s in reader]
+        for step, pc, state, memory in states:
+            found = reader.seek(step)
+            assert (found.step, found.pc, found.format_state(), bytes(found.memory)) == (step, pc, state, memory)
+
+        with pytest.raises(IndexError):
+            reader.seek(len(states) + 1)
+
+    def test_ticks(self, hello_bin):
+        trace_file = f"{hello_bin}.trace"
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracer = Tracer(TraceLevel.INSTRUCTION, [BinaryTraceSink(trace_file, interval=4)])
+            result = machine.simulation(hello_bin, ["\0"], machine.Engine.DATAPATH, tracer)
+
+        reader = BinaryTraceReader(trace_file)
+        steps = [(state.step_ticks.copy(), state.ticks.copy()) for state in reader]
+
+        total = TickCounter()
+        for step_ticks, ticks in steps:
+            total = total + step_ticks
+            assert ticks == total
+        assert total == result.tick_counter and total.total() == result.ticks
+        assert reader.seek(6).ticks == steps[5][1]
+
+
+def test_logging_ticks(hello_bin, caplog):
+    caplog.set_level(logging.DEBUG)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.simulation(hello_bin, ["\0"], machine.Engine.FUNCTIONAL, Tracer(sinks=[LoggingSink(ticks=True)]))
+
+    # the first command is MOV R02, .00 and the second one LD R03, R02
+    assert caplog.records[0].getMessage().endswith("| ticks: 1 (bus 1, read 0, write 0, alu 0)")
+    assert caplog.records[1].getMessage().endswith("| ticks: 3 (bus 2, read 1, write 0, alu 0)")
+
+
+def test_logging_level(hello_bin, caplog):
+    caplog.set_level(logging.DEBUG)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.simulation(hello_bin, ["\0"], machine.Engine.DATAPATH,
+                           Tracer(TraceLevel.MICRO_OP, [LoggingSink(level=TraceLevel.SUMMARY)]))
+
+    assert [record.getMessage() for record in caplog.records] == ["Out buffer: Hi"]
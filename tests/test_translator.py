@@ -0,0 +1,248 @@
+import os
+import time
+
+import pytest
+
+from csa_lab3 import machine, translator
+from csa_lab3.isa import CommandName, OperandAddress
+from csa_lab3.translator import (Compiler, LanguagePart, Lexer, NodeType, Parser, compile_batch, compile_source,
+                                 is_up_to_date, list_sources, machine_condition, machine_sum, translate)
+
+CAT_SOURCE = os.path.join(os.path.dirname(__file__), "..", "programs", "cat.aul")
+
+
+def tokenize(program):
+    lexer = Lexer(program)
+    tokens = []
+    while True:
+        token, value = lexer.parse_token()
+        tokens.append((token, value, lexer.line, lexer.column))
+        if token == LanguagePart.EOF:
+            return tokens
+
+
+class TestLexer:
+
+    def test_tokens(self):
+        assert [token[:2] for token in tokenize('while (a_b<=10) { print "hi\nthere"; c = \'x\'; }')] == [
+            (LanguagePart.WHILE, None),
+            (LanguagePart.L_PAR, None),
+            (LanguagePart.VARIABLE, "a_b"),
+            (LanguagePart.LESS_OR_EQUALS, None),
+            (LanguagePart.NUMBER, 10),
+            (LanguagePart.R_PAR, None),
+            (LanguagePart.L_BRA, None),
+            (LanguagePart.PRINT_CALL, None),
+            (LanguagePart.STRING, "hi\nthere"),
+            (LanguagePart.SEMICOLON, None),
+            (LanguagePart.VARIABLE, "c"),
+            (LanguagePart.ASSIGN, None),
+            (LanguagePart.CHAR, "x"),
+            (LanguagePart.SEMICOLON, None),
+            (LanguagePart.R_BRA, None),
+            (LanguagePart.EOF, None),
+        ]
+
+    def test_digits_end_identifiers(self):
+        assert [token[:2] for token in tokenize("a1")] == [
+            (LanguagePart.VARIABLE, "a"), (LanguagePart.NUMBER, 1), (LanguagePart.EOF, None)
+        ]
+
+    def test_positions(self):
+        tokens = tokenize('a = "x\ny";\n  read b;')
+
+        assert [token[2:] for token in tokens] == [(1, 1), (1, 3), (1, 5), (2, 3), (3, 3), (3, 8), (3, 9), (3, 10)]
+
+    @pytest.mark.parametrize("program, message", [
+        ('print "hello;', "Unterminated literal at 1:7"),
+        ("a = 'b;", "Unterminated literal at 1:5"),
+        ("a = 1;\nb = #;", "Unexpected token: # at 2:5"),
+    ])
+    def test_errors(self, program, message):
+        with pytest.raises(SyntaxError, match=message):
+            tokenize(program)
+
+
+class TestParser:
+
+    def test_error(self):
+        with pytest.raises(SyntaxError, match='Parser error: "=" expected at 1:5'):
+            Parser(Lexer("{ a b; }")).parse()
+
+    def test_flat_sequence(self):
+        program = Parser(Lexer("{ a = 1; { b = 2; c = 3; } ; }")).parse()
+
+        block = program.op1
+        assert block.node_type == NodeType.SEQUENCE
+        assert [child.node_type for child in block.children] == [
+            NodeType.EXPRESSION, NodeType.SEQUENCE, NodeType.EMPTY
+        ]
+        assert len(block.children[1].children) == 2
+
+    def test_long_sequence(self):
+        statements = 20000
+        compiler = Compiler()
+
+        compiler.compile_node(Parser(Lexer("{" + "a = a + 1;" * statements + "}")).parse())
+
+        assert len(compiler.commands) == statements + 1
+        assert compiler.commands[-1].name == CommandName.HLT
+
+
+def statement(program):
+    (node,) = Parser(Lexer(program)).parse().op1.children
+    return node
+
+
+def outcome(program, optimize):
+    try:
+        result = machine.simulate(compile_source(program, optimize=optimize), "")
+    except ValueError as error:
+        return str(error)
+    return result.output, result.halt_reason
+
+
+class TestFoldConstants:
+
+    @pytest.mark.parametrize("expression, value", [
+        ("2 + 3", 5), ("128 + 128", 0), ("200 + 300", 0x1F4), ("65535 + 1", 0xFF00),
+    ])
+    def test_sum(self, expression, value):
+        assert machine_sum(statement(f"{{ a = {expression}; }}").op1.op2) == value
+
+    @pytest.mark.parametrize("expression", ["10 - 3", "2 * 3", "4 / 2", "a + 1", "1 + 'a'"])
+    def test_not_folded(self, expression):
+        assert machine_sum(statement(f"{{ a = {expression}; }}").op1.op2) is None
+
+    @pytest.mark.parametrize("condition, taken", [
+        ("300 >= 511", True), ("'a' == 'b'", False), ("'b' != 'a'", True), ("65536 == 65536", True),
+        ("1 == 1", None), ("'a' < 'b'", None), ("a == 'b'", None),
+    ])
+    def test_condition(self, condition, taken):
+        assert machine_condition(statement(f"{{ if ({condition}) {{ }} }}").op1) == taken
+
+    @pytest.mark.parametrize("program", [
+        '{ if (300 >= 511) { print "x"; } print "e"; }',
+        "{ a = 0; a = 128 + 128; print a; }",
+        "{ a = 0; a = 10 - 3; print a; }",
+        "{ a = 128 + 128; print a; }",
+        "{ a = 'x'; if ('a' == 'b') { a = 1; } print a; }",
+        "{ if ('a' == 'b') { print z; } }",
+        "{ while ('a' == 'b') { print \"n\"; } if (1 == 1) { print \"y\"; } }",
+    ])
+    def test_same_output(self, program):
+        assert outcome(program, optimize=True) == outcome(program, optimize=False)
+
+    def test_optimize_switch(self):
+        program = "{ if ('a' == 'b') { print \"x\"; } print \"y\"; }"
+
+        plain, _ = translate(program, optimize=False)
+        optimized, _ = translate(program)
+
+        assert plain.commands[0].name == CommandName.CMP
+        assert optimized.commands[0].name == CommandName.MOV
+        assert len(optimized.commands) < len(plain.commands)
+
+
+def ior_loads(program, optimize=True):
+    compiler, _ = translate(program, optimize)
+    return sum(cmd.name == CommandName.MOV and cmd.operands[0].address == OperandAddress.REGISTER
+               and cmd.operands[0].value == 3 for cmd in compiler.commands)
+
+
+class TestIorCache:
+
+    def test_read_then_print(self):
+        with open(CAT_SOURCE, encoding="utf-8") as file:
+            program = file.read()
+
+        assert ior_loads(program, optimize=False) == 1
+        assert ior_loads(program) == 0
+
+    @pytest.mark.parametrize("program, loads", [
+        ("{ a = 'x'; read a; a = 'z'; print a; }", 1),
+        ("{ a = 'x'; read a; print \"-\"; print a; }", 1),
+        ("{ a = 'x'; b = 'y'; read a; if (a == b) { read b; } print a; }", 1),
+        ("{ a = 'x'; b = 'y'; read a; if (a == b) { print a; } print a; }", 0),
+        ("{ a = 'x'; d = 'q'; read a; while (a != d) { print a; a = 'q'; } print a; }", 2),
+        ("{ a = 'x'; d = '\\0'; read a; while (a != d) { while (a != d) { print a; read a; } } print a; }", 0),
+        # loaded once before the loop, the first print in the body and the one after the loop do not load it
+        ("{ a = 'x'; n = 'n'; z = '\\0'; print \"s\"; while (n != z) { print a; read n; print a; } print a; }", 2),
+    ])
+    def test_same_output(self, program, loads):
+        assert ior_loads(program) == loads
+
+        for data in ("", "q", "yz", "abc"):
+            expected = machine.simulate(compile_source(program, optimize=False), data)
+            assert machine.simulate(compile_source(program), data).output == expected.output
+
+    @pytest.mark.parametrize("loop, entry, head", [
+        ("while (n != z) { print a; read n; print a; }", None, "a"),
+        ("while (n != z) { print a; read n; print a; }", "n", "a"),
+        ("while (n != z) { print b; read n; print a; print b; }", None, "b"),
+        # the same loads without the load before the loop
+        ("while (n != z) { read n; print a; }", None, None),
+        ("while (n != z) { read n; print a; }", "a", "a"),
+        ("while (n != z) { print a; read n; }", None, None),
+    ])
+    def test_loop_head(self, loop, entry, head):
+        types = dict.fromkeys("abnz", "char")
+
+        assert Compiler(optimize=True).loop_ior(statement(f"{{ {loop} }}"), entry, types) == head
+
+
+class TestCompileBatch:
+
+    def test_batch(self, tmp_path):
+        sources = tmp_path / "src"
+        sources.mkdir()
+        for name in ("one", "two", "three"):
+            (sources / f"{name}.aul").write_text(f'{{ print "{name}"; }}', encoding="utf-8")
+        (tmp_path / "manifest.txt").write_text("# programs\nsrc/one.aul\n\nsrc/two.aul\n", encoding="utf-8")
+        out = tmp_path / "out"
+
+        reports = compile_batch(list_sources(str(sources)), str(out), workers=2)
+
+        assert [os.path.basename(report.dest) for report in reports] == ["one.bin", "three.bin", "two.bin"]
+        assert not any(report.skipped for report in reports)
+        with open(out / "two.bin", "rb") as file:
+            assert file.read() == compile_source('{ print "two"; }').code
+
+        (sources / "two.aul").write_text('{ print "2"; }', encoding="utf-8")
+        os.utime(sources / "one.aul", (time.time() + 10, time.time() + 10))
+        reports = compile_batch(list_sources(str(tmp_path / "manifest.txt")), str(out), workers=2)
+
+        assert [report.skipped for report in reports] == [True, False]
+        assert reports[0].code_size == (out / "one.bin").stat().st_size
+
+    def test_options_and_version(self, tmp_path, monkeypatch):
+        source = tmp_path / "one.aul"
+        source.write_text('{ print "one"; }', encoding="utf-8")
+        out = tmp_path / "out"
+
+        def skipped(**options):
+            return [report.skipped for report in compile_batch([str(source)], str(out), workers=1, **options)]
+
+        assert skipped() == [False]
+        assert skipped() == [True]
+        assert skipped(optimize=False) == [False]
+        assert skipped(optimize=False) == [True]
+        assert skipped(optimize=False, listing=False) == [False]
+        assert is_up_to_date(str(source), str(out / "one.bin"), listing=False, optimize=False)
+        monkeypatch.setattr(translator, "TRANSLATOR_VERSION", translator.TRANSLATOR_VERSION + 1)
+        assert not is_up_to_date(str(source), str(out / "one.bin"), listing=False, optimize=False)
+
+    def test_same_names(self, tmp_path):
+        with pytest.raises(ValueError, match="same name"):
+            compile_batch(["a/x.aul", "b/x.aul"], str(tmp_path))
+
+    def test_failed_program(self, tmp_path):
+        for name, program in (("a", '{ print "a"; }'), ("b", "{ a b; }"), ("c", '{ print "c"; }')):
+            (tmp_path / f"{name}.aul").write_text(program, encoding="utf-8")
+        out = tmp_path / "out"
+
+        reports = compile_batch(list_sources(str(tmp_path)), str(out), workers=2)
+
+        assert [report.error is None for report in reports] == [True, False, True]
+        assert str(reports[1]).startswith(f"{tmp_path / 'b.aul'}: SyntaxError: Parser error")
+        assert (out / "c.bin").exists() and not (out / "b.bin").exists()